@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Dict
 
 
 class Settings(BaseSettings):
@@ -16,6 +17,84 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     anthropic_api_key: str = ""
 
+    # LLM calls
+    use_llm: bool = False  # call the agents' models instead of simulating reasoning
+    openai_base_url: str = "https://api.openai.com/v1"
+    anthropic_base_url: str = "https://api.anthropic.com/v1"
+    llm_http2: bool = True
+    llm_max_connections: int = 100  # per provider and API key
+    llm_max_keepalive_connections: int = 100
+    llm_keepalive_expiry_seconds: float = 30.0
+    llm_timeout_seconds: float = 60.0
+
+    # Provider rate limits per model and API key, 0 for unknown until the
+    # provider's rate limit headers report them
+    llm_requests_per_minute: float = 0.0
+    llm_tokens_per_minute: float = 0.0
+    # Per-model {"requests_per_minute": ..., "tokens_per_minute": ...}
+    llm_rate_limits: Dict[str, Dict[str, float]] = {}
+    llm_rate_limit_retries: int = 2  # 429s retried once the budget resets
+
+    # LLM response cache
+    llm_cache_size: int = 10000  # 0 disables the cache
+    llm_cache_path: str = "llm_cache.sqlite3"  # empty keeps it in memory only
+    llm_cache_ttl_seconds: float = 86400.0  # 0 never expires
+    llm_cache_model_ttls: Dict[str, float] = {}  # per-model overrides of the TTL
+
+    # Execution
+    execution_mode: str = "inline"  # "inline" or "process"
+    worker_processes: int = 2
+    task_workers: int = 4
+    task_queue_size: int = 100
+    max_tool_concurrency: int = 4
+    subtask_timeout_seconds: float = 300.0
+    tool_timeout_seconds: float = 60.0
+    # Stream agent output to clients as it is produced, at most one
+    # agent_output event per subtask per interval
+    stream_agent_output: bool = True
+    agent_output_interval_seconds: float = 0.25
+    checkpoint_dir: str = ""  # empty keeps checkpoints in memory only
+    # Seconds the next queued task waits for a slot before a running task
+    # of a lower priority class is preempted (0 disables preemption)
+    preemption_after_seconds: float = 2.0
+
+    # Fair share of task slots between users
+    user_task_cap: int = 0  # tasks a user may run at once, 0 for no cap
+    user_task_caps: Dict[str, int] = {}  # per-user overrides of the cap
+    user_weights: Dict[str, float] = {}  # relative slot share, 1 by default
+
+    # Agent assignment: "first", "least_loaded", "power_of_two" or
+    # "weighted_round_robin"
+    assignment_policy: str = "least_loaded"
+    # Match subtasks to agents by similarity to their role, goal and
+    # backstory instead of role keywords
+    semantic_role_matching: bool = True
+    role_match_min_similarity: float = 0.15
+
+    # Failure recovery
+    max_subtask_retries: int = 2  # retries per agent before reassigning
+    task_retry_budget: int = 6  # retries and reassignments per task
+    retry_backoff_seconds: float = 0.2
+    retry_backoff_max_seconds: float = 5.0
+    mock_tool_failure_rate: float = 0.0  # chance a mock tool call fails
+
+    # Fan-out over collections (e.g. every open PR)
+    fan_out_shard_size: int = 5  # items per shard subtask
+    fan_out_parallelism: int = 10  # shard subtasks running at once
+
+    # Decomposition plan cache
+    plan_cache_size: int = 256  # 0 disables the cache
+    plan_cache_ttl_seconds: float = 3600.0
+
+    # Identical concurrent idempotent tool calls and deterministic model
+    # calls share one execution
+    coalesce_calls: bool = True
+
+    # Hedging of idempotent tool calls
+    hedge_tool_calls: bool = True
+    hedge_percentile: float = 95.0  # latency percentile that triggers a second attempt
+    hedge_min_samples: int = 20  # latencies observed before hedging starts
+
     # CORS
     frontend_url: str = "http://localhost:3000"
 
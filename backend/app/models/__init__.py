@@ -1,6 +1,6 @@
 from .agent import Agent, AgentCreate, AgentUpdate, AvatarStyle
 from .workflow import Workflow, WorkflowCreate, WorkflowUpdate, WorkflowNode, WorkflowEdge
-from .task import Task, TaskCreate, Subtask, SubtaskStatus, TaskStatus
+from .task import Task, TaskCreate, TaskBatchCreate, Subtask, SubtaskStatus, TaskStatus
 from .approval import ApprovalRequest, ApprovalStatus
 
 __all__ = [
@@ -15,6 +15,7 @@ __all__ = [
     "WorkflowEdge",
     "Task",
     "TaskCreate",
+    "TaskBatchCreate",
     "Subtask",
     "SubtaskStatus",
     "TaskStatus",
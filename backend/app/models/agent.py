@@ -18,6 +18,8 @@ class AgentBase(BaseModel):
     llm_model: str = "gpt-4"
     is_manager: bool = False
     avatar_style: AvatarStyle = Field(default_factory=AvatarStyle)
+    # Share of turns under weighted round robin; by default it follows latency
+    weight: Optional[float] = Field(None, gt=0)
 
 
 class AgentCreate(AgentBase):
@@ -32,6 +34,7 @@ class AgentUpdate(BaseModel):
     tools: Optional[List[str]] = None
     llm_model: Optional[str] = None
     avatar_style: Optional[AvatarStyle] = None
+    weight: Optional[float] = Field(None, gt=0)
 
 
 class Agent(AgentBase):
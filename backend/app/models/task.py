@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional
+from datetime import datetime, timezone
 from enum import Enum
 
 
@@ -10,6 +10,13 @@ class TaskStatus(str, Enum):
     PAUSED = "paused"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class TaskPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
 
 
 class SubtaskStatus(str, Enum):
@@ -28,6 +35,9 @@ class Subtask(BaseModel):
     status: SubtaskStatus = SubtaskStatus.PENDING
     output: Optional[str] = None
     cost_incurred: float = 0.0
+    attempts: int = 0
+    depends_on: List[str] = Field(default_factory=list)
+    parent_id: Optional[str] = None  # fan-out subtask this is a shard of
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
@@ -35,10 +45,42 @@ class Subtask(BaseModel):
 class TaskBase(BaseModel):
     workflow_id: str
     description: str = Field(..., min_length=1, max_length=1000)
+    priority: TaskPriority = TaskPriority.NORMAL
+
+
+def _in_future(deadline: Optional[datetime]) -> Optional[datetime]:
+    """Reject a deadline that has already passed (naive times are UTC)."""
+    if deadline is not None:
+        aware = deadline if deadline.tzinfo else deadline.replace(tzinfo=timezone.utc)
+        if aware <= datetime.now(timezone.utc):
+            raise ValueError("deadline must be in the future")
+    return deadline
+
+
+Deadline = Annotated[Optional[datetime], AfterValidator(_in_future)]
 
 
 class TaskCreate(TaskBase):
-    pass
+    # Seconds the task may run before its remaining work times out
+    timeout_seconds: Optional[float] = Field(None, gt=0)
+    # Time by which the task must finish; the earlier of this and the timeout wins
+    deadline: Deadline = None
+
+
+class TaskBatchCreate(BaseModel):
+    workflow_id: str
+    descriptions: List[Annotated[str, Field(min_length=1, max_length=1000)]] = Field(
+        ..., min_length=1, max_length=500
+    )
+    priority: TaskPriority = TaskPriority.NORMAL
+    # Seconds each task may run before its remaining work times out
+    timeout_seconds: Optional[float] = Field(None, gt=0)
+    deadline: Deadline = None
+
+
+class TaskBatchResponse(BaseModel):
+    # Ids of the created tasks, in the order of the descriptions
+    task_ids: List[str]
 
 
 class Task(TaskBase):
@@ -48,8 +90,16 @@ class Task(TaskBase):
     current_agent_id: Optional[str] = None
     progress: float = 0.0
     total_cost: float = 0.0
+    # Model calls made for the task, and those answered from the response
+    # cache with the cost they would have added to total_cost
+    llm_calls: int = 0
+    llm_cache_hits: int = 0
+    saved_cost: float = 0.0
+    retries: int = 0  # recovery attempts spent from the task's retry budget
     created_at: datetime
     completed_at: Optional[datetime] = None
+    deadline: Optional[datetime] = None
+    error: Optional[str] = None  # why the task failed, if it did
     subtasks: List[Subtask] = Field(default_factory=list)
 
     class Config:
@@ -58,4 +108,7 @@ class Task(TaskBase):
 
 class TaskReassign(BaseModel):
     new_agent_id: str
+    # Carry the tool results gathered so far over to the new agent
     transfer_context: bool = True
+    # Subtask to move; defaults to the one the current agent is working on
+    subtask_id: Optional[str] = None
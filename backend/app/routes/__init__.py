@@ -2,5 +2,6 @@ from .agents import router as agents_router
 from .workflows import router as workflows_router
 from .tasks import router as tasks_router
 from .approvals import router as approvals_router
+from .metrics import router as metrics_router
 
-__all__ = ["agents_router", "workflows_router", "tasks_router", "approvals_router"]
+__all__ = ["agents_router", "workflows_router", "tasks_router", "approvals_router", "metrics_router"]
@@ -4,6 +4,9 @@ from datetime import datetime
 import uuid
 
 from ..models.agent import Agent, AgentCreate, AgentUpdate, get_llm_cost
+from ..services.agent_index import get_agent_index
+from ..services.plan_cache import get_plan_cache
+from ..services.role_matcher import get_role_matcher
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
@@ -37,6 +40,8 @@ async def create_agent(agent_data: AgentCreate, user_id: str = "demo_user"):
         **agent_data.model_dump()
     )
     agents_db[agent_id] = agent
+    get_agent_index().add(agent.model_dump(), agent.user_id)
+    get_role_matcher().add(agent.model_dump(), agent.user_id)
     return agent
 
 
@@ -55,6 +60,9 @@ async def update_agent(agent_id: str, agent_data: AgentUpdate):
 
     updated = existing.model_copy(update=update_data)
     agents_db[agent_id] = updated
+    get_agent_index().add(updated.model_dump(), updated.user_id)
+    get_role_matcher().add(updated.model_dump(), updated.user_id)
+    get_plan_cache().invalidate_agent(agent_id)
     return updated
 
 
@@ -64,4 +72,7 @@ async def delete_agent(agent_id: str):
     if agent_id not in agents_db:
         raise HTTPException(status_code=404, detail="Agent not found")
     del agents_db[agent_id]
+    get_agent_index().remove(agent_id)
+    get_role_matcher().remove(agent_id)
+    get_plan_cache().invalidate_agent(agent_id)
     return {"message": "Agent deleted"}
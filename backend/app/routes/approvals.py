@@ -3,6 +3,9 @@ from typing import List
 from datetime import datetime
 
 from ..models.approval import ApprovalRequest, ApprovalStatus
+from ..services.approval_gate import get_approval_gate
+from ..services.orchestrator import emit_event
+from ..services.task_queue import get_execution_engine
 
 router = APIRouter(prefix="/approvals", tags=["approvals"])
 
@@ -47,7 +50,8 @@ async def approve_request(approval_id: str):
     )
     approvals_db[approval_id] = approval
 
-    # TODO: Signal the waiting agent to continue
+    # Signal the waiting agent to continue
+    await _signal_waiting_agent(approval, approved=True)
 
     return approval
 
@@ -71,11 +75,19 @@ async def deny_request(approval_id: str):
     )
     approvals_db[approval_id] = approval
 
-    # TODO: Signal the waiting agent to stop or try alternative
+    # Signal the waiting agent to stop
+    await _signal_waiting_agent(approval, approved=False)
 
     return approval
 
 
+async def _signal_waiting_agent(approval: ApprovalRequest, approved: bool):
+    """Wake the subtask parked on this request, wherever it runs."""
+    if not get_approval_gate().resolve(approval.id, approved):
+        get_execution_engine().resolve_approval(approval.task_id, approval.id, approved)
+    await emit_event("approval_resolved", {"id": approval.id, "status": approval.status.value})
+
+
 # Helper function for services to create approval requests
 def create_approval_request(
     task_id: str,
@@ -0,0 +1,48 @@
+from fastapi import APIRouter
+
+from ..services.task_queue import get_execution_engine
+from ..services.hedging import get_tool_hedger
+from ..services.plan_cache import get_plan_cache
+from ..services.resource_locks import get_lock_manager
+from ..services.llm_client import get_llm_client
+from ..services.single_flight import get_single_flight
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/queue")
+async def get_queue_metrics():
+    """Task queue depth, wait times and worker utilisation."""
+    return get_execution_engine().stats()
+
+
+@router.get("/hedging")
+async def get_hedging_metrics():
+    """Per tool action: hedge rate, hedge win rate and latency percentiles."""
+    return get_tool_hedger().stats()
+
+
+@router.get("/plan-cache")
+async def get_plan_cache_metrics():
+    """Decomposition plan cache hit, miss and eviction counts."""
+    return get_plan_cache().stats()
+
+
+@router.get("/locks")
+async def get_lock_metrics():
+    """Resource lock table size, contended resources and deadlocks detected."""
+    locks = get_lock_manager()
+    return {**locks.stats(), "contention": locks.contention()}
+
+
+@router.get("/llm")
+async def get_llm_metrics():
+    """Model calls per provider and key: requests, connections opened, tokens and latency."""
+    return get_llm_client().stats()
+
+
+@router.get("/coalescing")
+async def get_coalescing_metrics():
+    """Per tool and model: calls, calls that joined one in flight, and the coalescing ratio."""
+    single_flight = get_single_flight()
+    return single_flight.stats() if single_flight is not None else {}
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 import uuid
 
-from ..models.task import Task, TaskCreate, TaskStatus, TaskReassign
-from ..services.orchestrator import execute_task
+from ..models.task import (
+    Task, TaskCreate, TaskBatchCreate, TaskBatchResponse, TaskStatus, TaskReassign,
+    SubtaskStatus
+)
+from ..services.task_queue import QueueFullError, get_execution_engine
+from ..services.orchestrator import DEMO_AGENTS, plan_tasks, discard_plans
+from .workflows import workflows_db
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
@@ -27,29 +32,90 @@ async def get_task(task_id: str):
 
 
 @router.post("", response_model=Task)
-async def create_task(
-    task_data: TaskCreate,
-    background_tasks: BackgroundTasks,
-    user_id: str = "demo_user"
-):
+async def create_task(task_data: TaskCreate, user_id: str = "demo_user"):
     """Create and start a new task."""
     task_id = f"task_{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow()
     task = Task(
         id=task_id,
         user_id=user_id,
         workflow_id=task_data.workflow_id,
         description=task_data.description,
+        priority=task_data.priority,
         status=TaskStatus.PENDING,
-        created_at=datetime.utcnow()
+        created_at=now,
+        deadline=_deadline(now, task_data.deadline, task_data.timeout_seconds)
     )
     tasks_db[task_id] = task
 
-    # Start task execution in background
-    background_tasks.add_task(execute_task, task_id, tasks_db)
+    # Queue task for execution
+    try:
+        get_execution_engine().submit(
+            task_id, tasks_db, workflows_db,
+            priority=task.priority, deadline=task.deadline
+        )
+    except QueueFullError as e:
+        del tasks_db[task_id]
+        raise _queue_full(e)
 
     return task
 
 
+@router.post("/batch", response_model=TaskBatchResponse)
+async def create_tasks_batch(batch: TaskBatchCreate, user_id: str = "demo_user"):
+    """
+    Create and start many tasks at once.
+
+    Tasks of the same kind are decomposed once and share the plan. All
+    tasks are queued together, or none are if the queue has no room.
+    """
+    now = datetime.utcnow()
+    deadline = _deadline(now, batch.deadline, batch.timeout_seconds)
+    task_ids = []
+    for description in batch.descriptions:
+        task_id = f"task_{uuid.uuid4().hex[:8]}"
+        tasks_db[task_id] = Task(
+            id=task_id,
+            user_id=user_id,
+            workflow_id=batch.workflow_id,
+            description=description,
+            priority=batch.priority,
+            status=TaskStatus.PENDING,
+            created_at=now,
+            deadline=deadline
+        )
+        task_ids.append(task_id)
+
+    try:
+        await plan_tasks(task_ids, tasks_db, workflows_db)
+    except ValueError as e:
+        _discard_batch(task_ids)
+        raise HTTPException(status_code=400, detail=f"Could not plan the tasks: {e}")
+    except BaseException:
+        _discard_batch(task_ids)
+        raise
+
+    # Queue all tasks for execution
+    try:
+        get_execution_engine().submit_many(
+            [(task_id, (tasks_db, workflows_db)) for task_id in task_ids],
+            priority=batch.priority,
+            deadline=deadline
+        )
+    except QueueFullError as e:
+        _discard_batch(task_ids)
+        raise _queue_full(e)
+
+    return TaskBatchResponse(task_ids=task_ids)
+
+
+def _discard_batch(task_ids: List[str]):
+    """Forget the tasks of a batch that could not be started."""
+    discard_plans(task_ids)
+    for task_id in task_ids:
+        del tasks_db[task_id]
+
+
 @router.put("/{task_id}/pause", response_model=Task)
 async def pause_task(task_id: str):
     """Pause a running task."""
@@ -62,11 +128,12 @@ async def pause_task(task_id: str):
 
     task = task.model_copy(update={"status": TaskStatus.PAUSED})
     tasks_db[task_id] = task
+    get_execution_engine().update_task(task_id, {"status": TaskStatus.PAUSED})
     return task
 
 
 @router.put("/{task_id}/resume", response_model=Task)
-async def resume_task(task_id: str, background_tasks: BackgroundTasks):
+async def resume_task(task_id: str):
     """Resume a paused task."""
     if task_id not in tasks_db:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -75,24 +142,75 @@ async def resume_task(task_id: str, background_tasks: BackgroundTasks):
     if task.status != TaskStatus.PAUSED:
         raise HTTPException(status_code=400, detail="Task is not paused")
 
+    # Queue task to continue execution
+    try:
+        get_execution_engine().submit(
+            task_id, tasks_db, workflows_db,
+            priority=task.priority, deadline=task.deadline
+        )
+    except QueueFullError as e:
+        raise _queue_full(e)
+
     task = task.model_copy(update={"status": TaskStatus.RUNNING})
     tasks_db[task_id] = task
+    return task
+
+
+@router.put("/{task_id}/cancel", response_model=Task)
+async def cancel_task(task_id: str):
+    """Cancel a task, stopping its in-flight subtasks immediately."""
+    if task_id not in tasks_db:
+        raise HTTPException(status_code=404, detail="Task not found")
 
-    # Continue execution in background
-    background_tasks.add_task(execute_task, task_id, tasks_db)
+    task = tasks_db[task_id]
+    if task.status not in [TaskStatus.PENDING, TaskStatus.RUNNING, TaskStatus.PAUSED]:
+        raise HTTPException(status_code=400, detail="Task is already finished")
 
+    paused = task.status == TaskStatus.PAUSED
+    task = task.model_copy(update={
+        "status": TaskStatus.CANCELLED,
+        "completed_at": datetime.utcnow()
+    })
+    tasks_db[task_id] = task
+    get_execution_engine().update_task(task_id, {
+        "status": TaskStatus.CANCELLED,
+        "completed_at": task.completed_at
+    })
+    if paused:
+        # Nothing runs a paused task to clean up after it; queued and
+        # running tasks drop their checkpoints when the engine gets to them
+        discard_plans([task_id])
     return task
 
 
 @router.put("/{task_id}/reassign", response_model=Task)
 async def reassign_task(task_id: str, reassign_data: TaskReassign):
-    """Reassign the current subtask to a different agent."""
+    """
+    Reassign the current subtask to a different agent.
+
+    A running subtask moves over at its next safe point between tool
+    calls, taking the tool results gathered so far along if
+    `transfer_context` is set.
+    """
     if task_id not in tasks_db:
         raise HTTPException(status_code=404, detail="Task not found")
 
     task = tasks_db[task_id]
     if task.status not in [TaskStatus.RUNNING, TaskStatus.PAUSED]:
         raise HTTPException(status_code=400, detail="Task is not in a reassignable state")
+    if not any(a["id"] == reassign_data.new_agent_id for a in DEMO_AGENTS):
+        raise HTTPException(status_code=404, detail="Agent not found")
+
+    subtask = _subtask_to_reassign(task, reassign_data.subtask_id)
+    if subtask is None:
+        raise HTTPException(status_code=400, detail="No unfinished subtask to reassign")
+
+    get_execution_engine().reassign_subtask(
+        task_id,
+        subtask.id,
+        reassign_data.new_agent_id,
+        reassign_data.transfer_context
+    )
 
     # Update current agent
     task = task.model_copy(update={
@@ -100,6 +218,50 @@ async def reassign_task(task_id: str, reassign_data: TaskReassign):
     })
     tasks_db[task_id] = task
 
-    # TODO: Handle context transfer logic
-
     return task
+
+
+def _subtask_to_reassign(task: Task, subtask_id: Optional[str]):
+    """
+    The requested unfinished subtask, or else the one the current agent
+    is working on, any one in progress, or the next one to run.
+    """
+    unfinished = [
+        s for s in task.subtasks
+        if s.status not in (SubtaskStatus.COMPLETED, SubtaskStatus.FAILED)
+    ]
+    if subtask_id:
+        return next((s for s in unfinished if s.id == subtask_id), None)
+    # A fan-out subtask's work happens in its shards
+    parents = {s.parent_id for s in task.subtasks if s.parent_id}
+    in_progress = [
+        s for s in unfinished
+        if s.status != SubtaskStatus.PENDING and s.id not in parents
+    ]
+    return next(
+        (s for s in in_progress if s.agent_id == task.current_agent_id),
+        next(iter(in_progress or unfinished), None)
+    )
+
+
+def _deadline(
+    now: datetime,
+    deadline: Optional[datetime],
+    timeout_seconds: Optional[float]
+) -> Optional[datetime]:
+    """The earlier of an absolute deadline and a timeout, as naive UTC."""
+    if deadline and deadline.tzinfo:
+        deadline = deadline.astimezone(timezone.utc).replace(tzinfo=None)
+    if timeout_seconds:
+        timeout = now + timedelta(seconds=timeout_seconds)
+        deadline = min(deadline, timeout) if deadline else timeout
+    return deadline
+
+
+def _queue_full(error: QueueFullError) -> HTTPException:
+    """429 response telling the client when to retry."""
+    return HTTPException(
+        status_code=429,
+        detail="Task queue is full",
+        headers={"Retry-After": str(error.retry_after)}
+    )
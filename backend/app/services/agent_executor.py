@@ -2,12 +2,24 @@
 Agent executor service - runs individual agents with their tools.
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 import asyncio
 from datetime import datetime
+import time
 import uuid
 
+from ..models.agent import get_llm_cost
 from .mock_tools import execute_mock_tool
+from .intent_matcher import TOOL_INTENTS
+from .llm_client import LLMClient, LLMError, provider_for
+
+
+# Tools that must wait for other tools of the same run to finish first.
+# Tools without hints are independent and may run concurrently.
+DEFAULT_TOOL_DEPENDENCIES: Dict[str, List[str]] = {
+    # Notifications report on the work the other tools did
+    "slack": ["github", "jira", "code_linter", "security_scanner"],
+}
 
 
 class AgentExecutor:
@@ -22,7 +34,12 @@ class AgentExecutor:
         tools: List[str],
         llm_model: str,
         openai_api_key: Optional[str] = None,
-        anthropic_api_key: Optional[str] = None
+        anthropic_api_key: Optional[str] = None,
+        concurrent_tools: bool = True,
+        max_tool_concurrency: int = 4,
+        tool_dependencies: Optional[Dict[str, List[str]]] = None,
+        tool_timeout: Optional[float] = None,
+        llm_client: Optional[LLMClient] = None
     ):
         self.agent_id = agent_id
         self.agent_name = agent_name
@@ -32,16 +49,60 @@ class AgentExecutor:
         self.llm_model = llm_model
         self.openai_api_key = openai_api_key
         self.anthropic_api_key = anthropic_api_key
+        self.concurrent_tools = concurrent_tools
+        self.max_tool_concurrency = max(1, max_tool_concurrency)
+        self.tool_dependencies = (
+            tool_dependencies if tool_dependencies is not None else DEFAULT_TOOL_DEPENDENCIES
+        )
+        self.tool_timeout = tool_timeout
+        # Reasons with the agent's model through this client; without one
+        # the reasoning step is simulated
+        self.llm_client = llm_client
         self.execution_log: List[Dict[str, Any]] = []
+        self._completed_tools: List[str] = []
+        self._reused_results: Dict[tuple, Dict[str, Any]] = {}
+        self._reused_tools: List[str] = []
+        self._llm_cost = 0.0
+        self._llm_calls = 0
+        self._llm_cache_hits = 0
+        self._saved_cost = 0.0
+        self._deadline: Optional[float] = None
+        self._handoff_requested = False
+        # Receives output chunks while execute_stream() runs
+        self._stream: Optional[asyncio.Queue] = None
+        self._streamed_output = False
+
+    def request_handoff(self):
+        """
+        Stop at the next safe point so another agent can take over.
+
+        Tool calls in flight finish; no new ones start. Unless every tool
+        already ran, execute() then returns a "reassigned" failure whose
+        "tool_results" hold the successful calls, for the next agent to
+        pick up through its handoff context.
+        """
+        self._handoff_requested = True
 
     async def execute(
         self,
         task_description: str,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        items: Optional[List[Any]] = None
     ) -> Dict[str, Any]:
         """
         Execute a task and return the result.
 
+        Args:
+            task_description: What the agent should do
+            context: Handoff context from upstream agents; successful tool
+                results under "transferred_work" (from an agent this work
+                was reassigned from) are reused instead of calling again
+            timeout: Seconds the whole execution may take; tool calls are
+                bounded by this and by tool_timeout
+            items: Collection items to work through one after the other,
+                running the tools for each
+
         Returns:
             {
                 "success": bool,
@@ -50,112 +111,392 @@ class AgentExecutor:
                 "flags": List[Dict],
                 "tools_used": List[str],
                 "cost_incurred": float,
-                "execution_time_seconds": float
+                "cost_saved": float,  # model calls answered from the cache
+                "llm_calls": int,
+                "llm_cache_hits": int,
+                "execution_time_seconds": float,
+                "error": {  # only on failure
+                    "type": str,  # "timeout", "tool_failure", "exception" or "reassigned"
+                    "message": str,
+                    "tools": List[str]  # tools that timed out or failed
+                },
+                "tool_results": List[Dict]  # only when reassigned
             }
         """
         start_time = datetime.utcnow()
-        tools_used = []
-        flags = []
-        total_cost = 0.0
+        self._completed_tools = []
+        self._reused_tools = []
+        self._llm_cost = 0.0
+        self._llm_calls = 0
+        self._llm_cache_hits = 0
+        self._saved_cost = 0.0
+        transferred = (context or {}).get("transferred_work") or {}
+        self._reused_results = {
+            (tr["tool"], _item_label(tr["item"]) if "item" in tr else None): tr
+            for tr in transferred.get("tool_results", [])
+        }
+        self._deadline = (
+            asyncio.get_running_loop().time() + timeout if timeout is not None else None
+        )
 
         try:
             # Log start
             self._log("execution_start", {
                 "task": task_description,
-                "context": context
+                "context": context,
+                "items": len(items) if items is not None else None
             })
 
-            # For MVP, we simulate LLM reasoning and tool usage
-            # In production, this would use LangChain with actual LLM calls
+            return await asyncio.wait_for(
+                self._execute(task_description, start_time, items, context),
+                timeout
+            )
 
+        except asyncio.TimeoutError:
+            return self._failure_result(
+                "timeout",
+                f"Execution timed out after {timeout:.1f}s",
+                start_time
+            )
+
+        except Exception as e:
+            return self._failure_result("exception", str(e), start_time)
+
+    async def execute_stream(
+        self,
+        task_description: str,
+        context: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        items: Optional[List[Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute a task like execute(), yielding its output as it is produced.
+
+        Yields {"type": "reasoning", "text": str} chunks as the model's
+        tokens arrive, {"type": "output", "text": str} chunks as each tool
+        call finishes, and last {"type": "result", "result": Dict}. The
+        result is execute()'s, except that "output" is None: the output is
+        the output chunks in order, for the consumer to assemble.
+        """
+        chunks: asyncio.Queue = asyncio.Queue()
+        self._stream = chunks
+        self._streamed_output = False
+        run = asyncio.ensure_future(self.execute(task_description, context, timeout, items))
+        run.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            yield {"type": "result", "result": run.result()}
+        finally:
+            run.cancel()
+            self._stream = None
+
+    async def _execute(
+        self,
+        task_description: str,
+        start_time: datetime,
+        items: Optional[List[Any]] = None,
+        context: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Reason about the task, run the tools (per item, if given) and build the result."""
+        # Tool usage is simulated; reasoning uses the agent's model if
+        # there is an LLM client
+        if self.llm_client:
+            plan = await self._reason(task_description, context)
+            self._log("reasoning", {"step": "Analyzing task requirements", "plan": plan})
+        else:
             # Simulate "thinking" about the task
             await asyncio.sleep(0.5)
             self._log("reasoning", {"step": "Analyzing task requirements"})
 
-            # Determine which tools to use based on task
-            tools_to_use = self._select_tools(task_description)
+        # Determine which tools to use based on task
+        tools_to_use = self._select_tools(task_description)
 
-            # Execute each tool
+        # Execute the tools, independent ones concurrently
+        tool_names = [t for t in tools_to_use if t in self.tools]
+        if items is None:
+            tool_results = await self._run_tools(tool_names)
+        else:
             tool_results = []
-            for tool_name in tools_to_use:
-                if tool_name in self.tools:
-                    self._log("tool_call", {"tool": tool_name, "status": "starting"})
-                    result = await execute_mock_tool(tool_name)
-                    tool_results.append({
-                        "tool": tool_name,
-                        "result": result
-                    })
-                    tools_used.append(tool_name)
-                    self._log("tool_call", {"tool": tool_name, "status": "completed", "result": result})
-
-                    # Simulate token cost
-                    total_cost += 0.01  # Simplified cost per tool call
-
-            # Generate output based on tool results
+            for item in items:
+                if self._handoff_requested:
+                    tool_results.append(_HANDED_OFF)
+                    break
+                item_results = await self._run_tools(tool_names, item)
+                tool_results.extend(item_results)
+                # The remaining items are not worked on once a tool fails
+                if not all(tr["result"].get("success") for tr in item_results):
+                    break
+
+        if any(tr["result"].get("handed_off") for tr in tool_results):
+            return self._handoff_result(start_time, tool_results)
+
+        timed_out = list(dict.fromkeys(
+            tr["tool"] for tr in tool_results if tr["result"].get("timed_out")
+        ))
+        if timed_out:
+            return self._failure_result(
+                "timeout",
+                f"Tool call timed out: {', '.join(timed_out)}",
+                start_time,
+                tools=timed_out
+            )
+
+        failed = list(dict.fromkeys(
+            tr["tool"] for tr in tool_results if not tr["result"].get("success")
+        ))
+        if failed:
+            return self._failure_result(
+                "tool_failure",
+                f"Tool call failed: {', '.join(failed)}",
+                start_time,
+                tools=failed
+            )
+
+        # Generate output based on tool results; when streaming it went out
+        # piece by piece instead
+        if self._stream is None:
             output = self._generate_output(task_description, tool_results)
-            summary = self._generate_summary(task_description, tool_results)
+        else:
+            output = None
+            if not self._streamed_output:
+                self._emit("output", self._generate_output(task_description, []))
+        summary = self._generate_summary(task_description, tool_results)
 
-            # Check for issues
-            flags = self._check_for_flags(tool_results)
+        # Check for issues
+        flags = self._check_for_flags(tool_results)
 
-            end_time = datetime.utcnow()
-            execution_time = (end_time - start_time).total_seconds()
+        end_time = datetime.utcnow()
+        execution_time = (end_time - start_time).total_seconds()
 
-            self._log("execution_complete", {
-                "success": True,
-                "execution_time": execution_time
-            })
+        self._log("execution_complete", {
+            "success": True,
+            "execution_time": execution_time
+        })
 
-            return {
-                "success": True,
-                "output": output,
-                "summary": summary,
-                "flags": flags,
-                "tools_used": tools_used,
-                "cost_incurred": total_cost,
-                "execution_time_seconds": execution_time
-            }
+        return {
+            "success": True,
+            "output": output,
+            "summary": summary,
+            "flags": flags,
+            "tools_used": list(dict.fromkeys(self._completed_tools + self._reused_tools)),
+            "cost_incurred": self._cost(),
+            "cost_saved": self._saved_cost,
+            "llm_calls": self._llm_calls,
+            "llm_cache_hits": self._llm_cache_hits,
+            "execution_time_seconds": execution_time
+        }
+
+    def _handoff_result(
+        self,
+        start_time: datetime,
+        tool_results: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Result of an execution stopped for reassignment, carrying its finished work."""
+        result = self._failure_result(
+            "reassigned", "Handed off to another agent", start_time
+        )
+        result["tool_results"] = [
+            tr for tr in tool_results if tr["result"].get("success")
+        ]
+        return result
 
-        except Exception as e:
-            end_time = datetime.utcnow()
-            execution_time = (end_time - start_time).total_seconds()
+    def _failure_result(
+        self,
+        error_type: str,
+        message: str,
+        start_time: datetime,
+        tools: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Result for a failed execution; completed tool calls are still charged."""
+        execution_time = (datetime.utcnow() - start_time).total_seconds()
+        self._log("execution_error", {"error": message, "error_type": error_type})
+        return {
+            "success": False,
+            "output": None,
+            "summary": f"Execution failed: {message}",
+            "flags": [{"type": "error", "message": message}],
+            "tools_used": list(dict.fromkeys(self._completed_tools + self._reused_tools)),
+            "cost_incurred": self._cost(),
+            "cost_saved": self._saved_cost,
+            "llm_calls": self._llm_calls,
+            "llm_cache_hits": self._llm_cache_hits,
+            "execution_time_seconds": execution_time,
+            "error": {"type": error_type, "message": message, "tools": tools or []}
+        }
+
+    def _cost(self) -> float:
+        """Cost of the model calls and simulated tool calls made so far (reused ones are free)."""
+        return self._llm_cost + 0.01 * len(self._completed_tools)  # Simplified cost per tool call
+
+    async def _reason(self, task_description: str, context: Optional[Dict[str, Any]]) -> str:
+        """Ask the agent's model how it will approach the task."""
+        prompt = f"Task: {task_description}"
+        if context and context.get("previous_summary"):
+            prompt += f"\nPrevious step: {context['previous_summary']}"
+        prompt += f"\nAvailable tools: {', '.join(self.tools) or 'none'}\nBriefly plan your approach."
+
+        provider = provider_for(self.llm_model)
+        request = {
+            "model": self.llm_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "api_key": self.anthropic_api_key if provider == "anthropic" else self.openai_api_key,
+            "system": f"You are {self.agent_name}, a {self.agent_role}. Your goal: {self.agent_goal}",
+            "max_tokens": 512
+        }
+        response: Optional[Dict[str, Any]] = None
+        if self._stream is None:
+            response = await self.llm_client.complete(**request)
+        else:
+            async for chunk in self.llm_client.stream(**request):
+                if "delta" in chunk:
+                    self._emit("reasoning", chunk["delta"])
+                else:
+                    response = chunk["response"]
+            if response is None:
+                raise LLMError(f"{provider} stream ended without a response")
+        usage = response["usage"]
+        cost = (usage["input_tokens"] + usage["output_tokens"]) / 1000 * get_llm_cost(self.llm_model)
+        self._llm_calls += 1
+        if response.get("cached"):
+            self._llm_cache_hits += 1
+            self._saved_cost += cost
+        else:
+            self._llm_cost += cost
+        return response["text"]
 
-            self._log("execution_error", {"error": str(e)})
+    async def _run_tools(self, tool_names: List[str], item: Any = None) -> List[Dict[str, Any]]:
+        """
+        Run the selected tools (on an item) and return their results in
+        selection order.
+
+        In concurrent mode every tool starts as soon as the tools it depends
+        on (per tool_dependencies) have finished, with at most
+        max_tool_concurrency calls in flight. Otherwise tools run one by one.
+        Once a handoff is requested, tools that have not started are not
+        run.
+        """
+        if not self.concurrent_tools:
+            results = []
+            for name in tool_names:
+                if self._handoff_requested:
+                    results.append(_HANDED_OFF)
+                else:
+                    results.append(await self._run_tool(name, item))
+            return results
+
+        semaphore = asyncio.Semaphore(self.max_tool_concurrency)
+        calls: Dict[str, asyncio.Task] = {}
+
+        async def run_when_ready(tool_name: str, upstream: List[asyncio.Task]):
+            if upstream:
+                await asyncio.wait(upstream)
+            async with semaphore:
+                if self._handoff_requested:
+                    return _HANDED_OFF
+                return await self._run_tool(tool_name, item)
 
-            return {
+        try:
+            for tool_name in self._order_by_dependencies(tool_names):
+                # Only wait for dependencies that were selected in this run
+                upstream = [
+                    calls[dep] for dep in self.tool_dependencies.get(tool_name, [])
+                    if dep in calls
+                ]
+                calls[tool_name] = asyncio.create_task(run_when_ready(tool_name, upstream))
+            return list(await asyncio.gather(*(calls[name] for name in tool_names)))
+        finally:
+            for call in calls.values():
+                call.cancel()
+
+    def _order_by_dependencies(self, tool_names: List[str]) -> List[str]:
+        """
+        Order tools so each comes after the selected tools it depends on.
+
+        Selection order is kept otherwise; a dependency cycle is broken
+        in favour of selection order.
+        """
+        ordered: List[str] = []
+        visiting = set()
+
+        def visit(tool_name: str):
+            if tool_name in ordered or tool_name in visiting:
+                return
+            visiting.add(tool_name)
+            for dep in self.tool_dependencies.get(tool_name, []):
+                if dep in tool_names:
+                    visit(dep)
+            visiting.discard(tool_name)
+            ordered.append(tool_name)
+
+        for tool_name in tool_names:
+            visit(tool_name)
+        return ordered
+
+    async def _run_tool(self, tool_name: str, item: Any = None) -> Dict[str, Any]:
+        """Run a single tool call and log its timing."""
+        reused = self._reused_results.get((tool_name, _item_label(item) if item is not None else None))
+        if reused:
+            # Already done by the agent this work was reassigned from
+            self._reused_tools.append(tool_name)
+            self._log("tool_call", {"tool": tool_name, "status": "reused", "result": reused["result"]})
+            self._emit_tool_output(reused)
+            return reused
+
+        self._log("tool_call", {"tool": tool_name, "status": "starting"})
+        timeout = self._tool_timeout()
+        started = time.perf_counter()
+        kwargs = {"item": item} if item is not None else {}
+        try:
+            result = await asyncio.wait_for(execute_mock_tool(tool_name, **kwargs), timeout)
+            self._completed_tools.append(tool_name)
+        except asyncio.TimeoutError:
+            result = {
                 "success": False,
-                "output": None,
-                "summary": f"Execution failed: {str(e)}",
-                "flags": [{"type": "error", "message": str(e)}],
-                "tools_used": tools_used,
-                "cost_incurred": total_cost,
-                "execution_time_seconds": execution_time
+                "error": f"Timed out after {timeout:.1f}s",
+                "timed_out": True
             }
+        duration = time.perf_counter() - started
+        self._log("tool_call", {
+            "tool": tool_name,
+            "status": "completed",
+            "result": result,
+            "duration_seconds": duration
+        })
+        tool_result = {
+            "tool": tool_name,
+            "result": result,
+            "duration_seconds": duration
+        }
+        if item is not None:
+            tool_result["item"] = item
+        self._emit_tool_output(tool_result)
+        return tool_result
+
+    def _emit_tool_output(self, tool_result: Dict[str, Any]):
+        """Stream the output lines of a finished tool call."""
+        text = self._format_tool_result(tool_result)
+        if text is not None:
+            self._emit("output", "\n" + text if self._streamed_output else text)
+            self._streamed_output = True
+
+    def _emit(self, kind: str, text: str):
+        if self._stream is not None:
+            self._stream.put_nowait({"type": kind, "text": text})
+
+    def _tool_timeout(self) -> Optional[float]:
+        """Time a tool call may take: tool_timeout, capped by the execution deadline."""
+        timeout = self.tool_timeout
+        if self._deadline is not None:
+            remaining = max(0.0, self._deadline - asyncio.get_running_loop().time())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
 
     def _select_tools(self, task_description: str) -> List[str]:
         """Select which tools to use based on task description."""
-        selected = []
-        task_lower = task_description.lower()
-
-        if any(word in task_lower for word in ["pr", "pull request", "code", "review", "merge"]):
-            if "github" in self.tools:
-                selected.append("github")
-
-        if any(word in task_lower for word in ["message", "notify", "slack", "team"]):
-            if "slack" in self.tools:
-                selected.append("slack")
-
-        if any(word in task_lower for word in ["issue", "ticket", "jira", "bug"]):
-            if "jira" in self.tools:
-                selected.append("jira")
-
-        if any(word in task_lower for word in ["lint", "quality", "style"]):
-            if "code_linter" in self.tools:
-                selected.append("code_linter")
-
-        if any(word in task_lower for word in ["security", "vulnerability", "scan"]):
-            if "security_scanner" in self.tools:
-                selected.append("security_scanner")
+        selected = [
+            tool for tool in TOOL_INTENTS.match(task_description) if tool in self.tools
+        ]
 
         # If no specific tools matched, use the first available tool
         if not selected and self.tools:
@@ -172,16 +513,21 @@ class AgentExecutor:
         if not tool_results:
             return f"Analyzed task: {task}. No tools were executed."
 
-        outputs = []
-        for tr in tool_results:
-            tool_name = tr["tool"]
-            result = tr["result"]
-            if result.get("success"):
-                outputs.append(f"{tool_name}: Completed successfully")
-                if "data" in result:
-                    outputs.append(f"  Data: {result['data']}")
-
-        return "\n".join(outputs)
+        outputs = [self._format_tool_result(tr) for tr in tool_results]
+        return "\n".join(output for output in outputs if output is not None)
+
+    def _format_tool_result(self, tool_result: Dict[str, Any]) -> Optional[str]:
+        """Output lines of a successful tool call, or None for a failed one."""
+        tool_name = tool_result["tool"]
+        result = tool_result["result"]
+        if "item" in tool_result:
+            tool_name = f"{tool_name} [{_item_label(tool_result['item'])}]"
+        if not result.get("success"):
+            return None
+        lines = [f"{tool_name}: Completed successfully"]
+        if "data" in result:
+            lines.append(f"  Data: {result['data']}")
+        return "\n".join(lines)
 
     def _generate_summary(
         self,
@@ -189,11 +535,14 @@ class AgentExecutor:
         tool_results: List[Dict[str, Any]]
     ) -> str:
         """Generate a brief summary of what was done."""
-        successful_tools = [
+        successful_tools = list(dict.fromkeys(
             tr["tool"] for tr in tool_results
             if tr["result"].get("success")
-        ]
+        ))
+        items = {_item_label(tr["item"]) for tr in tool_results if "item" in tr}
 
+        if successful_tools and items:
+            return f"Completed task for {len(items)} items using {', '.join(successful_tools)}."
         if successful_tools:
             return f"Completed task using {', '.join(successful_tools)}."
         else:
@@ -246,3 +595,16 @@ class AgentExecutor:
     def get_execution_log(self) -> List[Dict[str, Any]]:
         """Get the full execution log."""
         return self.execution_log
+
+
+# Stand-in result for a tool call skipped because the work is being handed off
+_HANDED_OFF = {"tool": None, "result": {"success": False, "handed_off": True}}
+
+
+def _item_label(item: Any) -> str:
+    """Short name of a collection item, e.g. a PR id or issue key."""
+    if isinstance(item, dict):
+        for field in ("key", "id", "name", "title"):
+            if field in item:
+                return str(item[field])
+    return str(item)
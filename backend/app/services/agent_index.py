@@ -0,0 +1,255 @@
+"""
+Agent capability index - finds agents by tools and role without scanning
+the whole roster.
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+import re
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Shortest role keyword prefix that is indexed
+_MIN_PREFIX = 2
+
+# Slots of removed agents are reclaimed once at least this many are free
+# and they outnumber the agents left
+_MIN_FREE_SLOTS = 64
+
+
+class AgentCapabilityIndex:
+    """
+    Indexes agents by the tools they have and the words of their role.
+
+    Every agent gets a slot number, in the order agents were added. Tool
+    names are interned to ids; each agent has a bitset of its tool ids and
+    each tool a bitset of the slots of the agents that have it. Role and
+    name words are indexed by prefix in the same way, and each scope (e.g.
+    a user's squad) has a bitset of its agents.
+
+    "Agents with all of these tools, excluding X" is then an AND of the
+    tools' bitsets, masked by the scope and with X's bit cleared.
+
+    Removed agents leave their slot free. Once most slots are free, the
+    index is rebuilt with the remaining agents renumbered in order, so
+    the bitsets stay as short as the roster.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._agents: Dict[int, Dict[str, Any]] = {}
+        self._scopes: Dict[int, str] = {}
+        self._next_slot = 0
+
+        self._tool_ids: Dict[str, int] = {}
+        self._agent_tools: Dict[int, int] = {}
+        self._tool_agents: List[int] = []
+
+        self._role_agents: Dict[str, int] = {}
+        self._agent_role_keys: Dict[int, List[str]] = {}
+
+        self._scope_agents: Dict[str, int] = {}
+        self._all_agents = 0
+        self._versions: Dict[str, int] = {}
+
+    def add(self, agent: Dict[str, Any], scope: str):
+        """Add an agent, or re-index it after an update (keeping its position)."""
+        slot = self._slots.get(agent["id"])
+        if slot is None:
+            slot = self._next_slot
+            self._next_slot += 1
+            self._slots[agent["id"]] = slot
+        else:
+            previous_scope = self._scopes[slot]
+            self._unindex(slot)
+            if previous_scope != scope:
+                self._bump(previous_scope)
+        self._index(slot, agent, scope)
+        self._bump(scope)
+
+    def remove(self, agent_id: str):
+        """Remove an agent from the index."""
+        slot = self._slots.pop(agent_id, None)
+        if slot is None:
+            return
+        scope = self._scopes[slot]
+        self._unindex(slot)
+        self._bump(scope)
+
+        free = self._next_slot - len(self._slots)
+        if free >= _MIN_FREE_SLOTS and free > len(self._slots):
+            self._compact()
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        slot = self._slots.get(agent_id)
+        return self._agents.get(slot) if slot is not None else None
+
+    def agents(self, scope: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All agents (of a scope), in the order they were added."""
+        return list(self._iter_agents(self._scope_mask(scope)))
+
+    def has_scope(self, scope: str) -> bool:
+        return bool(self._scope_agents.get(scope))
+
+    def version(self, scope: str) -> int:
+        """Counter that changes whenever an agent of the scope changes."""
+        return self._versions.get(scope, 0)
+
+    def has_tools(self, agent_id: str, tools: Iterable[str]) -> bool:
+        """Whether an agent has every one of the tools."""
+        slot = self._slots.get(agent_id)
+        if slot is None:
+            return False
+        required = self._tool_mask(tools)
+        return required is not None and self._agent_tools[slot] & required == required
+
+    def agents_with_tools(
+        self,
+        tools: Iterable[str],
+        exclude: Iterable[str] = (),
+        scope: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Agents that have all of the tools, minus the excluded agent ids."""
+        return list(self._iter_agents(self._with_tools(tools, exclude, scope)))
+
+    def find_with_tools(
+        self,
+        tools: Iterable[str],
+        exclude: Iterable[str] = (),
+        scope: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The first agent that has all of the tools, minus the excluded ids."""
+        return next(self._iter_agents(self._with_tools(tools, exclude, scope)), None)
+
+    def agents_by_role(
+        self,
+        role_keywords: Iterable[str],
+        scope: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Agents whose role or name has a word starting with any of the keywords."""
+        return list(self._iter_agents(self._with_role(role_keywords, scope)))
+
+    def find_by_role(
+        self,
+        role_keywords: Iterable[str],
+        scope: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The first agent whose role or name matches any of the keywords."""
+        return next(self._iter_agents(self._with_role(role_keywords, scope)), None)
+
+    def _with_role(self, role_keywords: Iterable[str], scope: Optional[str]) -> int:
+        mask = 0
+        for keyword in role_keywords:
+            mask |= self._role_agents.get(keyword.lower(), 0)
+        return mask & self._scope_mask(scope)
+
+    def _with_tools(self, tools: Iterable[str], exclude: Iterable[str], scope: Optional[str]) -> int:
+        mask = self._scope_mask(scope)
+        for tool in tools:
+            tool_id = self._tool_ids.get(tool)
+            if tool_id is None:
+                return 0
+            mask &= self._tool_agents[tool_id]
+        for agent_id in exclude:
+            slot = self._slots.get(agent_id)
+            if slot is not None:
+                mask &= ~(1 << slot)
+        return mask
+
+    def _tool_mask(self, tools: Iterable[str]) -> Optional[int]:
+        """Bitset of tool ids, or None if a tool is unknown to every agent."""
+        mask = 0
+        for tool in tools:
+            tool_id = self._tool_ids.get(tool)
+            if tool_id is None:
+                return None
+            mask |= 1 << tool_id
+        return mask
+
+    def _scope_mask(self, scope: Optional[str]) -> int:
+        return self._all_agents if scope is None else self._scope_agents.get(scope, 0)
+
+    def _iter_agents(self, mask: int) -> Iterator[Dict[str, Any]]:
+        """Agents of the set bits of a mask, lowest slot first."""
+        while mask:
+            lowest = mask & -mask
+            yield self._agents[lowest.bit_length() - 1]
+            mask ^= lowest
+
+    def _intern(self, tool: str) -> int:
+        tool_id = self._tool_ids.get(tool)
+        if tool_id is None:
+            tool_id = len(self._tool_agents)
+            self._tool_ids[tool] = tool_id
+            self._tool_agents.append(0)
+        return tool_id
+
+    def _index(self, slot: int, agent: Dict[str, Any], scope: str):
+        """Set an agent's bits everywhere."""
+        bit = 1 << slot
+        self._agents[slot] = agent
+        self._scopes[slot] = scope
+        self._scope_agents[scope] = self._scope_agents.get(scope, 0) | bit
+        self._all_agents |= bit
+
+        tools = 0
+        for tool in agent.get("tools", []):
+            tool_id = self._intern(tool)
+            tools |= 1 << tool_id
+            self._tool_agents[tool_id] |= bit
+        self._agent_tools[slot] = tools
+
+        keys = set()
+        for word in _WORD.findall(f"{agent.get('role', '')} {agent.get('name', '')}".lower()):
+            keys.update(word[:end] for end in range(_MIN_PREFIX, len(word) + 1))
+        for key in keys:
+            self._role_agents[key] = self._role_agents.get(key, 0) | bit
+        self._agent_role_keys[slot] = list(keys)
+
+    def _compact(self):
+        """Rebuild the index with the agents renumbered in slot order."""
+        entries = sorted(
+            (slot, agent_id, self._agents[slot], self._scopes[slot])
+            for agent_id, slot in self._slots.items()
+        )
+        self._slots, self._agents, self._scopes = {}, {}, {}
+        self._tool_ids, self._agent_tools, self._tool_agents = {}, {}, []
+        self._role_agents, self._agent_role_keys = {}, {}
+        self._scope_agents, self._all_agents = {}, 0
+        for slot, (_, agent_id, agent, scope) in enumerate(entries):
+            self._slots[agent_id] = slot
+            self._index(slot, agent, scope)
+        self._next_slot = len(entries)
+
+    def _unindex(self, slot: int):
+        """Clear an agent's bits everywhere."""
+        clear = ~(1 << slot)
+        tools = self._agent_tools.pop(slot, 0)
+        tool_id = 0
+        while tools:
+            if tools & 1:
+                self._tool_agents[tool_id] &= clear
+            tools >>= 1
+            tool_id += 1
+        for key in self._agent_role_keys.pop(slot, []):
+            self._role_agents[key] &= clear
+            if not self._role_agents[key]:
+                del self._role_agents[key]
+        scope = self._scopes.pop(slot)
+        self._scope_agents[scope] &= clear
+        self._all_agents &= clear
+        del self._agents[slot]
+
+    def _bump(self, scope: str):
+        self._versions[scope] = self._versions.get(scope, 0) + 1
+
+
+_index: Optional[AgentCapabilityIndex] = None
+
+
+def get_agent_index() -> AgentCapabilityIndex:
+    """Get the shared agent capability index."""
+    global _index
+    if _index is None:
+        _index = AgentCapabilityIndex()
+    return _index
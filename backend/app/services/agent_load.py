@@ -0,0 +1,170 @@
+"""
+Agent load - live load of each agent and the policies that spread work
+across agents with the same role.
+"""
+
+from typing import Dict, Any, List, Optional
+import random
+
+
+# Latency assumed for an agent that has not finished a subtask yet
+DEFAULT_LATENCY_SECONDS = 1.0
+
+# Weight of the newest sample in the latency moving average
+LATENCY_SMOOTHING = 0.3
+
+
+class AgentLoadTracker:
+    """
+    Tracks how busy every agent is.
+
+    An agent's load is its in-flight subtasks, its queue depth (subtasks
+    assigned to it that have not started) and a moving average of how
+    long its recent subtasks took. The numbers are kept under "load" in
+    the agent states the orchestrator broadcasts.
+    """
+
+    def __init__(self, states: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.states = states if states is not None else {}
+        self._queued: Dict[str, str] = {}
+        self._queue_depth: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._latency: Dict[str, float] = {}
+
+    def enqueue(self, subtask_id: str, agent_id: str):
+        """A subtask was assigned to an agent."""
+        self.dequeue(subtask_id)
+        self._queued[subtask_id] = agent_id
+        self._queue_depth[agent_id] = self._queue_depth.get(agent_id, 0) + 1
+        self._publish(agent_id)
+
+    def dequeue(self, subtask_id: str):
+        """A subtask left its agent's queue (started, skipped or dropped)."""
+        agent_id = self._queued.pop(subtask_id, None)
+        if agent_id is not None:
+            self._queue_depth[agent_id] -= 1
+            self._publish(agent_id)
+
+    def started(self, agent_id: str):
+        self._in_flight[agent_id] = self._in_flight.get(agent_id, 0) + 1
+        self._publish(agent_id)
+
+    def finished(self, agent_id: str, duration: Optional[float] = None):
+        """An agent stopped working on a subtask; `duration` if it ran to the end."""
+        self._in_flight[agent_id] = max(0, self._in_flight.get(agent_id, 0) - 1)
+        if duration is not None:
+            previous = self._latency.get(agent_id)
+            self._latency[agent_id] = (
+                duration if previous is None
+                else LATENCY_SMOOTHING * duration + (1 - LATENCY_SMOOTHING) * previous
+            )
+        self._publish(agent_id)
+
+    def snapshot(self, agent_id: str) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight.get(agent_id, 0),
+            "queue_depth": self._queue_depth.get(agent_id, 0),
+            "latency_seconds": self._latency.get(agent_id),
+        }
+
+    def latency(self, agent_id: str) -> float:
+        return self._latency.get(agent_id, DEFAULT_LATENCY_SECONDS)
+
+    def expected_wait(self, agent_id: str) -> float:
+        """Seconds until a new subtask for the agent would be done."""
+        work = self._in_flight.get(agent_id, 0) + self._queue_depth.get(agent_id, 0) + 1
+        return work * self.latency(agent_id)
+
+    def _publish(self, agent_id: str):
+        state = self.states.setdefault(agent_id, {"agent_id": agent_id})
+        state["load"] = self.snapshot(agent_id)
+
+
+class AssignmentPolicy:
+    """Picks which of several suitable agents gets a subtask."""
+
+    name = "first"
+
+    def __init__(self, load: Optional[AgentLoadTracker] = None):
+        self.load = load or AgentLoadTracker()
+
+    def choose(self, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The agent to assign; candidates are in roster order."""
+        return candidates[0] if candidates else None
+
+
+class LeastLoadedPolicy(AssignmentPolicy):
+    """The agent expected to finish a new subtask soonest."""
+
+    name = "least_loaded"
+
+    def choose(self, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not candidates:
+            return None
+        return min(candidates, key=lambda agent: self.load.expected_wait(agent["id"]))
+
+
+class PowerOfTwoChoicesPolicy(AssignmentPolicy):
+    """The less loaded of two agents picked at random."""
+
+    name = "power_of_two"
+
+    def choose(self, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if len(candidates) < 2:
+            return candidates[0] if candidates else None
+        first, second = random.sample(candidates, 2)
+        if self.load.expected_wait(second["id"]) < self.load.expected_wait(first["id"]):
+            return second
+        return first
+
+
+class WeightedRoundRobinPolicy(AssignmentPolicy):
+    """
+    Takes turns, giving faster agents proportionally more turns.
+
+    An agent's weight is its "weight" field if it has one, otherwise the
+    inverse of its recent latency. Turns are interleaved smoothly rather
+    than in bursts.
+    """
+
+    name = "weighted_round_robin"
+
+    def __init__(self, load: Optional[AgentLoadTracker] = None):
+        super().__init__(load)
+        self._current: Dict[str, float] = {}
+
+    def choose(self, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not candidates:
+            return None
+        weights = {
+            agent["id"]: agent.get("weight") or 1.0 / self.load.latency(agent["id"])
+            for agent in candidates
+        }
+        for agent_id, weight in weights.items():
+            self._current[agent_id] = self._current.get(agent_id, 0.0) + weight
+        chosen = max(candidates, key=lambda agent: self._current[agent["id"]])
+        self._current[chosen["id"]] -= sum(weights.values())
+        return chosen
+
+
+ASSIGNMENT_POLICIES = {
+    policy.name: policy
+    for policy in (
+        AssignmentPolicy,
+        LeastLoadedPolicy,
+        PowerOfTwoChoicesPolicy,
+        WeightedRoundRobinPolicy,
+    )
+}
+
+
+def create_assignment_policy(name: str, load: Optional[AgentLoadTracker] = None) -> AssignmentPolicy:
+    """
+    Create an assignment policy by name.
+
+    Raises:
+        ValueError: If there is no policy of that name
+    """
+    if name not in ASSIGNMENT_POLICIES:
+        raise ValueError(f"Unknown assignment policy: {name}")
+    return ASSIGNMENT_POLICIES[name](load)
@@ -0,0 +1,59 @@
+"""
+Approval gate - lets subtasks wait for a human decision without polling.
+"""
+
+from typing import Dict, Optional
+import asyncio
+
+
+class ApprovalGate:
+    """
+    Awaitables for pending approval requests.
+
+    A subtask that needs approval waits on its request; approving or
+    denying the request resolves the wait with the decision.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, asyncio.Future] = {}
+
+    def register(self, approval_id: str):
+        """Start listening for a decision before the request is published."""
+        if approval_id not in self._waiters:
+            self._waiters[approval_id] = asyncio.get_running_loop().create_future()
+
+    async def wait(self, approval_id: str) -> bool:
+        """Wait for an approval request to be resolved. True if approved."""
+        self.register(approval_id)
+        future = self._waiters[approval_id]
+        try:
+            return await future
+        finally:
+            self._waiters.pop(approval_id, None)
+
+    def resolve(self, approval_id: str, approved: bool) -> bool:
+        """
+        Deliver the decision for an approval request.
+
+        Returns:
+            Whether a subtask in this process was waiting on the request
+        """
+        future = self._waiters.get(approval_id)
+        if future is None or future.done():
+            return False
+        future.set_result(approved)
+        return True
+
+    def is_waiting(self, approval_id: str) -> bool:
+        return approval_id in self._waiters
+
+
+_gate: Optional[ApprovalGate] = None
+
+
+def get_approval_gate() -> ApprovalGate:
+    """Get the shared approval gate."""
+    global _gate
+    if _gate is None:
+        _gate = ApprovalGate()
+    return _gate
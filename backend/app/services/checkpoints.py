@@ -0,0 +1,136 @@
+"""
+Checkpoint service - remembers task plans and completed subtasks so an
+interrupted task continues where it stopped instead of starting over.
+"""
+
+from typing import Dict, Any, List, Optional
+import json
+import os
+
+from ..config import get_settings
+
+
+class CheckpointStore:
+    """
+    Stores per-task checkpoints.
+
+    A task checkpoint holds the decomposition plan (subtask definitions and
+    dependency graph) and, for every subtask that completed, its result,
+    the handoff context it received and the cost it incurred.
+
+    Checkpoints live in memory and, when a directory is configured, are
+    also written to one JSON file per task so they survive a restart.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._checkpoints: Dict[str, Dict[str, Any]] = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def save_plan(
+        self,
+        task_id: str,
+        subtask_definitions: List[Dict[str, Any]],
+        graph: Dict[str, List[Dict[str, Any]]]
+    ):
+        """Record the plan a task is executing."""
+        checkpoint = self._entry(task_id)
+        checkpoint["plan"] = {"subtasks": subtask_definitions, "graph": graph}
+        checkpoint["subtasks"] = {}
+        self._write(task_id)
+
+    def load_plan(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """The plan recorded for a task, if any."""
+        return self._get(task_id).get("plan")
+
+    def assign_agent(self, task_id: str, subtask_id: str, agent_id: str):
+        """Record a subtask's new agent in the plan, keeping the completed subtasks."""
+        plan = self._get(task_id).get("plan")
+        if not plan:
+            return
+        plan["subtasks"] = [
+            {**sd, "agent_id": agent_id} if sd["id"] == subtask_id else sd
+            for sd in plan["subtasks"]
+        ]
+        self._write(task_id)
+
+    def save_subtask(self, task_id: str, subtask_id: str, checkpoint: Dict[str, Any]):
+        """Record a completed subtask."""
+        self._entry(task_id).setdefault("subtasks", {})[subtask_id] = checkpoint
+        self._write(task_id)
+
+    def load_subtasks(self, task_id: str) -> Dict[str, Dict[str, Any]]:
+        """Checkpoints of the completed subtasks of a task."""
+        return dict(self._get(task_id).get("subtasks", {}))
+
+    def export(self, task_id: str) -> Dict[str, Any]:
+        """Everything recorded for a task, e.g. to hand to another process."""
+        return json.loads(json.dumps(self._get(task_id), default=str))
+
+    def restore(self, task_id: str, checkpoint: Dict[str, Any]):
+        """Replace the checkpoint of a task with an exported one."""
+        self._checkpoints[task_id] = checkpoint
+        self._write(task_id)
+
+    def clear(self, task_id: str):
+        """Forget a task's checkpoints once it has finished."""
+        self._checkpoints.pop(task_id, None)
+        if self.directory:
+            try:
+                os.remove(self._path(task_id))
+            except FileNotFoundError:
+                pass
+
+    def _get(self, task_id: str) -> Dict[str, Any]:
+        """A task's checkpoint for reading; unknown tasks are not added."""
+        checkpoint = self._checkpoints.get(task_id)
+        if checkpoint is None:
+            checkpoint = self._read(task_id)
+            if checkpoint:
+                self._checkpoints[task_id] = checkpoint
+        return checkpoint
+
+    def _entry(self, task_id: str) -> Dict[str, Any]:
+        """A task's checkpoint for writing, created if it has none."""
+        checkpoint = self._get(task_id)
+        self._checkpoints[task_id] = checkpoint
+        return checkpoint
+
+    def _path(self, task_id: str) -> str:
+        return os.path.join(self.directory, f"{task_id}.json")
+
+    def _read(self, task_id: str) -> Dict[str, Any]:
+        if not self.directory:
+            return {}
+        try:
+            with open(self._path(task_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, task_id: str):
+        if not self.directory:
+            return
+        # Write to a temp file first so a crash never leaves half a checkpoint
+        path = self._path(task_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self._checkpoints[task_id], f, default=str)
+        os.replace(f"{path}.tmp", path)
+
+
+_store: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Get the shared checkpoint store."""
+    global _store
+    if _store is None:
+        _store = CheckpointStore(get_settings().checkpoint_dir or None)
+    return _store
+
+
+def set_checkpoint_store(store: CheckpointStore):
+    """Replace the shared checkpoint store (used by worker processes)."""
+    global _store
+    _store = store
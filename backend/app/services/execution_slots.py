@@ -0,0 +1,72 @@
+"""
+Execution slots - a running task's claim on one of the engine's workers.
+"""
+
+from typing import Optional
+from contextvars import ContextVar
+import asyncio
+
+
+class ExecutionSlot:
+    """
+    A task's claim on one engine worker slot.
+
+    The orchestrator reports every subtask it starts and finishes, and
+    every subtask that parks (e.g. waiting for a human). While all of a
+    task's running subtasks are parked the slot is handed back so another
+    task can use the worker; it is re-acquired before a parked subtask
+    continues.
+    """
+
+    def __init__(self, semaphore: Optional[asyncio.Semaphore] = None):
+        self._semaphore = semaphore
+        self._running = 0
+        self._parked = 0
+        self._reacquire_lock = asyncio.Lock()
+        self.held = True
+
+    def subtask_started(self):
+        self._running += 1
+
+    def subtask_finished(self):
+        self._running -= 1
+
+    def park(self):
+        """A running subtask starts waiting on something outside the task."""
+        self._parked += 1
+        if self._parked >= self._running:
+            self.release()
+
+    async def unpark(self):
+        """A parked subtask continues; waits for a slot if it was handed back."""
+        self._parked -= 1
+        await self.reacquire()
+
+    def release(self):
+        """Hand the slot back to the engine."""
+        if self.held:
+            self.held = False
+            self._release()
+
+    async def reacquire(self):
+        """Take a slot again after handing it back."""
+        async with self._reacquire_lock:
+            if not self.held:
+                await self._acquire()
+                self.held = True
+
+    def close(self):
+        """Give the slot back when the task is done."""
+        self.release()
+
+    def _release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    async def _acquire(self):
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+
+
+# Slot of the task running in the current context, set by the engine
+current_slot: ContextVar[Optional[ExecutionSlot]] = ContextVar("current_slot", default=None)
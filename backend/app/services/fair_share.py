@@ -0,0 +1,166 @@
+"""
+Fair share - per-user task queues served by deficit round-robin, so one
+user's backlog cannot starve everyone else's tasks.
+"""
+
+from typing import Dict, Any, List, Optional, Iterator
+from collections import deque
+import heapq
+import time
+
+
+# Smallest weight a user can have; keeps every queued user making progress
+MIN_WEIGHT = 0.01
+
+
+class _UserQueue:
+    """One user's queued tasks, turn deficit and usage counters."""
+
+    def __init__(self, user_id: str, weight: float, cap: int):
+        self.user_id = user_id
+        self.weight = max(MIN_WEIGHT, weight)
+        self.cap = cap
+        self.entries: List[Any] = []
+        self.deficit = 0.0
+        self.active = 0
+
+        # Metrics
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def at_cap(self) -> bool:
+        return self.cap > 0 and self.active >= self.cap
+
+
+class FairShareQueue:
+    """
+    Queued tasks grouped by user and served by deficit round-robin.
+
+    Entries need `user_id`, `queued_at` and an orderable `key` whose first
+    element is the priority rank (lower is more urgent); each user's
+    entries are served in key order. A pop serves the most urgent priority
+    class any eligible user has queued, and among the users with work of
+    that class, each turn tops a user's deficit up by its weight and every
+    dispatch spends one, so over time users get slots in proportion to
+    their weights. Users running `cap` tasks are skipped until one ends.
+
+    The unit of account is the task, because a task holds exactly one
+    engine slot however many of its subtasks run in it. A task that hands
+    its slot back while parked still counts towards its user's cap, so
+    the user cannot start more tasks than the cap meanwhile.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        caps: Optional[Dict[str, int]] = None,
+        default_weight: float = 1.0,
+        default_cap: int = 0
+    ):
+        self.weights = dict(weights or {})
+        self.caps = dict(caps or {})
+        self.default_weight = default_weight
+        self.default_cap = default_cap
+        self._users: Dict[str, _UserQueue] = {}
+        self._rotation: deque = deque()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Any]:
+        for user in self._users.values():
+            yield from user.entries
+
+    def push(self, entry: Any):
+        user = self._user(entry.user_id)
+        if not user.entries:
+            self._rotation.append(user)
+        heapq.heappush(user.entries, entry)
+        self._size += 1
+
+    def has_eligible(self) -> bool:
+        """Whether any queued task belongs to a user below their cap."""
+        return any(not user.at_cap for user in self._rotation)
+
+    def peek(self) -> Optional[Any]:
+        """The most urgent task an eligible user has queued."""
+        heads = [user.entries[0] for user in self._rotation if not user.at_cap]
+        return min(heads, key=lambda entry: entry.key) if heads else None
+
+    def pop(self) -> Optional[Any]:
+        """Take the next task by priority class, then deficit round-robin."""
+        head = self.peek()
+        if head is None:
+            return None
+        rank = head.key[0]
+        while True:
+            user = self._rotation[0]
+            if not user.at_cap and user.entries[0].key[0] == rank:
+                if user.deficit >= 1:
+                    user.deficit -= 1
+                    return self._take(user)
+                # The user's turn: top up its deficit for the next visit
+                user.deficit += user.weight
+            self._rotation.rotate(-1)
+
+    def finished(self, user_id: str, run_seconds: float = 0.0):
+        """A task of the user gave its slot back."""
+        user = self._user(user_id)
+        user.active = max(0, user.active - 1)
+        user.run_seconds += run_seconds
+
+    def clear(self):
+        for user in self._users.values():
+            user.entries.clear()
+            user.deficit = 0.0
+        self._rotation.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-user weight, cap, queue, share of slot time and wait times."""
+        total_run = sum(user.run_seconds for user in self._users.values())
+        return {
+            user.user_id: {
+                "weight": user.weight,
+                "cap": user.cap,
+                "queue_depth": len(user.entries),
+                "active": user.active,
+                "dispatched": user.dispatched,
+                "share": user.run_seconds / total_run if total_run else 0.0,
+                "average_wait_seconds": (
+                    user.total_wait / user.dispatched if user.dispatched else 0.0
+                ),
+                "max_wait_seconds": user.max_wait,
+            }
+            for user in self._users.values()
+        }
+
+    def _take(self, user: _UserQueue) -> Any:
+        entry = heapq.heappop(user.entries)
+        self._size -= 1
+        if not user.entries:
+            # An idle user does not bank turns
+            self._rotation.remove(user)
+            user.deficit = 0.0
+
+        wait = time.monotonic() - entry.queued_at
+        user.active += 1
+        user.dispatched += 1
+        user.total_wait += wait
+        user.max_wait = max(user.max_wait, wait)
+        return entry
+
+    def _user(self, user_id: str) -> _UserQueue:
+        user = self._users.get(user_id)
+        if user is None:
+            user = _UserQueue(
+                user_id,
+                self.weights.get(user_id, self.default_weight),
+                self.caps.get(user_id, self.default_cap)
+            )
+            self._users[user_id] = user
+        return user
@@ -0,0 +1,139 @@
+"""
+Hedged calls - cut tail latency by racing a second attempt against a
+slow first one.
+"""
+
+from typing import Dict, Any, List, Optional, Callable, Awaitable, TypeVar
+from collections import deque
+import asyncio
+import time
+
+from ..config import get_settings
+
+
+T = TypeVar("T")
+
+
+class _CallStats:
+    """Latency samples and hedging counters for one kind of call."""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class Hedger:
+    """
+    Issues hedged requests for idempotent calls.
+
+    Each kind of call (keyed by e.g. tool and action) keeps a window of
+    the latencies of its recent attempts. Once enough samples are in, a
+    call that has not returned by the configured percentile of that
+    latency gets a second attempt; whichever succeeds first wins and the
+    other is cancelled. Only use this for calls that are safe to issue
+    twice.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, window: int = 200):
+        self.percentile = percentile
+        self.min_samples = max(1, min_samples)
+        self.window = window
+        self._stats: Dict[str, _CallStats] = {}
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None while still learning."""
+        stats = self._stats.get(key)
+        if stats is None or len(stats.latencies) < self.min_samples:
+            return None
+        return stats.percentile(self.percentile)
+
+    async def call(
+        self,
+        key: str,
+        make_call: Callable[[], Awaitable[T]],
+        failed: Optional[Callable[[T], bool]] = None
+    ) -> T:
+        """
+        Run `make_call`, hedging it with a second attempt if it is slow.
+
+        An attempt fails if it raises or `failed` rejects its result; while
+        the other attempt is still running, its outcome is used instead.
+        If both fail, a failed result is preferred over an exception.
+        """
+        stats = self._stats.setdefault(key, _CallStats(self.window))
+        stats.calls += 1
+        delay = self.hedge_delay(key)
+
+        attempts: List[asyncio.Task] = []
+
+        def start():
+            started = time.perf_counter()
+            attempt = asyncio.ensure_future(make_call())
+            # Every attempt's own latency; a loser cut off early tells nothing
+            attempt.add_done_callback(
+                lambda a: a.cancelled() or stats.latencies.append(time.perf_counter() - started)
+            )
+            attempts.append(attempt)
+
+        start()
+        primary = attempts[0]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                stats.hedged += 1
+                start()
+
+            pending = set(attempts)
+            failures: List[asyncio.Task] = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the first attempt when both finished together
+                for attempt in sorted(done, key=lambda a: a is not primary):
+                    if attempt.exception() is not None or (failed and failed(attempt.result())):
+                        failures.append(attempt)
+                        continue
+                    if attempt is not primary:
+                        stats.hedge_wins += 1
+                    return attempt.result()
+            failures.sort(key=lambda a: a.exception() is not None)
+            return failures[0].result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-key call counts, hedge rate, hedge win rate and latency percentiles."""
+        report = {}
+        for key, stats in self._stats.items():
+            report[key] = {
+                "calls": stats.calls,
+                "hedged": stats.hedged,
+                "hedge_wins": stats.hedge_wins,
+                "hedge_rate": stats.hedged / stats.calls if stats.calls else 0.0,
+                "win_rate": stats.hedge_wins / stats.hedged if stats.hedged else 0.0,
+                "hedge_delay_seconds": self.hedge_delay(key),
+                "p50_seconds": stats.percentile(50),
+                "p99_seconds": stats.percentile(99),
+            }
+        return report
+
+
+_tool_hedger: Optional[Hedger] = None
+
+
+def get_tool_hedger() -> Hedger:
+    """Get the shared hedger for tool calls."""
+    global _tool_hedger
+    if _tool_hedger is None:
+        settings = get_settings()
+        _tool_hedger = Hedger(settings.hedge_percentile, settings.hedge_min_samples)
+    return _tool_hedger
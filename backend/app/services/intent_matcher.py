@@ -0,0 +1,97 @@
+"""
+Intent matcher - classifies task text against keyword rules in one pass.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import re
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class IntentMatcher:
+    """
+    Matches text against a table of keyword rules.
+
+    Each rule is a list of keyword groups and matches when every group
+    has at least one of its keywords in the text. Keywords match whole
+    words only ("pr" does not match "improve"), may be phrases ("pull
+    request"), and also match their plural, past tense and -ing forms
+    ("issue" matches "issues", "fix" matches "fixed" and "fixing").
+
+    The rules are compiled into an index from word to the rules it can
+    satisfy, so matching is a single pass over the words of the text no
+    matter how many rules there are.
+    """
+
+    def __init__(self, rules: Dict[str, List[List[str]]]):
+        self.rule_names = list(rules)
+        # Bitmask of the groups a rule needs, by rule position
+        self._required = [(1 << len(groups)) - 1 for groups in rules.values()]
+        # First word -> (rule position, group bit, remaining words of the phrase)
+        self._index: Dict[str, List[Tuple[int, int, Tuple[str, ...]]]] = {}
+
+        for position, groups in enumerate(rules.values()):
+            for group, keywords in enumerate(groups):
+                for keyword in keywords:
+                    for words in _variants(_TOKEN.findall(keyword.lower())):
+                        self._index.setdefault(words[0], []).append(
+                            (position, 1 << group, tuple(words[1:]))
+                        )
+
+    def match(self, text: str) -> List[str]:
+        """Names of all rules the text matches, in rule table order."""
+        words = _TOKEN.findall(text.lower())
+        hits: Dict[int, int] = {}
+        for i, word in enumerate(words):
+            for position, bit, rest in self._index.get(word, ()):
+                if rest and tuple(words[i + 1:i + 1 + len(rest)]) != rest:
+                    continue
+                hits[position] = hits.get(position, 0) | bit
+        return [
+            self.rule_names[position] for position in sorted(hits)
+            if hits[position] == self._required[position]
+        ]
+
+    def first_match(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        """The first rule in the table the text matches."""
+        matched = self.match(text)
+        return matched[0] if matched else default
+
+
+def _variants(words: List[str]) -> List[List[str]]:
+    """A keyword's words, plus its plural, past tense and -ing forms."""
+    if not words:
+        return []
+    *head, last = words
+    stem = last[:-1] if last.endswith("e") else last
+    endings = [f"{last}s", f"{last}es", f"{stem}ed", f"{stem}ing"]
+    return [words, *(head + [ending] for ending in endings)]
+
+
+# Kinds of task, in priority order; each decomposes into its own subtasks
+TASK_TYPE_RULES: Dict[str, List[List[str]]] = {
+    "pr_review": [["review", "reviewing"], ["pr", "pull request"]],
+    "bug_fix": [["fix", "fixing"], ["bug"]],
+    "deployment": [["deploy", "deployed", "deploying", "deployment"]],
+}
+
+# Tools a task calls for
+TOOL_RULES: Dict[str, List[List[str]]] = {
+    "github": [["pr", "pull request", "code", "review", "merge", "merged"]],
+    "slack": [["message", "notify", "notification", "slack", "team"]],
+    "jira": [["issue", "ticket", "jira", "bug"]],
+    "code_linter": [["lint", "linter", "linting", "quality", "style"]],
+    "security_scanner": [["security", "vulnerability", "vulnerabilities", "scan", "scanner"]],
+}
+
+TASK_TYPES = IntentMatcher(TASK_TYPE_RULES)
+TOOL_INTENTS = IntentMatcher(TOOL_RULES)
+
+# Collections a task asks to work through item by item, as "tool.action"
+COLLECTION_RULES: Dict[str, List[List[str]]] = {
+    "github.list_prs": [["all", "every", "each", "open"], ["prs", "pull requests"]],
+    "jira.list_issues": [["all", "every", "each", "open"], ["issues", "tickets", "bugs"]],
+}
+
+COLLECTIONS = IntentMatcher(COLLECTION_RULES)
@@ -0,0 +1,213 @@
+"""
+LLM cache - model responses kept on disk and reused for repeated prompts.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from ..config import get_settings
+from ..models.agent import get_llm_cost
+
+
+class LLMCache:
+    """
+    Bounded SQLite cache of chat completion responses.
+
+    Responses are keyed by the model, the prompt (system prompt and
+    messages) and the sampling params. A lookup tries the exact prompt
+    first and then its normalized form (whitespace collapsed), so prompts
+    that differ only in formatting share a response. The least recently
+    used responses are evicted once `max_entries` are stored, and
+    responses expire after their model's TTL (`model_ttls`, falling back
+    to `ttl_seconds`; 0 or None never expires). The database file can be
+    shared by several processes.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 86400.0,
+        model_ttls: Optional[Dict[str, float]] = None
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_ttls = dict(model_ttls or {})
+        self._db: Optional[sqlite3.Connection] = None
+
+        self._exact_hits = 0
+        self._normalized_hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._saved_tokens = 0
+        self._saved_cost = 0.0
+
+    def get(self, model: str, keys: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """The cached response for the exact or normalized key, or None."""
+        db = self._connect()
+        exact, normalized = keys
+        row = db.execute(
+            "SELECT key, response, stored_at FROM responses WHERE key = ?", (exact,)
+        ).fetchone()
+        exact_hit = row is not None
+        if row is None:
+            row = db.execute(
+                "SELECT key, response, stored_at FROM responses WHERE normalized_key = ? "
+                "ORDER BY used_at DESC LIMIT 1",
+                (normalized,)
+            ).fetchone()
+
+        if row is not None and self._expired(model, row[2]):
+            db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._expirations += 1
+            row = None
+        if row is None:
+            self._misses += 1
+            return None
+
+        db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), row[0]))
+        if exact_hit:
+            self._exact_hits += 1
+        else:
+            self._normalized_hits += 1
+
+        response = json.loads(row[1])
+        tokens = response["usage"]["input_tokens"] + response["usage"]["output_tokens"]
+        self._saved_tokens += tokens
+        self._saved_cost += tokens / 1000 * get_llm_cost(model)
+        return response
+
+    def put(self, model: str, keys: Tuple[str, str], response: Dict[str, Any]):
+        """Cache a response, evicting the least recently used ones over the bound."""
+        if self.max_entries <= 0:
+            return
+        db = self._connect()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO responses (key, normalized_key, model, response, stored_at, used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (keys[0], keys[1], model, json.dumps(response), now, now)
+        )
+        excess = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at LIMIT ?)",
+                (excess,)
+            )
+            self._evictions += excess
+
+    def bypassed(self):
+        """Count a call that opted out of the cache."""
+        self._bypassed += 1
+
+    def clear(self):
+        self._connect().execute("DELETE FROM responses")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counts, and the tokens and cost hits saved."""
+        hits = self._exact_hits + self._normalized_hits
+        lookups = hits + self._misses
+        return {
+            "entries": self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "exact_hits": self._exact_hits,
+            "normalized_hits": self._normalized_hits,
+            "misses": self._misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "bypassed": self._bypassed,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "saved_tokens": self._saved_tokens,
+            "saved_cost": self._saved_cost,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path) if self.path != ":memory:" else ""
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            if self.path != ":memory:":
+                # Worker processes read while another one writes
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, normalized_key TEXT NOT NULL, model TEXT NOT NULL, "
+                "response TEXT NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_normalized_key ON responses (normalized_key)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        return self._db
+
+    def _expired(self, model: str, stored_at: float) -> bool:
+        ttl = self.model_ttls.get(model, self.ttl_seconds)
+        return bool(ttl) and time.time() - stored_at > ttl
+
+
+def request_keys(
+    model: str,
+    messages: List[Dict[str, str]],
+    system: Optional[str],
+    params: Dict[str, Any]
+) -> Tuple[str, str]:
+    """Exact and normalized keys of a request, by model, prompt and sampling params."""
+    return (
+        _digest(model, system, messages, params),
+        _digest(
+            model,
+            normalize_prompt(system) if system else system,
+            [{**message, "content": normalize_prompt(message["content"])} for message in messages],
+            params
+        )
+    )
+
+
+def normalize_prompt(text: str) -> str:
+    """Runs of whitespace collapsed to one space, without leading or trailing space."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _digest(
+    model: str,
+    system: Optional[str],
+    messages: List[Dict[str, str]],
+    params: Dict[str, Any]
+) -> str:
+    request = [model, system, [[m["role"], m["content"]] for m in messages], sorted(params.items())]
+    return hashlib.sha256(json.dumps(request).encode()).hexdigest()
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Get the shared LLM response cache, or None if it is disabled."""
+    global _cache
+    settings = get_settings()
+    if _cache is None and settings.llm_cache_size > 0:
+        _cache = LLMCache(
+            path=settings.llm_cache_path or ":memory:",
+            max_entries=settings.llm_cache_size,
+            ttl_seconds=settings.llm_cache_ttl_seconds or None,
+            model_ttls=settings.llm_cache_model_ttls
+        )
+    return _cache
@@ -0,0 +1,560 @@
+"""
+LLM client - model calls over pooled, long-lived HTTP connections shared
+by every agent.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator, Awaitable, Callable
+from collections import deque
+import hashlib
+import importlib.util
+import json
+import time
+
+import httpx
+
+from ..config import get_settings
+from .llm_cache import LLMCache, get_llm_cache, request_keys
+from .single_flight import SingleFlight, get_single_flight
+from .rate_limits import RateLimiter, RateLimitKey, estimate_tokens, get_rate_limiter
+
+
+# Providers by the start of their model names; anything else is OpenAI
+PROVIDER_PREFIXES = {"claude": "anthropic"}
+
+ANTHROPIC_VERSION = "2023-06-01"
+
+# HTTP/2 needs the h2 package (httpx[http2]); without it connections use HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class LLMError(Exception):
+    """A model call failed: the provider answered with an error or could not be reached."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def provider_for(model: str) -> str:
+    """The provider serving a model, e.g. "anthropic" for "claude-3-haiku"."""
+    for prefix, provider in PROVIDER_PREFIXES.items():
+        if model.startswith(prefix):
+            return provider
+    return "openai"
+
+
+class _PoolStats:
+    """Request counters and latencies of one provider and key's connection pool."""
+
+    def __init__(self, window: int = 200):
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latencies: deque = deque(maxlen=window)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class LLMClient:
+    """
+    Async chat completions against OpenAI and Anthropic compatible APIs.
+
+    One httpx.AsyncClient is kept per (provider, API key), so every agent
+    using a key shares its pool of keep-alive connections (HTTP/2 where
+    the server and the h2 package allow) instead of opening new ones per
+    call. Deterministic requests are answered from the cache when there
+    is one, and identical ones in flight at the same time share a single
+    call through `single_flight`. With a `rate_limiter`, calls wait for
+    their provider, model and key's request and token budget, and a 429
+    is retried up to `rate_limit_retries` times once the budget resets.
+    Responses are normalized to
+    {"text", "model", "provider", "usage": {"input_tokens", "output_tokens"},
+    "latency_seconds", "cached"}.
+    """
+
+    def __init__(
+        self,
+        base_urls: Dict[str, str],
+        api_keys: Optional[Dict[str, str]] = None,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 100,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        cache: Optional[LLMCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        rate_limit_retries: int = 2
+    ):
+        self.base_urls = base_urls
+        self.api_keys = api_keys or {}
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self.cache = cache
+        self.single_flight = single_flight
+        self.rate_limiter = rate_limiter
+        self.rate_limit_retries = rate_limit_retries if rate_limiter is not None else 0
+        self._clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+        self._stats: Dict[Tuple[str, str], _PoolStats] = {}
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: Optional[str] = None,
+        system: Optional[str] = None,
+        max_tokens: int = 1024,
+        temperature: float = 0.0,
+        cache: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Run a chat completion.
+
+        Args:
+            model: Model name; its prefix picks the provider
+            messages: [{"role": "user" | "assistant", "content": str}]
+            api_key: The caller's key; the configured key of the provider
+                is used without one
+            system: System prompt
+            cache: Whether the call is deterministic, so its response may
+                come from and go to the cache and be shared with identical
+                calls in flight; by default only temperature 0 calls are,
+                so pass False for other steps whose output should vary
+
+        Raises:
+            LLMError: If the provider returns an error or cannot be reached
+        """
+        provider = provider_for(model)
+        keys = self._keys(model, messages, system, max_tokens, temperature, cache)
+        cached = self._cached(model, keys)
+        if cached is not None:
+            return {**cached, "provider": provider, "latency_seconds": 0.0, "cached": True}
+
+        api_key = api_key or self.api_keys.get(provider, "")
+        pool = (provider, _fingerprint(api_key))
+        path, body = _request_body(provider, model, messages, system, max_tokens, temperature)
+
+        def request():
+            return self._request(pool, api_key, model, path, body, keys)
+
+        if keys is not None and self.single_flight is not None:
+            return await self.single_flight.call(f"llm:{model}", (pool, keys[0]), request)
+        return await request()
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        api_key: Optional[str] = None,
+        system: Optional[str] = None,
+        max_tokens: int = 1024,
+        temperature: float = 0.0,
+        cache: Optional[bool] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run a chat completion, yielding its text as the tokens arrive.
+
+        Takes the same arguments as `complete`. Yields {"delta": str} chunks
+        of text, then {"response": ...} with the whole response as
+        `complete` returns it. A cached response comes as one chunk.
+        Streams are not shared with identical calls in flight.
+
+        Raises:
+            LLMError: If the provider returns an error or cannot be reached
+        """
+        provider = provider_for(model)
+        keys = self._keys(model, messages, system, max_tokens, temperature, cache)
+        cached = self._cached(model, keys)
+        if cached is not None:
+            yield {"delta": cached["text"]}
+            yield {"response": {**cached, "provider": provider, "latency_seconds": 0.0, "cached": True}}
+            return
+
+        api_key = api_key or self.api_keys.get(provider, "")
+        pool = (provider, _fingerprint(api_key))
+        path, body = _request_body(provider, model, messages, system, max_tokens, temperature)
+        body["stream"] = True
+        if provider != "anthropic":
+            body["stream_options"] = {"include_usage": True}
+        client = self._client(pool, api_key)
+        stats = self._stats[pool]
+        limit_key = (provider, model, pool[1])
+        estimate = _estimate_tokens(body)
+
+        result: Dict[str, Any] = {
+            "text": "",
+            "model": model,
+            "usage": {"input_tokens": 0, "output_tokens": 0}
+        }
+        text: List[str] = []
+        for attempt in range(self.rate_limit_retries + 1):
+            await self._dispatch(limit_key, estimate)
+            stats.requests += 1
+            started = time.perf_counter()
+            used_tokens = None
+            try:
+                try:
+                    async with client.stream(
+                        "POST", path, json=body, extensions={"trace": _tracer(stats)}
+                    ) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                        if self._retry_throttled(limit_key, response, attempt):
+                            continue
+                        if response.status_code >= 400:
+                            raise _error(provider, stats, response)
+                        self._observe(limit_key, response)
+                        async for event in _server_sent_events(response):
+                            delta = _parse_stream_event(provider, event, result)
+                            if delta:
+                                text.append(delta)
+                                yield {"delta": delta}
+                except httpx.HTTPError as e:
+                    stats.errors += 1
+                    raise LLMError(f"{provider} request failed: {e}") from e
+                latency = time.perf_counter() - started
+
+                result["text"] = "".join(text)
+                stats.latencies.append(latency)
+                stats.input_tokens += result["usage"]["input_tokens"]
+                stats.output_tokens += result["usage"]["output_tokens"]
+                used_tokens = result["usage"]["input_tokens"] + result["usage"]["output_tokens"]
+            finally:
+                # Settled however the call ends (also cancelled or abandoned
+                # mid-stream), so a probing call always lets the others go
+                self._settle(limit_key, estimate, used_tokens)
+            if keys is not None and self.cache is not None:
+                self.cache.put(model, keys, result)
+            yield {"response": {**result, "provider": provider, "latency_seconds": latency, "cached": False}}
+            return
+
+    def _keys(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        system: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        cache: Optional[bool]
+    ) -> Optional[Tuple[str, str]]:
+        """Request keys of a deterministic call, or None for one that must not be shared."""
+        if not (cache if cache is not None else temperature == 0):
+            return None
+        return request_keys(
+            model, messages, system, {"max_tokens": max_tokens, "temperature": temperature}
+        )
+
+    def _cached(self, model: str, keys: Optional[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        if keys is None:
+            self.cache.bypassed()
+            return None
+        return self.cache.get(model, keys)
+
+    async def _request(
+        self,
+        pool: Tuple[str, str],
+        api_key: str,
+        model: str,
+        path: str,
+        body: Dict[str, Any],
+        cache_keys: Optional[Tuple[str, str]]
+    ) -> Dict[str, Any]:
+        """One call to the provider; a successful response is cached under `cache_keys`."""
+        provider = pool[0]
+        client = self._client(pool, api_key)
+        stats = self._stats[pool]
+        limit_key = (provider, model, pool[1])
+        estimate = _estimate_tokens(body)
+
+        for attempt in range(self.rate_limit_retries + 1):
+            await self._dispatch(limit_key, estimate)
+            stats.requests += 1
+            started = time.perf_counter()
+            used_tokens = None
+            try:
+                try:
+                    response = await client.post(path, json=body, extensions={"trace": _tracer(stats)})
+                except httpx.HTTPError as e:
+                    stats.errors += 1
+                    raise LLMError(f"{provider} request failed: {e}") from e
+                latency = time.perf_counter() - started
+                if self._retry_throttled(limit_key, response, attempt):
+                    continue
+                if response.status_code >= 400:
+                    raise _error(provider, stats, response)
+
+                stats.latencies.append(latency)
+                result = _parse_response(provider, response.json())
+                stats.input_tokens += result["usage"]["input_tokens"]
+                stats.output_tokens += result["usage"]["output_tokens"]
+                used_tokens = result["usage"]["input_tokens"] + result["usage"]["output_tokens"]
+            finally:
+                # Settled however the call ends (also cancelled or with an
+                # unreadable response), so a probing call always lets the
+                # others go
+                self._settle(limit_key, estimate, used_tokens)
+            # The provider's view of the budget, which already counts this call
+            self._observe(limit_key, response)
+            if cache_keys is not None and self.cache is not None:
+                self.cache.put(model, cache_keys, result)
+            return {**result, "provider": provider, "latency_seconds": latency, "cached": False}
+
+    async def _dispatch(self, limit_key: RateLimitKey, estimate: int):
+        """Wait for the request and token budget of a call."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(limit_key, estimate)
+
+    def _settle(self, limit_key: RateLimitKey, estimate: int, used_tokens: Optional[int]):
+        if self.rate_limiter is not None:
+            self.rate_limiter.settle(limit_key, estimate, used_tokens)
+
+    def _observe(self, limit_key: RateLimitKey, response: httpx.Response):
+        if self.rate_limiter is not None:
+            self.rate_limiter.observe(limit_key, response.headers)
+
+    def _retry_throttled(
+        self,
+        limit_key: RateLimitKey,
+        response: httpx.Response,
+        attempt: int
+    ) -> bool:
+        """Whether a 429 is retried: the key's calls pause for the reset, and this one requeues."""
+        if (
+            response.status_code != 429
+            or self.rate_limiter is None
+            or attempt >= self.rate_limit_retries
+        ):
+            return False
+        retry_after = response.headers.get("retry-after")
+        self.rate_limiter.throttled(
+            limit_key, float(retry_after) if retry_after else None, response.headers
+        )
+        return True
+
+    async def aclose(self):
+        """Close every pooled connection and the cache."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-pool requests, errors, connections opened, tokens and latency percentiles."""
+        return {
+            "http2": self.http2,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "rate_limits": self.rate_limiter.stats() if self.rate_limiter is not None else None,
+            "pools": [
+                {
+                    "provider": provider,
+                    "key": key,
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "connections_opened": stats.connections_opened,
+                    "input_tokens": stats.input_tokens,
+                    "output_tokens": stats.output_tokens,
+                    "p50_seconds": stats.percentile(50),
+                    "p95_seconds": stats.percentile(95),
+                }
+                for (provider, key), stats in self._stats.items()
+            ]
+        }
+
+    def _client(self, pool: Tuple[str, str], api_key: str) -> httpx.AsyncClient:
+        client = self._clients.get(pool)
+        if client is None or client.is_closed:
+            provider = pool[0]
+            if provider == "anthropic":
+                headers = {"anthropic-version": ANTHROPIC_VERSION}
+                if api_key:
+                    headers["x-api-key"] = api_key
+            else:
+                headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+            client = httpx.AsyncClient(
+                base_url=self.base_urls[provider],
+                headers=headers,
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout
+            )
+            self._clients[pool] = client
+            self._stats.setdefault(pool, _PoolStats())
+        return client
+
+
+def _fingerprint(api_key: str) -> str:
+    """Short, non-reversible name of an API key for pool keys and metrics."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else "default"
+
+
+def _request_body(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    system: Optional[str],
+    max_tokens: int,
+    temperature: float
+) -> Tuple[str, Dict[str, Any]]:
+    """Path and JSON body of a chat completion request to the provider."""
+    if provider == "anthropic":
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if system:
+            body["system"] = system
+        return "/messages", body
+
+    if system:
+        messages = [{"role": "system", "content": system}, *messages]
+    return "/chat/completions", {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
+
+
+def _estimate_tokens(body: Dict[str, Any]) -> int:
+    """Tokens a request may use, to reserve before it is sent."""
+    prompt = body.get("system", "") + "".join(
+        message["content"] for message in body["messages"] if isinstance(message.get("content"), str)
+    )
+    return estimate_tokens(prompt, body["max_tokens"])
+
+
+def _tracer(stats: _PoolStats) -> Callable[[str, Dict[str, Any]], Awaitable[None]]:
+    """httpx trace hook counting the connections a request had to open."""
+    async def trace(event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            stats.connections_opened += 1
+    return trace
+
+
+def _error(provider: str, stats: _PoolStats, response: httpx.Response) -> LLMError:
+    """LLMError for an error response, counted against the pool."""
+    stats.errors += 1
+    retry_after = response.headers.get("retry-after")
+    return LLMError(
+        f"{provider} returned {response.status_code}: {response.text[:200]}",
+        status_code=response.status_code,
+        retry_after=float(retry_after) if retry_after else None
+    )
+
+
+async def _server_sent_events(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """JSON payloads of a server-sent event stream, up to OpenAI's [DONE]."""
+    done = False
+    async for line in response.aiter_lines():
+        # Past [DONE] the body is still read to the end, so the connection
+        # goes back to the pool instead of being closed
+        if done or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            done = True
+            continue
+        yield json.loads(data)
+
+
+def _parse_stream_event(provider: str, event: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    """Text delta of a streamed event; model and token usage are recorded in `result`."""
+    usage = result["usage"]
+    if provider == "anthropic":
+        kind = event.get("type")
+        if kind == "message_start":
+            message = event.get("message", {})
+            result["model"] = message.get("model", result["model"])
+            usage["input_tokens"] = message.get("usage", {}).get("input_tokens", 0)
+        elif kind == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        elif kind == "message_delta":
+            usage["output_tokens"] = event.get("usage", {}).get("output_tokens", 0)
+        return None
+
+    result["model"] = event.get("model", result["model"])
+    if event.get("usage"):
+        usage["input_tokens"] = event["usage"].get("prompt_tokens", 0)
+        usage["output_tokens"] = event["usage"].get("completion_tokens", 0)
+    choices = event.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+
+def _parse_response(provider: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Text, model and token usage of a provider response."""
+    if provider == "anthropic":
+        usage = data.get("usage", {})
+        return {
+            "text": "".join(
+                block.get("text", "") for block in data.get("content", [])
+                if block.get("type") == "text"
+            ),
+            "model": data.get("model"),
+            "usage": {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0)
+            }
+        }
+    usage = data.get("usage", {})
+    choices = data.get("choices") or [{}]
+    return {
+        "text": choices[0].get("message", {}).get("content") or "",
+        "model": data.get("model"),
+        "usage": {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0)
+        }
+    }
+
+
+_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """Get the shared LLM client."""
+    global _client
+    if _client is None:
+        settings = get_settings()
+        _client = LLMClient(
+            base_urls={
+                "openai": settings.openai_base_url,
+                "anthropic": settings.anthropic_base_url
+            },
+            api_keys={
+                "openai": settings.openai_api_key,
+                "anthropic": settings.anthropic_api_key
+            },
+            http2=settings.llm_http2,
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            timeout=settings.llm_timeout_seconds,
+            cache=get_llm_cache(),
+            single_flight=get_single_flight(),
+            rate_limiter=get_rate_limiter(),
+            rate_limit_retries=settings.llm_rate_limit_retries
+        )
+    return _client
@@ -2,11 +2,36 @@
 Manager Agent - orchestrates specialist agents to complete tasks.
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
 from datetime import datetime
 import uuid
 
+from .intent_matcher import TASK_TYPES, COLLECTIONS
+from .agent_index import AgentCapabilityIndex
+from .plan_cache import get_plan_cache
+from .agent_load import AssignmentPolicy
+from .resource_locks import get_lock_manager
+from .role_matcher import RoleMatcher
+
+
+# Role keywords of the specialists subtasks are assigned to
+CODER_ROLES = ["coder", "developer", "engineer"]
+REVIEWER_ROLES = ["reviewer", "qa", "quality"]
+DEPLOYER_ROLES = ["deployer", "devops", "release"]
+TESTER_ROLES = ["tester", "qa", "quality"]
+
+# What each role does, for ranking agents by their free-form profiles
+ROLE_QUERIES = {
+    tuple(CODER_ROLES): "coder developer software engineer who writes, analyzes and fixes code",
+    tuple(REVIEWER_ROLES): "reviewer qa quality assurance, reviews code for quality and security",
+    tuple(DEPLOYER_ROLES): "deployer devops release manager, deploys and ships releases to production",
+    tuple(TESTER_ROLES): "tester qa quality assurance, tests changes and verifies fixes",
+}
+
+# Agents ranked by a role matcher that are considered for a subtask
+ROLE_CANDIDATES = 32
+
 
 class ManagerAgent:
     """
@@ -23,12 +48,26 @@ class ManagerAgent:
         manager_id: str = "manager_default",
         llm_model: str = "gpt-4",
         openai_api_key: Optional[str] = None,
-        anthropic_api_key: Optional[str] = None
+        anthropic_api_key: Optional[str] = None,
+        agent_index: Optional[AgentCapabilityIndex] = None,
+        agent_scope: Optional[str] = None,
+        assignment_policy: Optional[AssignmentPolicy] = None,
+        role_matcher: Optional[RoleMatcher] = None
     ):
         self.manager_id = manager_id
         self.llm_model = llm_model
         self.openai_api_key = openai_api_key
         self.anthropic_api_key = anthropic_api_key
+        # With an index, agent lookups query the index's agents of
+        # agent_scope instead of scanning the agent lists passed in
+        self.agent_index = agent_index
+        self.agent_scope = agent_scope
+        # Spreads subtasks over agents with the same role by their load;
+        # without one, the first agent with the role gets the work
+        self.assignment_policy = assignment_policy
+        # Ranks agents of agent_scope by how alike their profile is to a
+        # role; takes precedence over role keyword lookups
+        self.role_matcher = role_matcher
 
     async def decompose_task(
         self,
@@ -45,25 +84,81 @@ class ManagerAgent:
         Returns:
             List of subtasks with assigned agents
         """
+        # Tasks of a shape the squad has planned before reuse that plan
+        plan_cache = get_plan_cache()
+        cache_key = plan_cache.key(task_description, available_agents)
+        cached = plan_cache.get(cache_key)
+        if cached is not None:
+            return self.assign_agents(cached, available_agents)
+
         # For MVP, we use rule-based decomposition
         # In production, this would use LLM to analyze the task
 
         subtasks = []
-        task_lower = task_description.lower()
+        task_type = self.classify_task(task_description)
 
         # Analyze task and create subtasks
-        if "review" in task_lower and "pr" in task_lower:
+        if task_type == "pr_review":
             subtasks = self._decompose_pr_review(task_description, available_agents)
-        elif "fix" in task_lower and "bug" in task_lower:
+        elif task_type == "bug_fix":
             subtasks = self._decompose_bug_fix(task_description, available_agents)
-        elif "deploy" in task_lower:
+        elif task_type == "deployment":
             subtasks = self._decompose_deployment(task_description, available_agents)
         else:
             # Generic task decomposition
             subtasks = self._decompose_generic(task_description, available_agents)
 
+        plan_cache.put(cache_key, subtasks, [agent["id"] for agent in available_agents])
+        return self.assign_agents(subtasks, available_agents)
+
+    def assign_agents(
+        self,
+        subtasks: List[Dict[str, Any]],
+        available_agents: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Assign subtasks to agents by the assignment policy.
+
+        Subtasks planned for a role go to whichever agent with the same
+        role as the first match the policy picks; each assignment counts
+        towards the agent's queue depth.
+        """
+        if not self.assignment_policy:
+            return subtasks
+
+        for subtask in subtasks:
+            keywords = subtask.get("role_keywords")
+            context = subtask.get("description", "")
+            primary = self._find_agent_by_role(available_agents, keywords, context) if keywords else None
+            if primary:
+                role = primary.get("role", "").lower()
+                agent = self.assignment_policy.choose([
+                    candidate for candidate in self._agents_by_role(available_agents, keywords, context)
+                    if candidate.get("role", "").lower() == role
+                ])
+                subtask["agent_id"] = agent["id"]
+            if subtask.get("agent_id"):
+                self.assignment_policy.load.enqueue(subtask["id"], subtask["agent_id"])
         return subtasks
 
+    def classify_task(self, task_description: str) -> str:
+        """The kind of task a description asks for."""
+        return TASK_TYPES.first_match(task_description, "generic")
+
+    def plan_shape(self, task_description: str) -> Tuple[str, ...]:
+        """
+        What a description's decomposition depends on: its kind of task
+        and the collections it fans out over.
+
+        Tasks of the same shape decompose into the same subtasks, whatever
+        else their descriptions say, except generic ones, whose subtasks
+        carry the description itself.
+        """
+        task_type = self.classify_task(task_description)
+        if task_type == "generic":
+            return (task_type, task_description)
+        return (task_type, *COLLECTIONS.match(task_description))
+
     def _decompose_pr_review(
         self,
         task: str,
@@ -73,17 +168,19 @@ class ManagerAgent:
         subtasks = []
 
         # Find agents by role
-        code_agent = self._find_agent_by_role(agents, ["coder", "developer", "engineer"])
-        review_agent = self._find_agent_by_role(agents, ["reviewer", "qa", "quality"])
-        deploy_agent = self._find_agent_by_role(agents, ["deployer", "devops", "release"])
+        code_agent = self._find_agent_by_role(agents, CODER_ROLES)
+        review_agent = self._find_agent_by_role(agents, REVIEWER_ROLES)
+        deploy_agent = self._find_agent_by_role(agents, DEPLOYER_ROLES)
 
         # Create subtask chain
         subtasks.append({
             "id": f"subtask_{uuid.uuid4().hex[:8]}",
             "description": "Fetch and analyze PR code changes",
             "agent_id": code_agent["id"] if code_agent else agents[0]["id"] if agents else None,
+            "role_keywords": CODER_ROLES,
             "order": 1,
-            "complexity_weight": 2
+            "complexity_weight": 2,
+            "resources": {"repository": "read"}
         })
 
         if review_agent:
@@ -91,17 +188,25 @@ class ManagerAgent:
                 "id": f"subtask_{uuid.uuid4().hex[:8]}",
                 "description": "Review code for quality and security issues",
                 "agent_id": review_agent["id"],
+                "role_keywords": REVIEWER_ROLES,
                 "order": 2,
-                "complexity_weight": 3
+                "complexity_weight": 3,
+                "resources": {"repository": "read"}
             })
+            self._fan_out(
+                subtasks[-1], task, "github.list_prs",
+                "Review each PR for quality and security issues"
+            )
 
         if deploy_agent:
             subtasks.append({
                 "id": f"subtask_{uuid.uuid4().hex[:8]}",
                 "description": "Merge PR and trigger deployment",
                 "agent_id": deploy_agent["id"],
+                "role_keywords": DEPLOYER_ROLES,
                 "order": 3,
                 "complexity_weight": 2,
+                "resources": {"repository": "write", "deployment": "write"},
                 "requires_approval": True
             })
 
@@ -115,23 +220,28 @@ class ManagerAgent:
         """Decompose a bug fix task."""
         subtasks = []
 
-        code_agent = self._find_agent_by_role(agents, ["coder", "developer", "engineer"])
-        test_agent = self._find_agent_by_role(agents, ["tester", "qa", "quality"])
+        code_agent = self._find_agent_by_role(agents, CODER_ROLES)
+        test_agent = self._find_agent_by_role(agents, TESTER_ROLES)
 
         subtasks.append({
             "id": f"subtask_{uuid.uuid4().hex[:8]}",
             "description": "Investigate and identify the bug",
             "agent_id": code_agent["id"] if code_agent else agents[0]["id"] if agents else None,
+            "role_keywords": CODER_ROLES,
             "order": 1,
-            "complexity_weight": 3
+            "complexity_weight": 3,
+            "resources": {"repository": "read"}
         })
+        self._fan_out(subtasks[-1], task, "jira.list_issues", "Investigate each bug")
 
         subtasks.append({
             "id": f"subtask_{uuid.uuid4().hex[:8]}",
             "description": "Implement fix for the identified issue",
             "agent_id": code_agent["id"] if code_agent else agents[0]["id"] if agents else None,
+            "role_keywords": CODER_ROLES,
             "order": 2,
-            "complexity_weight": 3
+            "complexity_weight": 3,
+            "resources": {"repository": "write"}
         })
 
         if test_agent:
@@ -139,8 +249,10 @@ class ManagerAgent:
                 "id": f"subtask_{uuid.uuid4().hex[:8]}",
                 "description": "Test the fix and verify resolution",
                 "agent_id": test_agent["id"],
+                "role_keywords": TESTER_ROLES,
                 "order": 3,
-                "complexity_weight": 2
+                "complexity_weight": 2,
+                "resources": {"repository": "read"}
             })
 
         return subtasks
@@ -153,24 +265,28 @@ class ManagerAgent:
         """Decompose a deployment task."""
         subtasks = []
 
-        deploy_agent = self._find_agent_by_role(agents, ["deployer", "devops", "release"])
-        test_agent = self._find_agent_by_role(agents, ["tester", "qa", "quality"])
+        deploy_agent = self._find_agent_by_role(agents, DEPLOYER_ROLES)
+        test_agent = self._find_agent_by_role(agents, TESTER_ROLES)
 
         if test_agent:
             subtasks.append({
                 "id": f"subtask_{uuid.uuid4().hex[:8]}",
                 "description": "Run pre-deployment tests",
                 "agent_id": test_agent["id"],
+                "role_keywords": TESTER_ROLES,
                 "order": 1,
-                "complexity_weight": 2
+                "complexity_weight": 2,
+                "resources": {"repository": "read"}
             })
 
         subtasks.append({
             "id": f"subtask_{uuid.uuid4().hex[:8]}",
             "description": "Execute deployment to target environment",
             "agent_id": deploy_agent["id"] if deploy_agent else agents[0]["id"] if agents else None,
+            "role_keywords": DEPLOYER_ROLES,
             "order": 2,
             "complexity_weight": 3,
+            "resources": {"deployment": "write"},
             "requires_approval": True
         })
 
@@ -178,8 +294,10 @@ class ManagerAgent:
             "id": f"subtask_{uuid.uuid4().hex[:8]}",
             "description": "Verify deployment success",
             "agent_id": deploy_agent["id"] if deploy_agent else agents[0]["id"] if agents else None,
+            "role_keywords": DEPLOYER_ROLES,
             "order": 3,
-            "complexity_weight": 1
+            "complexity_weight": 1,
+            "resources": {"deployment": "read"}
         })
 
         return subtasks
@@ -202,19 +320,66 @@ class ManagerAgent:
             "complexity_weight": 3
         }]
 
+    def _fan_out(
+        self,
+        subtask: Dict[str, Any],
+        task: str,
+        collection: str,
+        description: str
+    ):
+        """
+        Turn a subtask into a fan-out over a collection if the task asks for
+        every item of it (e.g. "review all open PRs").
+
+        The collection ("tool.action") is read when the subtask runs and
+        split into shards that are worked on in parallel.
+        """
+        if collection not in COLLECTIONS.match(task):
+            return
+        tool, action = collection.split(".")
+        subtask["description"] = description
+        subtask["fan_out"] = {"tool": tool, "action": action}
+
     def _find_agent_by_role(
         self,
         agents: List[Dict[str, Any]],
-        role_keywords: List[str]
+        role_keywords: List[str],
+        context: str = ""
     ) -> Optional[Dict[str, Any]]:
-        """Find an agent whose role matches any of the keywords."""
-        for agent in agents:
-            role_lower = agent.get("role", "").lower()
-            name_lower = agent.get("name", "").lower()
-            for keyword in role_keywords:
-                if keyword in role_lower or keyword in name_lower:
-                    return agent
-        return None
+        """Find the agent that best fits a role (and the work, if `context` describes it)."""
+        if self.agent_index and not self.role_matcher:
+            return self.agent_index.find_by_role(role_keywords, self.agent_scope)
+
+        matches = self._agents_by_role(agents, role_keywords, context)
+        return matches[0] if matches else None
+
+    def _agents_by_role(
+        self,
+        agents: List[Dict[str, Any]],
+        role_keywords: List[str],
+        context: str = ""
+    ) -> List[Dict[str, Any]]:
+        """
+        Agents that fit a role: best match first with a role matcher,
+        otherwise those whose role matches any keyword, in roster order.
+        """
+        if self.role_matcher:
+            query = ROLE_QUERIES.get(tuple(role_keywords), " ".join(role_keywords))
+            ranked = self.role_matcher.rank(
+                query, self.agent_scope, top_k=ROLE_CANDIDATES, context=context
+            )
+            return [agent for agent, _ in ranked]
+
+        if self.agent_index:
+            return self.agent_index.agents_by_role(role_keywords, self.agent_scope)
+
+        return [
+            agent for agent in agents
+            if any(
+                keyword in agent.get("role", "").lower() or keyword in agent.get("name", "").lower()
+                for keyword in role_keywords
+            )
+        ]
 
     async def handle_handoff(
         self,
@@ -249,6 +414,66 @@ class ManagerAgent:
 
         return handoff_context
 
+    def merge_handoff_contexts(
+        self,
+        contexts: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Merge the handoffs of several upstream agents into one context.
+
+        A single handoff is passed through unchanged. With several, outputs
+        and summaries are joined and flags are concatenated.
+        """
+        if len(contexts) == 1:
+            return contexts[0]
+
+        merged: Dict[str, Any] = {}
+        outputs = [c["previous_output"] for c in contexts if c.get("previous_output")]
+        if outputs:
+            merged["previous_output"] = "\n\n".join(outputs)
+
+        summaries = [c["previous_summary"] for c in contexts if c.get("previous_summary")]
+        if summaries:
+            merged["previous_summary"] = " ".join(summaries)
+
+        if any("flags" in c for c in contexts):
+            merged["flags"] = [flag for c in contexts for flag in c.get("flags", [])]
+
+        if any("original_context" in c for c in contexts):
+            merged["original_context"] = [c.get("original_context") for c in contexts]
+
+        return merged
+
+    def merge_shard_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Reduce the results of a fan-out's shards into one result.
+
+        Outputs are joined in shard order, flags and tools are combined and
+        costs are summed; the execution time is the slowest shard's. The
+        result fails if any shard failed.
+        """
+        failed = [r for r in results if not r["success"]]
+        merged = {
+            "success": not failed,
+            "output": "\n\n".join(r["output"] for r in results if r.get("output")) or None,
+            "summary": (
+                f"Completed {len(results)} shards. "
+                + " ".join(r["summary"] for r in results if r.get("summary"))
+            ),
+            "flags": [flag for r in results for flag in r.get("flags", [])],
+            "tools_used": list(dict.fromkeys(t for r in results for t in r.get("tools_used", []))),
+            "cost_incurred": sum(r.get("cost_incurred", 0) for r in results),
+            "execution_time_seconds": max((r.get("execution_time_seconds", 0) for r in results), default=0)
+        }
+        if failed:
+            merged["summary"] = f"{len(failed)} of {len(results)} shards failed: {failed[0]['summary']}"
+            merged["error"] = {
+                "type": failed[0]["error"]["type"],
+                "message": failed[0]["error"]["message"],
+                "tools": list(dict.fromkeys(t for r in failed for t in r["error"].get("tools", [])))
+            }
+        return merged
+
     async def detect_conflicts(
         self,
         active_subtasks: List[Dict[str, Any]]
@@ -256,27 +481,25 @@ class ManagerAgent:
         """
         Detect conflicts between active subtasks.
 
-        Types of conflicts:
-        - Resource conflicts (same resource being modified)
-        - Output conflicts (contradictory results)
-        - Validation failures
+        Resource conflicts are read from the shared lock table: a resource
+        conflicts when some subtask is waiting for it. Only contended
+        resources are visited, however many subtasks are active.
         """
-        conflicts = []
+        agents = {subtask.get("id"): subtask.get("agent_id") for subtask in active_subtasks}
 
-        # Check for resource conflicts
-        resource_claims = {}
-        for subtask in active_subtasks:
-            resources = subtask.get("resources", [])
-            for resource in resources:
-                if resource in resource_claims:
-                    conflicts.append({
-                        "type": "resource_conflict",
-                        "resource": resource,
-                        "agents": [resource_claims[resource], subtask["agent_id"]],
-                        "message": f"Multiple agents trying to access: {resource}"
-                    })
-                else:
-                    resource_claims[resource] = subtask["agent_id"]
+        conflicts = []
+        for entry in get_lock_manager().contention():
+            owners = entry["holders"] + [waiter["owner"] for waiter in entry["waiting"]]
+            if not any(owner in agents for owner in owners):
+                continue
+            conflicts.append({
+                "type": "resource_conflict",
+                "resource": entry["resource"],
+                "agents": [agents.get(owner, owner) for owner in owners],
+                "holders": entry["holders"],
+                "waiting": entry["waiting"],
+                "message": f"Multiple agents trying to access: {entry['resource']}"
+            })
 
         return conflicts
 
@@ -289,18 +512,34 @@ class ManagerAgent:
         """
         Handle an error from a subtask execution.
 
+        Transient failures (tool failures and timeouts) are retried on the
+        same agent while `failed_subtask["attempts"]` is within its
+        `max_retries`, then reassigned to an agent with the same tools
+        (other than those in `failed_subtask["excluded_agent_ids"]`).
+        Anything else is escalated to a human.
+
         Returns:
             Recovery action to take
         """
         error_type = error.get("type", "unknown")
+        attempts = failed_subtask.get("attempts", 1)
+        max_retries = failed_subtask.get("max_retries", 2)
+
+        if error_type in ("tool_failure", "timeout"):
+            if attempts <= max_retries:
+                return {
+                    "action": "retry",
+                    "max_retries": max_retries,
+                    "message": f"Retrying (attempt {attempts + 1} of {max_retries + 1})"
+                }
 
-        if error_type == "tool_failure":
             # Try to reassign to a different agent with the same tool
             current_agent_id = failed_subtask["agent_id"]
             alternative_agent = self._find_alternative_agent(
                 available_agents,
                 current_agent_id,
-                failed_subtask.get("required_tools", [])
+                failed_subtask.get("required_tools", []),
+                failed_subtask.get("excluded_agent_ids", [])
             )
             if alternative_agent:
                 return {
@@ -309,13 +548,6 @@ class ManagerAgent:
                     "message": "Reassigning to alternative agent"
                 }
 
-        if error_type == "timeout":
-            return {
-                "action": "retry",
-                "max_retries": 2,
-                "message": "Retrying with increased timeout"
-            }
-
         # Default: escalate to human
         return {
             "action": "escalate",
@@ -326,11 +558,16 @@ class ManagerAgent:
         self,
         agents: List[Dict[str, Any]],
         exclude_agent_id: str,
-        required_tools: List[str]
+        required_tools: List[str],
+        excluded_agent_ids: Optional[List[str]] = None
     ) -> Optional[Dict[str, Any]]:
         """Find an alternative agent that has the required tools."""
+        excluded = [exclude_agent_id, *(excluded_agent_ids or [])]
+        if self.agent_index:
+            return self.agent_index.find_with_tools(required_tools, excluded, self.agent_scope)
+
         for agent in agents:
-            if agent["id"] == exclude_agent_id:
+            if agent["id"] in excluded:
                 continue
             agent_tools = set(agent.get("tools", []))
             if all(tool in agent_tools for tool in required_tools):
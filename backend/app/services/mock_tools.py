@@ -3,18 +3,32 @@ Mock tools for MVP development.
 These simulate real tool behavior without actual API calls.
 """
 
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, Optional, Set
 import random
 import asyncio
+import json
+
+from ..config import get_settings
+from .hedging import get_tool_hedger
+from .single_flight import get_single_flight
 
 
 class MockTool:
     """Base class for mock tools."""
 
+    # Action used when a call does not name one
+    default_action: Optional[str] = None
+    # Read-only actions that are safe to issue twice (e.g. to hedge them)
+    idempotent_actions: Set[Optional[str]] = set()
+
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
 
+    def is_idempotent(self, action: Optional[str] = None) -> bool:
+        """Whether calling the action twice has the same effect as once."""
+        return (action or self.default_action) in self.idempotent_actions
+
     async def execute(self, **kwargs) -> Dict[str, Any]:
         raise NotImplementedError
 
@@ -22,6 +36,9 @@ class MockTool:
 class MockGitHubTool(MockTool):
     """Mock GitHub tool for PR operations."""
 
+    default_action = "list_prs"
+    idempotent_actions = {"list_prs", "get_pr"}
+
     def __init__(self):
         super().__init__(
             name="github",
@@ -33,13 +50,17 @@ class MockGitHubTool(MockTool):
         await asyncio.sleep(random.uniform(0.5, 1.5))
 
         if action == "list_prs":
-            return {
-                "success": True,
-                "data": [
-                    {"id": 123, "title": "Fix authentication bug", "status": "open"},
-                    {"id": 124, "title": "Add user profile page", "status": "open"},
-                ]
-            }
+            prs = [
+                {"id": 123, "title": "Fix authentication bug", "status": "open"},
+                {"id": 124, "title": "Add user profile page", "status": "open"},
+            ]
+            # Larger repositories for exercising fan-out
+            limit = kwargs.get("limit", len(prs))
+            prs.extend(
+                {"id": 123 + i, "title": f"Update module {i}", "status": "open"}
+                for i in range(len(prs), limit)
+            )
+            return {"success": True, "data": prs[:limit]}
         elif action == "get_pr":
             pr_id = kwargs.get("pr_id", 123)
             return {
@@ -80,6 +101,9 @@ class MockGitHubTool(MockTool):
 class MockSlackTool(MockTool):
     """Mock Slack tool for messaging."""
 
+    default_action = "send_message"
+    idempotent_actions = {"read_channel"}
+
     def __init__(self):
         super().__init__(
             name="slack",
@@ -115,6 +139,9 @@ class MockSlackTool(MockTool):
 class MockJiraTool(MockTool):
     """Mock Jira tool for issue tracking."""
 
+    default_action = "list_issues"
+    idempotent_actions = {"list_issues", "get_issue"}
+
     def __init__(self):
         super().__init__(
             name="jira",
@@ -125,13 +152,16 @@ class MockJiraTool(MockTool):
         await asyncio.sleep(random.uniform(0.5, 1.0))
 
         if action == "list_issues":
-            return {
-                "success": True,
-                "data": [
-                    {"key": "PROJ-101", "summary": "Bug in login flow", "status": "Open"},
-                    {"key": "PROJ-102", "summary": "Add password reset", "status": "In Progress"},
-                ]
-            }
+            issues = [
+                {"key": "PROJ-101", "summary": "Bug in login flow", "status": "Open"},
+                {"key": "PROJ-102", "summary": "Add password reset", "status": "In Progress"},
+            ]
+            limit = kwargs.get("limit", len(issues))
+            issues.extend(
+                {"key": f"PROJ-{101 + i}", "summary": f"Bug in module {i}", "status": "Open"}
+                for i in range(len(issues), limit)
+            )
+            return {"success": True, "data": issues[:limit]}
         elif action == "get_issue":
             return {
                 "success": True,
@@ -158,6 +188,9 @@ class MockJiraTool(MockTool):
 class MockCodeLinterTool(MockTool):
     """Mock code linter tool."""
 
+    # Analysis only reads the code
+    idempotent_actions = {None}
+
     def __init__(self):
         super().__init__(
             name="code_linter",
@@ -195,6 +228,9 @@ class MockCodeLinterTool(MockTool):
 class MockSecurityScannerTool(MockTool):
     """Mock security scanner tool."""
 
+    # Scanning only reads the code
+    idempotent_actions = {None}
+
     def __init__(self):
         super().__init__(
             name="security_scanner",
@@ -245,8 +281,43 @@ def get_mock_tool(tool_name: str) -> MockTool | None:
 
 
 async def execute_mock_tool(tool_name: str, **kwargs) -> Dict[str, Any]:
-    """Execute a mock tool and return results."""
+    """
+    Execute a mock tool and return results.
+
+    Idempotent actions issued with the same arguments at the same time
+    share one call, and are hedged: a slow call gets a second attempt and
+    the faster of the two wins.
+    """
     tool = get_mock_tool(tool_name)
     if not tool:
         return {"success": False, "error": f"Unknown tool: {tool_name}"}
+
+    if not tool.is_idempotent(kwargs.get("action")):
+        return await _call_tool(tool, kwargs)
+
+    single_flight = get_single_flight()
+    if single_flight is None:
+        return await _hedged_call(tool, kwargs)
+    key = json.dumps(kwargs, sort_keys=True, default=str)
+    return await single_flight.call(f"tool:{tool_name}", key, lambda: _hedged_call(tool, kwargs))
+
+
+async def _hedged_call(tool: MockTool, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """A call of an idempotent action, hedged if hedging is on."""
+    if get_settings().hedge_tool_calls:
+        return await get_tool_hedger().call(
+            f"{tool.name}.{kwargs.get('action') or tool.default_action}",
+            lambda: _call_tool(tool, kwargs),
+            failed=lambda result: not result.get("success", True)
+        )
+    return await _call_tool(tool, kwargs)
+
+
+async def _call_tool(tool: MockTool, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """One call of a mock tool."""
+    # Simulate flaky integrations so failure recovery can be exercised
+    if random.random() < get_settings().mock_tool_failure_rate:
+        await asyncio.sleep(random.uniform(0.05, 0.2))
+        return {"success": False, "error": f"{tool.name} is temporarily unavailable"}
+
     return await tool.execute(**kwargs)
@@ -2,14 +2,29 @@
 Task orchestration service - coordinates the execution of tasks across agents.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
 import asyncio
 from datetime import datetime
+import random
+import time
 import uuid
 
+from ..config import get_settings
 from ..models.task import Task, TaskStatus, Subtask, SubtaskStatus
+from ..models.workflow import Workflow
+from ..models.approval import ApprovalStatus
 from .manager_agent import ManagerAgent
 from .agent_executor import AgentExecutor
+from .mock_tools import execute_mock_tool
+from .task_graph import build_dependency_graph, copy_plan, get_dependents, shard_subtask
+from .checkpoints import get_checkpoint_store
+from .approval_gate import get_approval_gate
+from .execution_slots import current_slot
+from .agent_index import AgentCapabilityIndex, get_agent_index
+from .agent_load import AgentLoadTracker, AssignmentPolicy, create_assignment_policy
+from .resource_locks import DeadlockError, get_lock_manager
+from .role_matcher import RoleMatcher, get_role_matcher
+from .llm_client import get_llm_client
 
 
 # Simulated agent database for MVP
@@ -41,34 +56,152 @@ DEMO_AGENTS = [
     }
 ]
 
+# Scope of the demo agents in the agent capability index
+DEMO_SCOPE = "demo"
+
+
+def get_roster_index() -> AgentCapabilityIndex:
+    """The agent index, with the agents tasks run with registered."""
+    index = get_agent_index()
+    if not index.has_scope(DEMO_SCOPE):
+        for agent in DEMO_AGENTS:
+            index.add(agent, DEMO_SCOPE)
+    return index
+
+
+def get_roster_matcher() -> RoleMatcher:
+    """The role matcher, with the agents tasks run with registered."""
+    matcher = get_role_matcher()
+    if not matcher.has_scope(DEMO_SCOPE):
+        for agent in DEMO_AGENTS:
+            matcher.add(agent, DEMO_SCOPE)
+    return matcher
+
+
+_assignment_policy: Optional[AssignmentPolicy] = None
+
+
+def get_assignment_policy() -> AssignmentPolicy:
+    """The policy that spreads subtasks over agents, as configured."""
+    global _assignment_policy
+    if _assignment_policy is None:
+        _assignment_policy = create_assignment_policy(get_settings().assignment_policy, agent_load)
+    return _assignment_policy
+
+
+def _create_manager() -> ManagerAgent:
+    return ManagerAgent(
+        agent_index=get_roster_index(),
+        agent_scope=DEMO_SCOPE,
+        assignment_policy=get_assignment_policy(),
+        role_matcher=get_roster_matcher() if get_settings().semantic_role_matching else None
+    )
+
 
 # Global state for real-time updates
 agent_states: Dict[str, Dict[str, Any]] = {}
+agent_load = AgentLoadTracker(agent_states)
 websocket_connections: List[Any] = []
 
+# Async callable (event, data) that delivers events to clients
+_event_emitter: Optional[Callable[[str, Dict[str, Any]], Awaitable[Any]]] = None
+
+
+def set_event_emitter(emitter: Optional[Callable[[str, Dict[str, Any]], Awaitable[Any]]]):
+    """Register where orchestration events are sent (e.g. Socket.IO)."""
+    global _event_emitter
+    _event_emitter = emitter
+
+
+async def emit_event(event: str, data: Dict[str, Any]):
+    """Send an event to connected clients, if an emitter is registered."""
+    if _event_emitter is not None:
+        await _event_emitter(event, data)
+
+
+# Interrupt signals of the tasks currently executing, keyed by task id
+_interrupts: Dict[str, asyncio.Event] = {}
+
+
+def interrupt_task(task_id: str):
+    """
+    Interrupt a running task after its status changed (e.g. paused).
+
+    In-flight subtasks of a paused or cancelled task are cancelled right
+    away instead of running to the next subtask boundary. A task put back
+    to pending (preempted) lets them finish and starts no new ones.
+    """
+    event = _interrupts.get(task_id)
+    if event:
+        event.set()
+
+
+# Agent changes requested for subtasks of the tasks executing here, and the
+# executors of their running attempts, keyed by subtask id
+_reassignments: Dict[str, Dict[str, Any]] = {}
+_executors: Dict[str, AgentExecutor] = {}
+
+
+def reassign_subtask(
+    task_id: str,
+    subtask_id: str,
+    new_agent_id: str,
+    transfer_context: bool = True
+):
+    """
+    Move a subtask to another agent.
+
+    A running attempt stops at the next safe point between tool calls and
+    the subtask continues on the new agent; with `transfer_context` the
+    tool results gathered so far go along in its handoff context, so the
+    calls that succeeded are not made again. The task's recorded plan is
+    updated too, so a subtask that has not started (or a paused one) runs
+    on the new agent when it does.
+    """
+    get_checkpoint_store().assign_agent(task_id, subtask_id, new_agent_id)
+
+    if task_id in _interrupts:
+        _reassignments[subtask_id] = {
+            "agent_id": new_agent_id,
+            "transfer_context": transfer_context
+        }
+        executor = _executors.get(subtask_id)
+        if executor:
+            executor.request_handoff()
+
 
 async def broadcast_agent_state(agent_id: str, state: Dict[str, Any]):
     """Broadcast agent state update to all connected clients."""
+    if "load" not in state:
+        state = {**state, "load": agent_load.snapshot(agent_id)}
     agent_states[agent_id] = state
-    # In production, this would send via WebSocket
-    # For now, we just update the global state
+    await emit_event("agent_state_update", {"agent_id": agent_id, "state": state})
 
 
-async def execute_task(task_id: str, tasks_db: Dict[str, Task]):
+async def execute_task(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    workflows_db: Optional[Dict[str, Workflow]] = None
+):
     """
     Main task execution orchestrator.
 
     This function:
     1. Gets the task from the database
     2. Uses Manager Agent to decompose into subtasks
-    3. Executes subtasks in order
-    4. Handles handoffs between agents
-    5. Updates task progress in real-time
+    3. Builds the subtask dependency graph from the task's workflow
+    4. Executes every ready subtask concurrently
+    5. Handles handoffs between agents
+    6. Updates task progress in real-time
     """
     if task_id not in tasks_db:
         return
 
     task = tasks_db[task_id]
+    if task.status == TaskStatus.CANCELLED:
+        # Cancelled while queued: its batch plan will not be used
+        discard_plans([task_id])
+        return
 
     # Update task status to running
     task = task.model_copy(update={"status": TaskStatus.RUNNING})
@@ -76,19 +209,33 @@ async def execute_task(task_id: str, tasks_db: Dict[str, Task]):
 
     try:
         # Initialize Manager Agent
-        manager = ManagerAgent()
+        manager = _create_manager()
 
         # Get available agents
         # In production, fetch from database based on user's squad
         available_agents = DEMO_AGENTS
 
-        # Decompose task into subtasks
-        subtask_definitions = await manager.decompose_task(
-            task.description,
-            available_agents
-        )
+        # Continue from the recorded plan if the task ran before, so
+        # resumed tasks keep their subtasks and completed work
+        checkpoints = get_checkpoint_store()
+        plan = checkpoints.load_plan(task_id)
+        if plan:
+            subtask_definitions, graph = plan["subtasks"], plan["graph"]
+        else:
+            # Decompose task into subtasks
+            subtask_definitions = await manager.decompose_task(
+                task.description,
+                available_agents
+            )
 
-        # Create subtasks
+            # Build the dependency graph from the task's workflow
+            workflow = workflows_db.get(task.workflow_id) if workflows_db else None
+            graph = build_dependency_graph(subtask_definitions, workflow)
+            checkpoints.save_plan(task_id, subtask_definitions, graph)
+        completed = checkpoints.load_subtasks(task_id)
+
+        # Create subtasks, restoring the completed ones
+        existing = {s.id: s for s in task.subtasks}
         subtasks = []
         for subtask_def in subtask_definitions:
             subtask = Subtask(
@@ -97,145 +244,1052 @@ async def execute_task(task_id: str, tasks_db: Dict[str, Task]):
                 agent_id=subtask_def["agent_id"],
                 description=subtask_def["description"],
                 status=SubtaskStatus.PENDING,
-                cost_incurred=0.0
+                cost_incurred=0.0,
+                depends_on=[dep["subtask_id"] for dep in graph[subtask_def["id"]]]
             )
+            checkpoint = completed.get(subtask_def["id"])
+            if checkpoint:
+                previous = existing.get(subtask_def["id"])
+                subtask = subtask.model_copy(update={
+                    "status": SubtaskStatus.COMPLETED,
+                    "output": checkpoint["result"].get("output"),
+                    "cost_incurred": checkpoint["cost_incurred"],
+                    "started_at": previous.started_at if previous else None,
+                    "completed_at": previous.completed_at if previous else None
+                })
             subtasks.append(subtask)
 
         # Update task with subtasks
         task = task.model_copy(update={"subtasks": subtasks})
         tasks_db[task_id] = task
 
-        # Calculate total complexity for progress tracking
-        total_complexity = sum(
-            sd.get("complexity_weight", 1) for sd in subtask_definitions
+        # Execute the subtask graph
+        await _run_subtask_graph(
+            task_id,
+            tasks_db,
+            manager,
+            available_agents,
+            subtask_definitions,
+            graph,
+            completed
         )
-        completed_complexity = 0
 
-        # Execute subtasks in order
-        previous_result = None
-        for i, subtask_def in enumerate(subtask_definitions):
-            subtask = subtasks[i]
+        # Mark task as completed
+        task = tasks_db[task_id]
+        if task.status == TaskStatus.CANCELLED:
+            checkpoints.clear(task_id)
+        elif task.status == TaskStatus.PENDING and any(
+            s.status == SubtaskStatus.PENDING for s in task.subtasks
+        ):
+            # Preempted: the in-flight subtasks finished and the rest run
+            # when the engine dispatches the task again
+            pass
+        elif task.status != TaskStatus.PAUSED:
+            failed = any(s.status == SubtaskStatus.FAILED for s in task.subtasks)
+            task = task.model_copy(update={
+                "status": TaskStatus.FAILED if failed else TaskStatus.COMPLETED,
+                "completed_at": datetime.utcnow(),
+                "progress": 100
+            })
+            tasks_db[task_id] = task
+            checkpoints.clear(task_id)
+
+    except Exception as e:
+        # Mark task as failed
+        task = tasks_db[task_id]
+        task = task.model_copy(update={
+            "status": TaskStatus.FAILED
+        })
+        tasks_db[task_id] = task
+        raise e
 
-            # Check if task was paused
-            task = tasks_db[task_id]
-            if task.status == TaskStatus.PAUSED:
-                break
 
-            # Get the agent for this subtask
-            agent_data = next(
-                (a for a in available_agents if a["id"] == subtask.agent_id),
-                None
+async def plan_tasks(
+    task_ids: List[str],
+    tasks_db: Dict[str, Task],
+    workflows_db: Optional[Dict[str, Workflow]] = None
+):
+    """
+    Record the plans of a batch of tasks before they are queued.
+
+    Tasks of the same shape (workflow, kind of task and fan-out) share a
+    single decomposition; each task gets its own copy with fresh subtask
+    ids and its own agent assignment. execute_task picks the recorded plan
+    up instead of decomposing again.
+
+    Raises:
+        ValueError: If a task's plan does not fit its workflow, e.g. the
+            workflow has a cycle; the plans recorded so far are kept
+    """
+    manager = _create_manager()
+    available_agents = DEMO_AGENTS
+    checkpoints = get_checkpoint_store()
+
+    plans: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for task_id in task_ids:
+        task = tasks_db[task_id]
+        shape = (task.workflow_id, *manager.plan_shape(task.description))
+        if shape not in plans:
+            subtask_definitions = await manager.decompose_task(task.description, available_agents)
+            plans[shape] = subtask_definitions
+        else:
+            subtask_definitions = manager.assign_agents(
+                copy_plan(plans[shape], {})[0], available_agents
             )
-            if not agent_data:
-                continue
 
-            # Update subtask status
-            subtask = Subtask(
-                **{
-                    **subtask.model_dump(),
-                    "status": SubtaskStatus.RUNNING,
-                    "started_at": datetime.utcnow()
-                }
+        workflow = workflows_db.get(task.workflow_id) if workflows_db else None
+        try:
+            graph = build_dependency_graph(subtask_definitions, workflow)
+        except Exception:
+            # Not recorded, so discard_plans would not find it
+            for subtask_def in subtask_definitions:
+                agent_load.dequeue(subtask_def["id"])
+            raise
+        checkpoints.save_plan(task_id, subtask_definitions, graph)
+
+
+def discard_plans(task_ids: List[str]):
+    """Drop the recorded plans of tasks that will not run after all."""
+    checkpoints = get_checkpoint_store()
+    for task_id in task_ids:
+        plan = checkpoints.load_plan(task_id)
+        for subtask_def in plan["subtasks"] if plan else []:
+            agent_load.dequeue(subtask_def["id"])
+        checkpoints.clear(task_id)
+
+
+async def _run_subtask_graph(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    available_agents: List[Dict[str, Any]],
+    subtask_definitions: List[Dict[str, Any]],
+    graph: Dict[str, List[Dict[str, Any]]],
+    completed: Optional[Dict[str, Dict[str, Any]]] = None
+):
+    """
+    Run the subtask graph, dispatching every ready subtask concurrently.
+
+    A subtask is released once all of its upstream subtasks completed.
+    Subtasks downstream of a failure are marked failed without running.
+    Subtasks with a checkpoint in `completed` are not run again; their
+    stored results feed the handoffs of their dependents.
+    """
+    completed = completed or {}
+    definitions = {sd["id"]: sd for sd in subtask_definitions}
+    dependents = get_dependents(graph)
+    results: Dict[str, Dict[str, Any]] = {
+        subtask_id: checkpoint["result"] for subtask_id, checkpoint in completed.items()
+    }
+    remaining = {
+        subtask_id: sum(1 for dep in upstream if dep["subtask_id"] not in results)
+        for subtask_id, upstream in graph.items()
+    }
+
+    # Calculate total complexity for progress tracking
+    total_complexity = sum(
+        sd.get("complexity_weight", 1) for sd in subtask_definitions
+    )
+    completed_complexity = sum(
+        definitions[subtask_id].get("complexity_weight", 1) for subtask_id in results
+    )
+
+    ready = [
+        sd["id"] for sd in subtask_definitions
+        if remaining[sd["id"]] == 0 and sd["id"] not in results
+    ]
+    running: Dict[asyncio.Task, str] = {}
+    progress_events: List[Dict[str, Any]] = []
+
+    def complete(subtask_id: str, result: Dict[str, Any]):
+        nonlocal completed_complexity
+        results[subtask_id] = result
+
+        # Update progress
+        completed_complexity += definitions[subtask_id].get("complexity_weight", 1)
+        progress = (completed_complexity / total_complexity) * 100
+        task = tasks_db[task_id].model_copy(update={"progress": progress})
+        tasks_db[task_id] = task
+        progress_events.append({
+            "task_id": task_id,
+            "progress": progress,
+            "status": task.status.value
+        })
+
+        # Release dependents whose upstream handoffs are all done
+        for dependent in dependents[subtask_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    interrupt = _interrupts.setdefault(task_id, asyncio.Event())
+    try:
+        while ready or running:
+            # Stop dispatching new subtasks once the task is paused or
+            # cancelled, or preempted (back to pending) by the engine
+            if tasks_db[task_id].status in (
+                TaskStatus.PAUSED, TaskStatus.CANCELLED, TaskStatus.PENDING
+            ):
+                ready.clear()
+
+            while ready:
+                subtask_id = ready.pop(0)
+                agent_load.dequeue(subtask_id)
+                upstream = [
+                    (results[dep["subtask_id"]], dep["handoff_config"])
+                    for dep in graph[subtask_id]
+                ]
+                result = None
+                if any(not result["success"] for result, _ in upstream):
+                    # Upstream failed: the handoff never happened
+                    result = _skipped_result("Skipped: an upstream subtask failed")
+                elif _time_left(tasks_db[task_id]) == 0:
+                    result = _skipped_result("Skipped: task deadline exceeded", "timeout")
+                if result:
+                    _update_subtask(tasks_db, task_id, subtask_id, {
+                        "status": SubtaskStatus.FAILED,
+                        "output": result["summary"],
+                        "completed_at": datetime.utcnow()
+                    })
+                    complete(subtask_id, result)
+                    continue
+
+                node = asyncio.create_task(_run_subtask(
+                    task_id,
+                    tasks_db,
+                    manager,
+                    available_agents,
+                    definitions[subtask_id],
+                    upstream
+                ))
+                running[node] = subtask_id
+
+            if not running:
+                break
+
+            interrupted = asyncio.create_task(interrupt.wait())
+            done, _ = await asyncio.wait(
+                [*running.keys(), interrupted],
+                return_when=asyncio.FIRST_COMPLETED
             )
-            subtasks[i] = subtask
+            interrupted.cancel()
+            for finished in done:
+                if finished is not interrupted:
+                    complete(running.pop(finished), finished.result())
 
-            # Update current agent in task
-            task = task.model_copy(update={
-                "subtasks": subtasks,
-                "current_agent_id": subtask.agent_id
+            # Report progress made by the finished subtasks
+            while progress_events:
+                await emit_event("task_progress", progress_events.pop(0))
+
+            if interrupt.is_set():
+                interrupt.clear()
+                status = tasks_db[task_id].status
+                if status in (TaskStatus.PAUSED, TaskStatus.CANCELLED):
+                    await _cancel_subtasks(task_id, tasks_db, running, status)
+    finally:
+        _interrupts.pop(task_id, None)
+        # Subtasks that never got to run no longer count as queued work;
+        # their plan already records any reassignment
+        for subtask_def in subtask_definitions:
+            agent_load.dequeue(subtask_def["id"])
+            _reassignments.pop(subtask_def["id"], None)
+        # Never leave subtasks running behind a failed scheduler
+        for node in running:
+            node.cancel()
+
+
+async def _cancel_subtasks(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    running: Dict[asyncio.Task, str],
+    status: TaskStatus
+):
+    """
+    Cancel the in-flight subtasks of a paused or cancelled task.
+
+    Paused subtasks go back to pending so a resume runs them again;
+    cancelled ones fail.
+    """
+    for node in running:
+        node.cancel()
+    await asyncio.gather(*running.keys(), return_exceptions=True)
+
+    for subtask_id in running.values():
+        if status == TaskStatus.PAUSED:
+            _update_subtask(tasks_db, task_id, subtask_id, {
+                "status": SubtaskStatus.PENDING,
+                "started_at": None
             })
-            tasks_db[task_id] = task
+        else:
+            _update_subtask(tasks_db, task_id, subtask_id, {
+                "status": SubtaskStatus.FAILED,
+                "output": "Cancelled",
+                "completed_at": datetime.utcnow()
+            })
+    running.clear()
+
+
+async def _run_subtask(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    available_agents: List[Dict[str, Any]],
+    subtask_def: Dict[str, Any],
+    upstream: List[Tuple[Dict[str, Any], Dict[str, bool]]]
+) -> Dict[str, Any]:
+    """Run a subtask, keeping the task's execution slot informed."""
+    slot = current_slot.get()
+    if slot:
+        slot.subtask_started()
+    try:
+        return await _execute_subtask(
+            task_id, tasks_db, manager, available_agents, subtask_def, upstream
+        )
+    finally:
+        if slot:
+            slot.subtask_finished()
+
+
+async def _execute_subtask(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    available_agents: List[Dict[str, Any]],
+    subtask_def: Dict[str, Any],
+    upstream: List[Tuple[Dict[str, Any], Dict[str, bool]]]
+) -> Dict[str, Any]:
+    """Execute a single subtask once its upstream handoffs are done."""
+    subtask_id = subtask_def["id"]
+
+    # Get the agent for this subtask
+    agent_data = next(
+        (a for a in available_agents if a["id"] == subtask_def["agent_id"]),
+        None
+    )
+    if not agent_data:
+        result = _skipped_result(f"Agent not found: {subtask_def['agent_id']}")
+        _update_subtask(tasks_db, task_id, subtask_id, {
+            "status": SubtaskStatus.FAILED,
+            "output": result["summary"],
+            "completed_at": datetime.utcnow()
+        })
+        return result
 
-            # Broadcast agent state: working
+    # Wait for a human before risky steps
+    if subtask_def.get("requires_approval"):
+        try:
+            approved = await asyncio.wait_for(
+                _wait_for_approval(task_id, tasks_db, subtask_def, agent_data),
+                _time_left(tasks_db[task_id])
+            )
+        except asyncio.TimeoutError:
+            result = _skipped_result("No approval before the task deadline", "timeout")
+            _update_subtask(tasks_db, task_id, subtask_id, {
+                "status": SubtaskStatus.FAILED,
+                "output": result["summary"],
+                "completed_at": datetime.utcnow()
+            })
+            return result
+        if not approved:
+            result = _skipped_result("Denied by human reviewer")
+            _update_subtask(tasks_db, task_id, subtask_id, {
+                "status": SubtaskStatus.FAILED,
+                "output": result["summary"],
+                "completed_at": datetime.utcnow()
+            })
             await broadcast_agent_state(agent_data["id"], {
                 "agent_id": agent_data["id"],
-                "status": "working",
-                "current_action": subtask.description,
-                "current_subtask_id": subtask.id,
-                "speech_bubble": {
-                    "text": f"Working on: {subtask.description[:50]}..."
-                }
+                "status": "idle",
+                "speech_bubble": {"text": "Request denied."}
             })
+            return result
 
-            # Create and run agent executor
-            executor = AgentExecutor(
-                agent_id=agent_data["id"],
-                agent_name=agent_data["name"],
-                agent_role=agent_data["role"],
-                agent_goal=agent_data["goal"],
-                tools=agent_data["tools"],
-                llm_model=agent_data["llm_model"]
+    # Run the subtask, recovering from failures where possible. A fan-out
+    # holds its resources for all its shards; otherwise they are taken
+    # per attempt (see _execute_with_recovery)
+    if subtask_def.get("fan_out"):
+        result = await _acquire_resources(task_id, tasks_db, subtask_def, agent_data)
+        if result:
+            _update_subtask(tasks_db, task_id, subtask_id, {
+                "status": SubtaskStatus.FAILED,
+                "output": result["summary"],
+                "completed_at": datetime.utcnow()
+            })
+            return result
+        try:
+            result, agent_data, context = await _execute_fan_out(
+                task_id, tasks_db, manager, available_agents, subtask_def, agent_data, upstream
             )
+        finally:
+            get_lock_manager().release_all(subtask_id)
+    else:
+        result, agent_data, context = await _execute_with_recovery(
+            task_id, tasks_db, manager, available_agents, subtask_def, agent_data, upstream
+        )
+    subtask = next(s for s in tasks_db[task_id].subtasks if s.id == subtask_id)
 
-            # Prepare context from previous result
-            context = None
-            if previous_result:
-                context = await manager.handle_handoff(
-                    previous_result,
-                    agent_data,
-                    {"include_output": True, "include_summary": True, "include_flags": True, "include_context": True}
-                )
+    # Checkpoint completed work so a resumed task does not redo it
+    if result["success"]:
+        get_checkpoint_store().save_subtask(task_id, subtask_id, {
+            "result": result,
+            "handoff_context": context,
+            "cost_incurred": subtask.cost_incurred
+        })
 
-            # Execute the subtask
-            result = await executor.execute(subtask.description, context)
+    # Update subtask with result
+    _update_subtask(tasks_db, task_id, subtask_id, {
+        "status": SubtaskStatus.COMPLETED if result["success"] else SubtaskStatus.FAILED,
+        "output": result.get("output") if result["success"] else result.get("summary"),
+        "completed_at": datetime.utcnow()
+    })
 
-            # Update subtask with result
-            subtask = Subtask(
-                **{
-                    **subtask.model_dump(),
-                    "status": SubtaskStatus.COMPLETED if result["success"] else SubtaskStatus.FAILED,
-                    "output": result.get("output"),
-                    "cost_incurred": result.get("cost_incurred", 0),
-                    "completed_at": datetime.utcnow()
-                }
+    # Broadcast agent state: idle after completion
+    await broadcast_agent_state(agent_data["id"], {
+        "agent_id": agent_data["id"],
+        "status": "idle",
+        "speech_bubble": {
+            "text": f"Completed: {subtask_def['description'][:30]}..."
+        }
+    })
+
+    return result
+
+
+async def _execute_fan_out(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    available_agents: List[Dict[str, Any]],
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any],
+    upstream: List[Tuple[Dict[str, Any], Dict[str, bool]]]
+) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Run a fan-out subtask over the collection it names.
+
+    The collection is read from its tool and split into shards; each
+    shard becomes a subtask of its own, assigned among the agents of the
+    fan-out's role and run with the usual failure recovery, at most
+    fan_out_parallelism at a time. The shard results are then reduced
+    into the fan-out's result, which feeds the handoffs downstream like
+    any other. Returns the result, the agent and the handoff context.
+    """
+    settings = get_settings()
+    subtask_id = subtask_def["id"]
+    fan_out = subtask_def["fan_out"]
+    subtask = next(s for s in tasks_db[task_id].subtasks if s.id == subtask_id)
+    _update_subtask(tasks_db, task_id, subtask_id, {
+        "status": SubtaskStatus.RUNNING,
+        "started_at": subtask.started_at or datetime.utcnow()
+    })
+
+    listing = await execute_mock_tool(
+        fan_out["tool"], action=fan_out["action"], **fan_out.get("params", {})
+    )
+    if not listing.get("success"):
+        reason = f"Could not read {fan_out['tool']} {fan_out['action']}: {listing.get('error')}"
+        return _skipped_result(reason, "tool_failure"), agent_data, None
+
+    shard_defs = manager.assign_agents(
+        shard_subtask(subtask_def, listing["data"], settings.fan_out_shard_size),
+        available_agents
+    )
+
+    # Record the shards so their progress shows on the task
+    shard_ids = {sd["id"] for sd in shard_defs}
+    task = tasks_db[task_id]
+    tasks_db[task_id] = task.model_copy(update={"subtasks": [
+        *(s for s in task.subtasks if s.id not in shard_ids),
+        *(
+            Subtask(
+                id=sd["id"],
+                task_id=task_id,
+                agent_id=sd["agent_id"],
+                description=sd["description"],
+                parent_id=subtask_id
             )
-            subtasks[i] = subtask
+            for sd in shard_defs
+        )
+    ]})
 
-            # Update progress
-            completed_complexity += subtask_def.get("complexity_weight", 1)
-            progress = (completed_complexity / total_complexity) * 100
+    agents_by_id = {agent["id"]: agent for agent in available_agents}
+    parallelism = asyncio.Semaphore(max(1, settings.fan_out_parallelism))
 
-            # Update task
-            task = task.model_copy(update={
-                "subtasks": subtasks,
-                "progress": progress,
-                "total_cost": task.total_cost + result.get("cost_incurred", 0)
-            })
-            tasks_db[task_id] = task
+    async def run_shard(shard_def: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        async with parallelism:
+            agent_load.dequeue(shard_def["id"])
+            result, shard_agent, context = await _execute_with_recovery(
+                task_id, tasks_db, manager, available_agents, shard_def,
+                agents_by_id.get(shard_def["agent_id"], agent_data), upstream
+            )
+        _update_subtask(tasks_db, task_id, shard_def["id"], {
+            "status": SubtaskStatus.COMPLETED if result["success"] else SubtaskStatus.FAILED,
+            "output": result.get("output") if result["success"] else result.get("summary"),
+            "completed_at": datetime.utcnow()
+        })
+        await broadcast_agent_state(shard_agent["id"], {
+            "agent_id": shard_agent["id"],
+            "status": "idle",
+            "speech_bubble": {"text": f"Completed: {shard_def['description'][:30]}..."}
+        })
+        return result, context
 
-            # Broadcast agent state: idle after completion
-            await broadcast_agent_state(agent_data["id"], {
-                "agent_id": agent_data["id"],
-                "status": "idle",
-                "speech_bubble": {
-                    "text": f"Completed: {subtask.description[:30]}..."
+    try:
+        outcomes = await asyncio.gather(*(run_shard(sd) for sd in shard_defs))
+    finally:
+        for shard_def in shard_defs:
+            agent_load.dequeue(shard_def["id"])
+
+    result = manager.merge_shard_results([result for result, _ in outcomes])
+    _update_subtask(tasks_db, task_id, subtask_id, {"cost_incurred": result["cost_incurred"]})
+    context = outcomes[0][1] if outcomes else None
+    return result, agent_data, context
+
+
+async def _execute_with_recovery(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    available_agents: List[Dict[str, Any]],
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any],
+    upstream: List[Tuple[Dict[str, Any], Dict[str, bool]]]
+) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Run a subtask until it succeeds or can no longer be recovered.
+
+    Failed attempts go to the manager's handle_error: retries back off
+    exponentially with jitter, reassignments move the subtask to another
+    agent with the tools that failed, and escalations ask a human whether
+    to try once more. Retries and reassignments are drawn from the
+    task's retry budget; once it is spent, failures are escalated. A
+    subtask reassigned by a user (see reassign_subtask) moves to the new
+    agent before its next attempt without drawing from the budget. The
+    subtask's resources are locked for each attempt and released in
+    between, so nobody waits on them through a backoff or an escalation.
+
+    Returns:
+        The final result, the agent that produced it and the handoff
+        context it ran with
+    """
+    settings = get_settings()
+    subtask_id = subtask_def["id"]
+    tried_agents = [agent_data["id"]]
+    agent_attempts = 0
+    escalated = False
+    transferred = None
+
+    try:
+        while True:
+            # Switch agents if the subtask was reassigned
+            reassignment = _reassignments.pop(subtask_id, None)
+            new_agent = reassignment and next(
+                (a for a in available_agents if a["id"] == reassignment["agent_id"]), None
+            )
+            if new_agent and new_agent["id"] != agent_data["id"]:
+                await emit_event("subtask_recovery", {
+                    "task_id": task_id,
+                    "subtask_id": subtask_id,
+                    "agent_id": agent_data["id"],
+                    "action": "reassign",
+                    "message": f"Reassigned to {new_agent['name']}"
+                })
+                await broadcast_agent_state(agent_data["id"], {
+                    "agent_id": agent_data["id"],
+                    "status": "idle",
+                    "speech_bubble": {"text": f"Handing this over to {new_agent['name']}."}
+                })
+                agent_data = new_agent
+                tried_agents.append(agent_data["id"])
+                agent_attempts = 0
+                _update_subtask(tasks_db, task_id, subtask_id, {"agent_id": agent_data["id"]})
+            if reassignment and not reassignment["transfer_context"]:
+                transferred = None
+
+            agent_attempts += 1
+            result = await _acquire_resources(task_id, tasks_db, subtask_def, agent_data)
+            if result:
+                return result, agent_data, None
+            try:
+                result, context = await _attempt_subtask(
+                    task_id, tasks_db, manager, subtask_def, agent_data, upstream, transferred
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result, context = _skipped_result(str(e), "exception"), None
+            finally:
+                get_lock_manager().release_all(subtask_id)
+
+            if result["success"]:
+                return result, agent_data, context
+
+            if result["error"]["type"] == "reassigned":
+                # Stopped for a reassignment: carry the finished tool calls over
+                transferred = {
+                    "from_agent_id": agent_data["id"],
+                    "tool_results": result["tool_results"]
                 }
+                continue
+
+            error = result["error"]
+            decision = await manager.handle_error(
+                error,
+                {
+                    **subtask_def,
+                    "agent_id": agent_data["id"],
+                    "required_tools": error.get("tools", []),
+                    "attempts": agent_attempts,
+                    "max_retries": settings.max_subtask_retries,
+                    "excluded_agent_ids": tried_agents
+                },
+                available_agents
+            )
+            action = decision["action"]
+            if action != "escalate" and tasks_db[task_id].retries >= settings.task_retry_budget:
+                action = "escalate"
+                decision = {**decision, "message": f"Retry budget spent: {error['message']}"}
+
+            await emit_event("subtask_recovery", {
+                "task_id": task_id,
+                "subtask_id": subtask_id,
+                "agent_id": agent_data["id"],
+                "action": action,
+                "error": error,
+                "message": decision["message"]
             })
 
-            # Store result for next handoff
-            previous_result = result
+            if action == "retry":
+                delay = _retry_delay(agent_attempts)
+                time_left = _time_left(tasks_db[task_id])
+                if time_left is not None and delay >= time_left:
+                    return result, agent_data, context
+                await broadcast_agent_state(agent_data["id"], {
+                    "agent_id": agent_data["id"],
+                    "status": "working",
+                    "current_subtask_id": subtask_id,
+                    "speech_bubble": {"text": f"Hit a snag, retrying: {error['message'][:40]}"}
+                })
+                await asyncio.sleep(delay)
 
-            # Small delay between subtasks
-            await asyncio.sleep(0.5)
+            elif action == "reassign":
+                await broadcast_agent_state(agent_data["id"], {
+                    "agent_id": agent_data["id"],
+                    "status": "idle",
+                    "speech_bubble": {"text": "Handing this one off."}
+                })
+                agent_data = next(a for a in available_agents if a["id"] == decision["new_agent_id"])
+                tried_agents.append(agent_data["id"])
+                agent_attempts = 0
+                _update_subtask(tasks_db, task_id, subtask_id, {"agent_id": agent_data["id"]})
 
-        # Mark task as completed
-        task = tasks_db[task_id]
-        if task.status != TaskStatus.PAUSED:
-            task = task.model_copy(update={
-                "status": TaskStatus.COMPLETED,
-                "completed_at": datetime.utcnow(),
-                "progress": 100
+            else:
+                # A human gets one say per subtask; a second failure is final
+                if escalated:
+                    return result, agent_data, context
+                escalated = True
+                try:
+                    approved = await asyncio.wait_for(
+                        _wait_for_approval(
+                            task_id, tasks_db, subtask_def, agent_data,
+                            action=f"Retry failed step: {subtask_def['description']}",
+                            reason=decision["message"]
+                        ),
+                        _time_left(tasks_db[task_id])
+                    )
+                except asyncio.TimeoutError:
+                    approved = False
+                if not approved:
+                    return result, agent_data, context
+                agent_attempts = 0
+                continue
+
+            tasks_db[task_id] = tasks_db[task_id].model_copy(update={
+                "retries": tasks_db[task_id].retries + 1
             })
-            tasks_db[task_id] = task
+    finally:
+        _reassignments.pop(subtask_id, None)
 
-    except Exception as e:
-        # Mark task as failed
-        task = tasks_db[task_id]
-        task = task.model_copy(update={
-            "status": TaskStatus.FAILED
+
+async def _attempt_subtask(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    manager: ManagerAgent,
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any],
+    upstream: List[Tuple[Dict[str, Any], Dict[str, bool]]],
+    transferred: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Run one attempt of a subtask on an agent.
+
+    The attempt's cost is charged to the subtask and the task whether or
+    not it succeeded. `transferred` is the work of the agent the subtask
+    was reassigned from, handed over in the context. Returns the result
+    and the handoff context used.
+    """
+    subtask_id = subtask_def["id"]
+    subtask = next(s for s in tasks_db[task_id].subtasks if s.id == subtask_id)
+
+    # Update subtask status and current agent in task
+    _update_subtask(tasks_db, task_id, subtask_id, {
+        "status": SubtaskStatus.RUNNING,
+        "started_at": subtask.started_at or datetime.utcnow(),
+        "attempts": subtask.attempts + 1
+    }, {"current_agent_id": agent_data["id"]})
+
+    # Broadcast agent state: working
+    await broadcast_agent_state(agent_data["id"], {
+        "agent_id": agent_data["id"],
+        "status": "working",
+        "current_action": subtask_def["description"],
+        "current_subtask_id": subtask_id,
+        "speech_bubble": {
+            "text": f"Working on: {subtask_def['description'][:50]}..."
+        }
+    })
+
+    # Create and run agent executor
+    executor = AgentExecutor(
+        agent_id=agent_data["id"],
+        agent_name=agent_data["name"],
+        agent_role=agent_data["role"],
+        agent_goal=agent_data["goal"],
+        tools=agent_data["tools"],
+        llm_model=agent_data["llm_model"],
+        max_tool_concurrency=get_settings().max_tool_concurrency,
+        tool_timeout=get_settings().tool_timeout_seconds or None,
+        llm_client=get_llm_client() if get_settings().use_llm else None
+    )
+
+    # Prepare context from the upstream results
+    context = None
+    if upstream:
+        contexts = [
+            await manager.handle_handoff(result, agent_data, handoff_config)
+            for result, handoff_config in upstream
+        ]
+        context = manager.merge_handoff_contexts(contexts)
+    if transferred:
+        context = {**(context or {}), "transferred_work": transferred}
+
+    # Execute the subtask, stopping early if it gets reassigned meanwhile
+    _executors[subtask_id] = executor
+    if subtask_id in _reassignments:
+        executor.request_handoff()
+    agent_load.started(agent_data["id"])
+    started = time.perf_counter()
+    duration = None
+    try:
+        try:
+            if get_settings().stream_agent_output:
+                result = await _stream_attempt(
+                    task_id, tasks_db, subtask_id, agent_data["id"], executor.execute_stream(
+                        subtask_def["description"],
+                        context,
+                        timeout=_subtask_timeout(tasks_db[task_id]),
+                        items=subtask_def.get("items")
+                    )
+                )
+            else:
+                result = await executor.execute(
+                    subtask_def["description"],
+                    context,
+                    timeout=_subtask_timeout(tasks_db[task_id]),
+                    items=subtask_def.get("items")
+                )
+            duration = time.perf_counter() - started
+        finally:
+            # However the attempt ended; only complete runs count towards latency
+            agent_load.finished(agent_data["id"], duration)
+    except asyncio.CancelledError:
+        # Paused or cancelled mid-flight
+        await broadcast_agent_state(agent_data["id"], {
+            "agent_id": agent_data["id"],
+            "status": "idle",
+            "speech_bubble": {"text": "Stopped."}
         })
-        tasks_db[task_id] = task
-        raise e
+        raise
+    finally:
+        _executors.pop(subtask_id, None)
+
+    cost = result.get("cost_incurred", 0)
+    task = tasks_db[task_id]
+    subtask = next(s for s in task.subtasks if s.id == subtask_id)
+    _update_subtask(tasks_db, task_id, subtask_id, {
+        "cost_incurred": subtask.cost_incurred + cost
+    }, {
+        "total_cost": task.total_cost + cost,
+        "llm_calls": task.llm_calls + result.get("llm_calls", 0),
+        "llm_cache_hits": task.llm_cache_hits + result.get("llm_cache_hits", 0),
+        "saved_cost": task.saved_cost + result.get("cost_saved", 0)
+    })
+
+    return result, context
+
+
+async def _stream_attempt(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    subtask_id: str,
+    agent_id: str,
+    chunks: AsyncIterator[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Consume a streaming execution and return its result.
+
+    Chunks are collected and flushed every agent_output_interval_seconds:
+    output chunks are appended to the subtask's output, and the new
+    output and reasoning text go to clients in one agent_output event.
+    The result's output is the output assembled that way.
+    """
+    pending: Dict[str, List[str]] = {"output": [], "reasoning": []}
+    _update_subtask(tasks_db, task_id, subtask_id, {"output": ""})
+
+    async def flush(done: bool = False):
+        output, reasoning = "".join(pending["output"]), "".join(pending["reasoning"])
+        pending["output"].clear()
+        pending["reasoning"].clear()
+        if not (output or reasoning or done):
+            return
+        if output:
+            subtask = next(s for s in tasks_db[task_id].subtasks if s.id == subtask_id)
+            _update_subtask(tasks_db, task_id, subtask_id, {"output": subtask.output + output})
+        await emit_event("agent_output", {
+            "task_id": task_id,
+            "subtask_id": subtask_id,
+            "agent_id": agent_id,
+            "output": output,
+            "reasoning": reasoning,
+            "done": done
+        })
+
+    flushing: List[asyncio.Future] = []
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(get_settings().agent_output_interval_seconds)
+            # Stopping the flusher must not drop a flush half sent
+            flushing[:] = [asyncio.ensure_future(flush())]
+            await asyncio.shield(flushing[0])
+
+    result: Dict[str, Any] = {}
+    flusher = asyncio.ensure_future(flush_periodically())
+    try:
+        async for chunk in chunks:
+            if chunk["type"] == "result":
+                result = chunk["result"]
+            else:
+                pending[chunk["type"]].append(chunk["text"])
+    finally:
+        flusher.cancel()
+    # The last output goes out before the event that says it is done
+    await asyncio.gather(*flushing, return_exceptions=True)
+    await flush(done=True)
+
+    if result["success"]:
+        subtask = next(s for s in tasks_db[task_id].subtasks if s.id == subtask_id)
+        result = {**result, "output": subtask.output}
+    return result
+
+
+async def _acquire_resources(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Lock the resources a subtask declares, waiting for other subtasks to
+    release them.
+
+    Resources are scoped to the task's workflow and taken in name order.
+    If waiting would deadlock, everything is released and tried again
+    after a backoff. Returns a failure result, with nothing held, if the
+    resources could not be had before the task's deadline, otherwise None.
+    """
+    if not subtask_def.get("resources"):
+        return None
+    try:
+        result = await asyncio.wait_for(
+            _lock_resources(task_id, tasks_db, subtask_def, agent_data),
+            _time_left(tasks_db[task_id])
+        )
+    except asyncio.TimeoutError:
+        result = _skipped_result("Resources not free before the task deadline", "timeout")
+    if result:
+        get_lock_manager().release_all(subtask_def["id"])
+    return result
+
+
+async def _lock_resources(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """Take a subtask's resources, retrying after deadlocks (see _acquire_resources)."""
+    resources = subtask_def["resources"]
+    locks = get_lock_manager()
+    owner = subtask_def["id"]
+    workflow_id = tasks_db[task_id].workflow_id
+    settings = get_settings()
+
+    slot = current_slot.get()
+    attempt = 0
+    while True:
+        try:
+            for name in sorted(resources):
+                resource, mode = f"{workflow_id}:{name}", resources[name]
+                if await locks.try_acquire(owner, resource, mode):
+                    continue
+
+                # Held by another subtask: hand the task's slot back while waiting
+                await broadcast_agent_state(agent_data["id"], {
+                    "agent_id": agent_data["id"],
+                    "status": "idle",
+                    "current_subtask_id": owner,
+                    "speech_bubble": {"text": f"Waiting for {name}..."}
+                })
+                if slot:
+                    slot.park()
+                try:
+                    await locks.acquire(owner, resource, mode)
+                finally:
+                    if slot:
+                        await slot.unpark()
+            return None
+        except DeadlockError as e:
+            locks.release_all(owner)
+            attempt += 1
+            if attempt > settings.max_subtask_retries:
+                return _skipped_result(str(e), "deadlock")
+            await asyncio.sleep(_retry_delay(attempt))
+
+
+async def _wait_for_approval(
+    task_id: str,
+    tasks_db: Dict[str, Task],
+    subtask_def: Dict[str, Any],
+    agent_data: Dict[str, Any],
+    action: Optional[str] = None,
+    reason: Optional[str] = None
+) -> bool:
+    """
+    Park a subtask until a human approves or denies it.
+
+    The subtask waits on the approval gate rather than polling, and the
+    task's execution slot is handed back while nothing else of the task
+    is running. Returns True if the request was approved.
+
+    The request asks to approve `action` (the subtask itself by default).
+    """
+    # Imported here: the routes package imports this module
+    from ..routes.approvals import approvals_db, create_approval_request
+
+    action = action or subtask_def["description"]
+
+    # A resumed subtask reuses the request it made before it was paused
+    approval = next(
+        (a for a in approvals_db.values()
+         if a.task_id == task_id and a.subtask_id == subtask_def["id"] and a.action == action),
+        None
+    )
+    if approval and approval.status != ApprovalStatus.PENDING:
+        return approval.status == ApprovalStatus.APPROVED
+
+    gate = get_approval_gate()
+    if approval:
+        gate.register(approval.id)
+    else:
+        approval = create_approval_request(
+            task_id=task_id,
+            subtask_id=subtask_def["id"],
+            agent_id=agent_data["id"],
+            action=action,
+            reason=reason or f"{agent_data['name']} needs approval before: {subtask_def['description']}"
+        )
+        gate.register(approval.id)
+        await emit_event("approval_request", approval.model_dump(mode="json"))
+
+    _update_subtask(tasks_db, task_id, subtask_def["id"], {
+        "status": SubtaskStatus.WAITING_APPROVAL
+    })
+    await broadcast_agent_state(agent_data["id"], {
+        "agent_id": agent_data["id"],
+        "status": "waiting_approval",
+        "current_subtask_id": subtask_def["id"],
+        "speech_bubble": {
+            "text": f"Waiting for approval: {subtask_def['description'][:40]}..."
+        }
+    })
+
+    slot = current_slot.get()
+    if slot:
+        slot.park()
+    try:
+        return await gate.wait(approval.id)
+    finally:
+        if slot:
+            await slot.unpark()
+
+
+def _update_subtask(
+    tasks_db: Dict[str, Task],
+    task_id: str,
+    subtask_id: str,
+    updates: Dict[str, Any],
+    task_updates: Optional[Dict[str, Any]] = None
+):
+    """Apply updates to one subtask (and optionally its task) in the store."""
+    task = tasks_db[task_id]
+    subtasks = [
+        s.model_copy(update=updates) if s.id == subtask_id else s
+        for s in task.subtasks
+    ]
+    task = task.model_copy(update={"subtasks": subtasks, **(task_updates or {})})
+    tasks_db[task_id] = task
+
+
+def _skipped_result(reason: str, error_type: str = "skipped") -> Dict[str, Any]:
+    """Result for a subtask that could not run."""
+    return {
+        "success": False,
+        "output": None,
+        "summary": reason,
+        "flags": [{"type": "error", "message": reason}],
+        "tools_used": [],
+        "cost_incurred": 0.0,
+        "execution_time_seconds": 0.0,
+        "error": {"type": error_type, "message": reason}
+    }
+
+
+def _retry_delay(attempt: int) -> float:
+    """Backoff before retry number `attempt`: exponential, capped, with jitter."""
+    settings = get_settings()
+    delay = min(
+        settings.retry_backoff_max_seconds,
+        settings.retry_backoff_seconds * 2 ** (attempt - 1)
+    )
+    # Keep half the delay and randomize the rest so retries spread out
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _time_left(task: Task) -> Optional[float]:
+    """Seconds until the task deadline (never negative), or None without one."""
+    if task.deadline is None:
+        return None
+    return max(0.0, (task.deadline - datetime.utcnow()).total_seconds())
+
+
+def _subtask_timeout(task: Task) -> Optional[float]:
+    """Time a subtask execution may take: the subtask timeout, capped by the task deadline."""
+    timeout = get_settings().subtask_timeout_seconds or None
+    time_left = _time_left(task)
+    if time_left is not None:
+        timeout = time_left if timeout is None else min(timeout, time_left)
+    return timeout
 
 
 def get_agent_states() -> Dict[str, Dict[str, Any]]:
@@ -0,0 +1,141 @@
+"""
+Plan cache - reuses task decompositions for tasks the same squad has
+already planned.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple, Set
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import time
+
+from ..config import get_settings
+from .task_graph import copy_plan
+
+
+PlanKey = Tuple[str, str]
+
+
+class PlanCache:
+    """
+    Bounded cache of decomposition plans.
+
+    Plans are keyed by the normalized task description and a fingerprint
+    of the roster they were planned for (agent ids, roles and tools), so
+    a changed squad never gets a stale plan. The least recently used
+    plan is evicted once `max_entries` are stored, and plans expire
+    after `ttl_seconds`. Every plan handed out is a copy with fresh
+    subtask ids.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (stored at, subtask definitions, agent ids of the roster)
+        self._plans: "OrderedDict[PlanKey, Tuple[float, List[Dict[str, Any]], List[str]]]" = OrderedDict()
+        self._keys_by_agent: Dict[str, Set[PlanKey]] = {}
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def key(self, task_description: str, agents: List[Dict[str, Any]]) -> PlanKey:
+        """Cache key of a task description planned for a roster."""
+        return normalize_description(task_description), roster_fingerprint(agents)
+
+    def get(self, key: PlanKey) -> Optional[List[Dict[str, Any]]]:
+        """A copy of the cached plan, or None."""
+        entry = self._plans.get(key)
+        if entry is not None and self._expired(entry[0]):
+            self._drop(key)
+            self._expirations += 1
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._plans.move_to_end(key)
+        self._hits += 1
+        return copy_plan(entry[1], {})[0]
+
+    def put(self, key: PlanKey, subtasks: List[Dict[str, Any]], agent_ids: List[str]):
+        """Cache a plan made for the roster with `agent_ids`."""
+        if self.max_entries <= 0:
+            return
+        if key in self._plans:
+            self._drop(key)
+        self._plans[key] = (time.monotonic(), copy_plan(subtasks, {})[0], agent_ids)
+        for agent_id in agent_ids:
+            self._keys_by_agent.setdefault(agent_id, set()).add(key)
+
+        while len(self._plans) > self.max_entries:
+            self._drop(next(iter(self._plans)))
+            self._evictions += 1
+
+    def invalidate_agent(self, agent_id: str):
+        """Forget every plan made for a roster the agent is part of."""
+        for key in list(self._keys_by_agent.get(agent_id, ())):
+            self._drop(key)
+            self._invalidations += 1
+
+    def clear(self):
+        self._plans.clear()
+        self._keys_by_agent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counts."""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._plans),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "invalidations": self._invalidations,
+        }
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds
+
+    def _drop(self, key: PlanKey):
+        _, _, agent_ids = self._plans.pop(key)
+        for agent_id in agent_ids:
+            keys = self._keys_by_agent.get(agent_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_agent[agent_id]
+
+
+def normalize_description(task_description: str) -> str:
+    """Lowercase, with runs of whitespace collapsed and edge punctuation trimmed."""
+    return re.sub(r"\s+", " ", task_description.lower()).strip(" .!?")
+
+
+def roster_fingerprint(agents: List[Dict[str, Any]]) -> str:
+    """Digest of the agents' ids, roles and tools."""
+    roster = sorted(
+        (agent["id"], agent.get("role", ""), sorted(agent.get("tools", [])))
+        for agent in agents
+    )
+    return hashlib.sha1(json.dumps(roster).encode()).hexdigest()
+
+
+_cache: Optional[PlanCache] = None
+
+
+def get_plan_cache() -> PlanCache:
+    """Get the shared plan cache."""
+    global _cache
+    if _cache is None:
+        settings = get_settings()
+        _cache = PlanCache(
+            max_entries=settings.plan_cache_size,
+            ttl_seconds=settings.plan_cache_ttl_seconds or None
+        )
+    return _cache
@@ -0,0 +1,606 @@
+"""
+Process pool service - runs tasks in worker processes sharded by user.
+
+The API process keeps the authoritative stores. Each worker process runs
+execute_task against a local copy of the task and streams every task
+write and client event back over a multiprocessing queue, so the API
+process can mirror progress and forward events to connected clients.
+"""
+
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime
+from enum import Enum
+import asyncio
+import multiprocessing
+import queue
+import uuid
+import zlib
+
+from ..models.task import Task, TaskStatus, SubtaskStatus
+from ..models.workflow import Workflow
+from ..models.approval import ApprovalRequest, ApprovalStatus
+from . import orchestrator
+from .checkpoints import CheckpointStore, get_checkpoint_store, set_checkpoint_store
+from .approval_gate import get_approval_gate
+from .resource_locks import DeadlockError, LockMode, ResourceLockManager, get_lock_manager, set_lock_manager
+from .execution_slots import ExecutionSlot, current_slot
+
+
+class WorkerProcessError(Exception):
+    """Raised when a task fails inside a worker process."""
+
+
+class WorkerCrashedError(WorkerProcessError):
+    """Raised when a worker process dies while running a task."""
+
+
+class ShardedProcessExecutor:
+    """
+    Shards task execution across worker processes.
+
+    Tasks of the same user always go to the same worker so per-process
+    caches stay warm. Messages to a worker go through its own inbox queue;
+    all workers report back through one shared outbox queue.
+
+    Checkpoints are mirrored into the API process, so a task whose worker
+    dies is restarted on the respawned worker from its last checkpoint.
+    Resource locks are taken from the API process's lock table, so
+    subtasks are serialized across workers and users.
+    """
+
+    def __init__(self, processes: int = 2, max_restarts: int = 1):
+        self.processes = max(1, processes)
+        self.max_restarts = max_restarts
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: list = []
+        self._inboxes: list = []
+        self._outbox = None
+        self._reader: Optional[asyncio.Task] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stores: Dict[str, Dict[str, Task]] = {}
+        self._shards: Dict[str, int] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._control_updates: Dict[str, Dict[str, Any]] = {}
+        self._slots: Dict[str, ExecutionSlot] = {}
+        self._lock_requests: Dict[str, Tuple[int, asyncio.Task]] = {}
+
+    def shard_for(self, user_id: str) -> int:
+        """Stable shard for a user (the same across restarts)."""
+        return zlib.crc32(user_id.encode()) % self.processes
+
+    async def start(self):
+        """Spawn the worker processes and start listening for events."""
+        if self._workers:
+            return
+        self._outbox = self._context.Queue()
+        for shard in range(self.processes):
+            self._inboxes.append(self._context.Queue())
+            self._workers.append(self._spawn(shard))
+        self._reader = asyncio.create_task(self._read_events())
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self, timeout: float = 5.0):
+        """Ask the workers to exit and stop listening."""
+        if self._supervisor:
+            self._supervisor.cancel()
+        for inbox in self._inboxes:
+            inbox.put({"type": "stop"})
+
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join, timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+        if self._reader:
+            self._outbox.put(None)
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+        for task_id, future in self._pending.items():
+            if not future.done():
+                future.set_exception(WorkerProcessError("Process pool stopped"))
+        self._workers, self._inboxes = [], []
+        self._pending.clear()
+
+    async def run(
+        self,
+        task_id: str,
+        tasks_db: Dict[str, Task],
+        workflows_db: Optional[Dict[str, Workflow]] = None,
+        slot: Optional[ExecutionSlot] = None
+    ):
+        """
+        Run a task on its user's worker and wait until it finishes.
+
+        `slot` is the engine slot the task runs in; the worker asks for it
+        to be handed back and re-acquired as the task parks and continues.
+        """
+        # Imported here: the routes package imports the services
+        from ..routes.approvals import approvals_db
+
+        task = tasks_db[task_id]
+        workflow = workflows_db.get(task.workflow_id) if workflows_db else None
+        shard = self.shard_for(task.user_id)
+        self._stores[task_id] = tasks_db
+        self._shards[task_id] = shard
+        if slot:
+            self._slots[task_id] = slot
+        try:
+            for attempt in range(self.max_restarts + 1):
+                future = asyncio.get_running_loop().create_future()
+                self._pending[task_id] = future
+                self._inboxes[shard].put({
+                    "type": "run",
+                    "task": tasks_db[task_id].model_dump(mode="json"),
+                    "workflow": workflow.model_dump(mode="json") if workflow else None,
+                    "checkpoint": get_checkpoint_store().export(task_id),
+                    # Decisions made while the task was not running here
+                    "approvals": [
+                        approval.model_dump(mode="json") for approval in approvals_db.values()
+                        if approval.task_id == task_id
+                    ]
+                })
+                try:
+                    await future
+                    return
+                except WorkerCrashedError:
+                    # The dead worker's subtasks no longer hold anything
+                    self._release_locks(tasks_db[task_id])
+                    if attempt == self.max_restarts:
+                        raise
+                    print(f"Restarting task {task_id} from its last checkpoint")
+        except WorkerProcessError:
+            tasks_db[task_id] = tasks_db[task_id].model_copy(update={"status": TaskStatus.FAILED})
+            # Its checkpoint is kept, but its subtasks are no longer queued
+            plan = get_checkpoint_store().load_plan(task_id)
+            for subtask_def in plan["subtasks"] if plan else []:
+                orchestrator.agent_load.dequeue(subtask_def["id"])
+            raise
+        finally:
+            self._pending.pop(task_id, None)
+            self._stores.pop(task_id, None)
+            self._shards.pop(task_id, None)
+            self._control_updates.pop(task_id, None)
+            self._slots.pop(task_id, None)
+
+    def update_task(self, task_id: str, updates: Dict[str, Any]):
+        """
+        Forward a change made by the API (e.g. pause) to the running worker.
+
+        Until the worker reports a task state that includes the change, it
+        is re-applied on top of every snapshot the worker sends back.
+        """
+        shard = self._shards.get(task_id)
+        if shard is None:
+            return
+        self._control_updates.setdefault(task_id, {}).update(updates)
+        self._inboxes[shard].put({
+            "type": "update",
+            "task_id": task_id,
+            "updates": _to_json(updates)
+        })
+
+    def reassign_subtask(
+        self,
+        task_id: str,
+        subtask_id: str,
+        new_agent_id: str,
+        transfer_context: bool = True
+    ) -> bool:
+        """Forward a reassignment to the worker running the task, if any."""
+        shard = self._shards.get(task_id)
+        if shard is None:
+            return False
+        self._inboxes[shard].put({
+            "type": "reassign",
+            "task_id": task_id,
+            "subtask_id": subtask_id,
+            "new_agent_id": new_agent_id,
+            "transfer_context": transfer_context
+        })
+        return True
+
+    def resolve_approval(self, task_id: str, approval_id: str, approved: bool):
+        """
+        Deliver an approval decision to the worker running the task.
+
+        A task that is not running (e.g. paused) gets the decision from
+        the approvals sent along when it runs again.
+        """
+        shard = self._shards.get(task_id)
+        if shard is None:
+            return
+        self._inboxes[shard].put({
+            "type": "approval",
+            "approval_id": approval_id,
+            "approved": approved
+        })
+
+    def _spawn(self, shard: int):
+        worker = self._context.Process(
+            target=_worker_main,
+            args=(shard, self._inboxes[shard], self._outbox),
+            name=f"swarmville-worker-{shard}",
+            daemon=True
+        )
+        worker.start()
+        return worker
+
+    async def _read_events(self):
+        """Apply events sent back by the workers."""
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._outbox.get)
+            if message is None:
+                return
+            try:
+                await self._handle_message(message)
+            except Exception as e:
+                print(f"Failed to handle worker message {message.get('type')}: {e}")
+
+    async def _handle_message(self, message: Dict[str, Any]):
+        kind = message["type"]
+
+        if kind == "task":
+            task = Task.model_validate(message["task"])
+            # Subtasks planned here leave their agents' queues once the
+            # worker has started (or skipped) them
+            for subtask in task.subtasks:
+                if subtask.status != SubtaskStatus.PENDING:
+                    orchestrator.agent_load.dequeue(subtask.id)
+            store = self._stores.get(task.id)
+            if store is None:
+                return
+            control = self._control_updates.get(task.id)
+            if control:
+                if all(getattr(task, k) == v for k, v in control.items()):
+                    del self._control_updates[task.id]
+                else:
+                    task = task.model_copy(update=control)
+            store[task.id] = task
+
+        elif kind == "event":
+            if message["event"] == "approval_request":
+                # Imported here: the routes package imports the services
+                from ..routes.approvals import approvals_db
+                approval = ApprovalRequest.model_validate(message["data"])
+                approvals_db[approval.id] = approval
+
+            if message["event"] == "agent_state_update":
+                data = message["data"]
+                await orchestrator.broadcast_agent_state(data["agent_id"], data["state"])
+            else:
+                await orchestrator.emit_event(message["event"], message["data"])
+
+        elif kind == "slot":
+            slot = self._slots.get(message["task_id"])
+            if message["action"] == "release":
+                if slot:
+                    slot.release()
+            else:
+                asyncio.create_task(self._reacquire_slot(message["task_id"], slot))
+
+        elif kind == "lock":
+            self._handle_lock(message)
+
+        elif kind == "checkpoint":
+            if message["checkpoint"] is None:
+                # Finished or cancelled: what is left of its plan will not run
+                orchestrator.discard_plans([message["task_id"]])
+            else:
+                get_checkpoint_store().restore(message["task_id"], message["checkpoint"])
+
+        elif kind == "done":
+            future = self._pending.get(message["task_id"])
+            if future and not future.done():
+                if message.get("error"):
+                    future.set_exception(WorkerProcessError(message["error"]))
+                else:
+                    future.set_result(None)
+
+    def _handle_lock(self, message: Dict[str, Any]):
+        """Apply a worker's lock request to the lock table here."""
+        locks = get_lock_manager()
+        action = message["action"]
+        if action == "release":
+            locks.release(message["owner"], message["resource"])
+        elif action == "release_all":
+            locks.release_all(message["owner"])
+        elif action == "cancel":
+            request = self._lock_requests.pop(message["request_id"], None)
+            if request:
+                request[1].cancel()
+            else:
+                # Granted as the worker gave up: give it back
+                locks.release(message["owner"], message["resource"])
+        else:
+            self._lock_requests[message["request_id"]] = (
+                message["shard"], asyncio.create_task(self._acquire_lock(message))
+            )
+
+    async def _acquire_lock(self, message: Dict[str, Any]):
+        """Take a lock for a worker, then tell it the outcome."""
+        locks = get_lock_manager()
+        owner, resource, mode = message["owner"], message["resource"], message["mode"]
+        reply = {"type": "lock_result", "request_id": message["request_id"], "acquired": True}
+        try:
+            if message["action"] == "try_acquire":
+                reply["acquired"] = await locks.try_acquire(owner, resource, mode)
+            else:
+                await locks.acquire(owner, resource, mode)
+        except DeadlockError as e:
+            reply.update({"acquired": False, "deadlock": e.cycle})
+        finally:
+            self._lock_requests.pop(message["request_id"], None)
+        self._inboxes[message["shard"]].put(reply)
+
+    def _release_locks(self, task: Task):
+        for subtask in task.subtasks:
+            get_lock_manager().release_all(subtask.id)
+
+    async def _reacquire_slot(self, task_id: str, slot: Optional[ExecutionSlot]):
+        """Take the task's slot back, then let its worker continue."""
+        if slot:
+            await slot.reacquire()
+        shard = self._shards.get(task_id)
+        if shard is not None:
+            self._inboxes[shard].put({"type": "slot_acquired", "task_id": task_id})
+
+    async def _supervise(self):
+        """Restart dead workers and fail the tasks they were running."""
+        while True:
+            await asyncio.sleep(1.0)
+            for shard, worker in enumerate(self._workers):
+                if worker.is_alive():
+                    continue
+                print(f"Worker {shard} exited ({worker.exitcode}), restarting")
+                # The dead worker may still hold the inbox lock
+                self._inboxes[shard] = self._context.Queue()
+                for request_id, (request_shard, request) in list(self._lock_requests.items()):
+                    if request_shard == shard:
+                        del self._lock_requests[request_id]
+                        request.cancel()
+                for task_id, task_shard in list(self._shards.items()):
+                    future = self._pending.get(task_id)
+                    if task_shard == shard and future and not future.done():
+                        future.set_exception(WorkerCrashedError(f"Worker {shard} died"))
+                self._workers[shard] = self._spawn(shard)
+
+
+def _to_json(updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Make task field updates safe to send to another process."""
+    converted = {}
+    for key, value in updates.items():
+        if isinstance(value, Enum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        converted[key] = value
+    return converted
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+class _ReportingTaskStore(dict):
+    """Task store that reports every write back to the API process."""
+
+    def __init__(self, outbox):
+        super().__init__()
+        self._outbox = outbox
+
+    def __setitem__(self, task_id: str, task: Task):
+        super().__setitem__(task_id, task)
+        self._outbox.put({"type": "task", "task": task.model_dump(mode="json")})
+
+
+class _ReportingCheckpointStore(CheckpointStore):
+    """Checkpoint store that mirrors every change to the API process."""
+
+    def __init__(self, outbox):
+        super().__init__()
+        self._outbox = outbox
+
+    def save_plan(self, task_id, subtask_definitions, graph):
+        super().save_plan(task_id, subtask_definitions, graph)
+        self._report(task_id)
+
+    def assign_agent(self, task_id, subtask_id, agent_id):
+        super().assign_agent(task_id, subtask_id, agent_id)
+        self._report(task_id)
+
+    def save_subtask(self, task_id, subtask_id, checkpoint):
+        super().save_subtask(task_id, subtask_id, checkpoint)
+        self._report(task_id)
+
+    def clear(self, task_id):
+        super().clear(task_id)
+        self._outbox.put({"type": "checkpoint", "task_id": task_id, "checkpoint": None})
+
+    def _report(self, task_id):
+        self._outbox.put({
+            "type": "checkpoint",
+            "task_id": task_id,
+            "checkpoint": self.export(task_id)
+        })
+
+
+class _RemoteSlot(ExecutionSlot):
+    """Execution slot whose engine side lives in the API process."""
+
+    def __init__(self, task_id: str, outbox, waiters: Dict[str, asyncio.Future]):
+        super().__init__()
+        self._task_id = task_id
+        self._outbox = outbox
+        self._waiters = waiters
+
+    def _release(self):
+        self._outbox.put({"type": "slot", "task_id": self._task_id, "action": "release"})
+
+    async def _acquire(self):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[self._task_id] = future
+        self._outbox.put({"type": "slot", "task_id": self._task_id, "action": "acquire"})
+        try:
+            await future
+        finally:
+            self._waiters.pop(self._task_id, None)
+
+
+class _RemoteLockManager(ResourceLockManager):
+    """
+    Lock manager whose lock table lives in the API process.
+
+    Acquiring asks the API process and waits for its answer; releases
+    are sent without waiting. The table and its metrics are only there.
+    """
+
+    def __init__(self, shard: int, outbox, waiters: Dict[str, asyncio.Future]):
+        super().__init__()
+        self._shard = shard
+        self._outbox = outbox
+        self._waiters = waiters
+
+    async def acquire(self, owner: str, resource: str, mode: LockMode = LockMode.WRITE):
+        await self._request("acquire", owner, resource, mode)
+
+    async def try_acquire(self, owner: str, resource: str, mode: LockMode = LockMode.WRITE) -> bool:
+        return await self._request("try_acquire", owner, resource, mode)
+
+    def release(self, owner: str, resource: str):
+        self._outbox.put({"type": "lock", "action": "release", "owner": owner, "resource": resource})
+
+    def release_all(self, owner: str):
+        self._outbox.put({"type": "lock", "action": "release_all", "owner": owner})
+
+    async def _request(self, action: str, owner: str, resource: str, mode: LockMode) -> bool:
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = future
+        self._outbox.put({
+            "type": "lock",
+            "action": action,
+            "request_id": request_id,
+            "shard": self._shard,
+            "owner": owner,
+            "resource": resource,
+            "mode": LockMode(mode).value
+        })
+        try:
+            reply = await future
+        except asyncio.CancelledError:
+            self._outbox.put({
+                "type": "lock",
+                "action": "cancel",
+                "request_id": request_id,
+                "owner": owner,
+                "resource": resource
+            })
+            raise
+        finally:
+            self._waiters.pop(request_id, None)
+        if reply.get("deadlock"):
+            raise DeadlockError(owner, resource, reply["deadlock"])
+        return reply["acquired"]
+
+
+def _worker_main(shard: int, inbox, outbox):
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(_worker_loop(shard, inbox, outbox))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(shard: int, inbox, outbox):
+    tasks_db = _ReportingTaskStore(outbox)
+    checkpoints = _ReportingCheckpointStore(outbox)
+    set_checkpoint_store(checkpoints)
+    running: Dict[str, asyncio.Task] = {}
+    slot_waiters: Dict[str, asyncio.Future] = {}
+    lock_waiters: Dict[str, asyncio.Future] = {}
+    set_lock_manager(_RemoteLockManager(shard, outbox, lock_waiters))
+    loop = asyncio.get_running_loop()
+
+    async def forward_event(event: str, data: Dict[str, Any]):
+        outbox.put({"type": "event", "event": event, "data": data})
+
+    orchestrator.set_event_emitter(forward_event)
+
+    # Imported here: the routes package imports the services
+    from ..routes.approvals import approvals_db
+
+    async def run(task: Task, workflows_db: Dict[str, Workflow]):
+        error = None
+        current_slot.set(_RemoteSlot(task.id, outbox, slot_waiters))
+        try:
+            await orchestrator.execute_task(task.id, tasks_db, workflows_db)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            running.pop(task.id, None)
+            dict.pop(tasks_db, task.id, None)
+            # The API process keeps the approvals; a new run brings them back
+            for approval_id in [a.id for a in approvals_db.values() if a.task_id == task.id]:
+                del approvals_db[approval_id]
+            outbox.put({"type": "done", "task_id": task.id, "error": error})
+
+    while True:
+        try:
+            message = await loop.run_in_executor(None, inbox.get, True, 1.0)
+        except queue.Empty:
+            continue
+
+        kind = message["type"]
+        if kind == "stop":
+            for run_task in running.values():
+                run_task.cancel()
+            await asyncio.gather(*running.values(), return_exceptions=True)
+            return
+
+        if kind == "run":
+            task = Task.model_validate(message["task"])
+            workflows_db = {}
+            if message["workflow"]:
+                workflow = Workflow.model_validate(message["workflow"])
+                workflows_db[workflow.id] = workflow
+            dict.__setitem__(tasks_db, task.id, task)
+            checkpoints.restore(task.id, message["checkpoint"])
+            for data in message["approvals"]:
+                approval = ApprovalRequest.model_validate(data)
+                approvals_db[approval.id] = approval
+            running[task.id] = asyncio.create_task(run(task, workflows_db))
+
+        elif kind == "approval":
+            # Recorded too, for a subtask that asks again after a pause
+            approval = approvals_db.get(message["approval_id"])
+            if approval is not None:
+                approvals_db[approval.id] = approval.model_copy(update={
+                    "status": ApprovalStatus.APPROVED if message["approved"] else ApprovalStatus.DENIED
+                })
+            get_approval_gate().resolve(message["approval_id"], message["approved"])
+
+        elif kind == "reassign":
+            orchestrator.reassign_subtask(
+                message["task_id"],
+                message["subtask_id"],
+                message["new_agent_id"],
+                message["transfer_context"]
+            )
+
+        elif kind == "lock_result":
+            future = lock_waiters.get(message["request_id"])
+            if future and not future.done():
+                future.set_result(message)
+
+        elif kind == "slot_acquired":
+            future = slot_waiters.get(message["task_id"])
+            if future and not future.done():
+                future.set_result(None)
+
+        elif kind == "update":
+            task = tasks_db.get(message["task_id"])
+            if task is not None:
+                tasks_db[task.id] = Task.model_validate({**task.model_dump(), **message["updates"]})
+                orchestrator.interrupt_task(task.id)
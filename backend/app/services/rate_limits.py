@@ -0,0 +1,271 @@
+"""
+Rate limits - model calls are dispatched within each provider's request
+and token per minute budgets instead of running into 429s.
+"""
+
+from typing import Dict, Any, Optional, Tuple, Mapping
+from collections import deque
+from datetime import datetime, timezone
+import asyncio
+import re
+import time
+
+from ..config import get_settings
+
+
+RateLimitKey = Tuple[str, str, str]  # (provider, model, API key fingerprint)
+
+# Achieved throughput is what completed within the last minute
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+# Rate limit response headers of each provider: (limit, remaining, reset)
+RATE_LIMIT_HEADERS = {
+    "openai": {
+        "requests": ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        "tokens": ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    },
+    "anthropic": {
+        "requests": ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-reset"),
+        "tokens": ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+    },
+}
+
+
+class _TokenBucket:
+    """A per-minute budget refilled continuously; a limit of 0 is unlimited."""
+
+    def __init__(self, per_minute: float = 0.0):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def set_limit(self, per_minute: float):
+        self._refill()
+        self.level = per_minute if not self.per_minute else min(self.level, per_minute)
+        self.per_minute = per_minute
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (capped at a full bucket)."""
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing / self.per_minute * 60)
+
+    def take(self, amount: float):
+        if self.per_minute:
+            self._refill()
+            self.level -= min(amount, self.per_minute)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute:
+            self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+
+class _Budget:
+    """Request and token buckets of one provider, model and key, with its queue and metrics."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+        # Requests wait their turn in arrival order
+        self.turn = asyncio.Lock()
+        self.blocked_until = 0.0
+        # Without configured limits, one call goes first to learn them from
+        # the provider's headers while the rest wait
+        self.known = bool(requests_per_minute or tokens_per_minute)
+        self.probe: Optional[asyncio.Event] = None
+
+        # Metrics
+        self.queued = 0
+        self.dispatched = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.completed: deque = deque()  # (finished at, tokens used)
+
+
+class RateLimiter:
+    """
+    Dispatches model calls within per-minute request and token budgets.
+
+    Each (provider, model, API key) gets a request bucket and a token
+    bucket, starting from the configured limits and adjusted to the
+    limits and remaining budget the provider reports in its rate limit
+    headers. While a key's limits are unknown, its first call goes alone
+    and the others wait for what the response reports. A call reserves
+    one request and its estimated tokens, waiting in arrival order until
+    both are available, so calls go out just as budget frees up instead
+    of failing. Once the call returns, the estimate is corrected to the
+    tokens actually used. A 429 pauses the key's calls for the
+    provider's Retry-After.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0.0,
+        tokens_per_minute: float = 0.0,
+        model_limits: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_limits = dict(model_limits or {})
+        self._budgets: Dict[RateLimitKey, _Budget] = {}
+
+    async def acquire(self, key: RateLimitKey, estimated_tokens: int):
+        """Wait until a request with `estimated_tokens` fits the key's budget, and reserve it."""
+        budget = self._budget(key)
+        budget.queued += 1
+        started = time.monotonic()
+        try:
+            async with budget.turn:
+                while not budget.known and budget.probe is not None:
+                    await budget.probe.wait()
+                probing = not budget.known
+                if probing:
+                    budget.probe = asyncio.Event()
+                try:
+                    while True:
+                        wait = max(
+                            budget.requests.wait_time(1),
+                            budget.tokens.wait_time(estimated_tokens),
+                            budget.blocked_until - time.monotonic()
+                        )
+                        if wait <= 0:
+                            break
+                        await asyncio.sleep(wait)
+                except BaseException:
+                    # Cancelled before dispatching: the next call probes instead
+                    if probing:
+                        _end_probe(budget, known=False)
+                    raise
+                budget.requests.take(1)
+                budget.tokens.take(estimated_tokens)
+        finally:
+            budget.queued -= 1
+        budget.dispatched += 1
+        budget.total_wait += time.monotonic() - started
+
+    def settle(self, key: RateLimitKey, estimated_tokens: int, used_tokens: Optional[int]):
+        """Correct a reservation to the tokens the call used (None if it failed)."""
+        budget = self._budget(key)
+        used = used_tokens or 0
+        budget.tokens.take(used - estimated_tokens)
+        if used_tokens is not None:
+            budget.completed.append((time.monotonic(), used))
+        # A provider that answers without rate limit headers has no limits
+        # to learn; after a failure the next call probes again
+        _end_probe(budget, known=used_tokens is not None)
+
+    def observe(self, key: RateLimitKey, headers: Mapping[str, str]):
+        """Adopt the limits and remaining budget from a response's rate limit headers."""
+        names = RATE_LIMIT_HEADERS.get(key[0])
+        if not names:
+            return
+        budget = self._budget(key)
+        for bucket, (limit_name, remaining_name, _) in (
+            (budget.requests, names["requests"]),
+            (budget.tokens, names["tokens"]),
+        ):
+            limit = _number(headers.get(limit_name))
+            remaining = _number(headers.get(remaining_name))
+            if limit:
+                bucket.set_limit(limit)
+                _end_probe(budget, known=True)
+            if remaining is not None and bucket.per_minute:
+                bucket.level = min(bucket.level, remaining)
+
+    def throttled(self, key: RateLimitKey, retry_after: Optional[float], headers: Mapping[str, str]):
+        """A call got a 429: hold the key's calls until its budget resets."""
+        budget = self._budget(key)
+        budget.throttled += 1
+        if retry_after is None:
+            names = RATE_LIMIT_HEADERS.get(key[0], {})
+            resets = [_reset_seconds(headers.get(reset)) for _, _, reset in names.values()]
+            retry_after = max((r for r in resets if r is not None), default=1.0)
+        budget.blocked_until = max(budget.blocked_until, time.monotonic() + retry_after)
+        self.observe(key, headers)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per provider, model and key: allowed and achieved throughput, queue and 429s."""
+        now = time.monotonic()
+        report = {}
+        for (provider, model, api_key), budget in self._budgets.items():
+            while budget.completed and now - budget.completed[0][0] > THROUGHPUT_WINDOW_SECONDS:
+                budget.completed.popleft()
+            report[f"{provider}/{model}/{api_key}"] = {
+                "allowed_requests_per_minute": budget.requests.per_minute or None,
+                "allowed_tokens_per_minute": budget.tokens.per_minute or None,
+                "achieved_requests_per_minute": len(budget.completed),
+                "achieved_tokens_per_minute": sum(tokens for _, tokens in budget.completed),
+                "queued": budget.queued,
+                "dispatched": budget.dispatched,
+                "throttled": budget.throttled,
+                "average_wait_seconds": (
+                    budget.total_wait / budget.dispatched if budget.dispatched else 0.0
+                ),
+            }
+        return report
+
+    def _budget(self, key: RateLimitKey) -> _Budget:
+        budget = self._budgets.get(key)
+        if budget is None:
+            limits = self.model_limits.get(key[1], {})
+            budget = _Budget(
+                limits.get("requests_per_minute", self.requests_per_minute),
+                limits.get("tokens_per_minute", self.tokens_per_minute)
+            )
+            self._budgets[key] = budget
+        return budget
+
+
+def _end_probe(budget: _Budget, known: bool):
+    """Let the calls waiting on a probe go, once its response has been seen."""
+    budget.known = budget.known or known
+    if budget.probe is not None:
+        budget.probe.set()
+        budget.probe = None
+
+
+def estimate_tokens(text: str, max_tokens: int) -> int:
+    """Tokens a call may use: its prompt at about four characters per token, plus max_tokens."""
+    return len(text) // 4 + max_tokens
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _reset_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds until a reset given as a duration ("6m0s", "20ms") or a timestamp."""
+    if not value:
+        return None
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if parts:
+        unit = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(amount) * unit[suffix] for amount, suffix in parts)
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return _number(value)
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the shared rate limiter for model calls."""
+    global _limiter
+    if _limiter is None:
+        settings = get_settings()
+        _limiter = RateLimiter(
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            model_limits=settings.llm_rate_limits
+        )
+    return _limiter
@@ -0,0 +1,268 @@
+"""
+Resource locks - keep concurrent subtasks from modifying the same
+resource at once.
+"""
+
+from typing import Dict, Any, List, Optional, Set, Tuple
+from collections import deque
+from enum import Enum
+import asyncio
+import time
+
+
+class LockMode(str, Enum):
+    READ = "read"
+    WRITE = "write"
+
+
+class DeadlockError(Exception):
+    """Raised when waiting for a lock would close a cycle of waiting owners."""
+
+    def __init__(self, owner: str, resource: str, cycle: List[str]):
+        super().__init__(f"Deadlock: {owner} waiting for {resource} ({' -> '.join(cycle)})")
+        self.owner = owner
+        self.resource = resource
+        self.cycle = cycle
+
+
+class _Waiter:
+    __slots__ = ("owner", "mode", "future", "since")
+
+    def __init__(self, owner: str, mode: LockMode, future: asyncio.Future):
+        self.owner = owner
+        self.mode = mode
+        self.future = future
+        self.since = time.monotonic()
+
+
+class _Lock:
+    __slots__ = ("readers", "writer", "waiters")
+
+    def __init__(self):
+        self.readers: Set[str] = set()
+        self.writer: Optional[str] = None
+        self.waiters: deque = deque()
+
+    def holders(self) -> Set[str]:
+        return self.readers | {self.writer} if self.writer else set(self.readers)
+
+    def grantable(self, owner: str, mode: LockMode) -> bool:
+        if self.writer is not None:
+            return self.writer == owner
+        if mode == LockMode.READ:
+            return True
+        # A write lock needs the resource to itself (or an upgrade of its own read)
+        return not self.readers or self.readers == {owner}
+
+    def grant(self, owner: str, mode: LockMode):
+        if mode == LockMode.WRITE:
+            self.readers.discard(owner)
+            self.writer = owner
+        elif self.writer != owner:
+            self.readers.add(owner)
+
+
+class ResourceLockManager:
+    """
+    Table of read/write locks on named resources.
+
+    Any number of owners may hold a resource for reading, or a single
+    owner for writing. Requests are served first come, first served: once
+    someone waits for a resource, later requests queue behind them even
+    if they could be granted, so writers are never starved by readers.
+
+    Acquire and release touch only the lock of the resource involved.
+    Before a request waits, the waits-for chain from it is followed; if
+    it leads back to the requester the request fails with DeadlockError
+    instead of waiting forever.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, _Lock] = {}
+        self._held: Dict[str, Dict[str, LockMode]] = {}
+        self._waiting: Dict[str, Tuple[str, _Waiter]] = {}
+
+        self._acquired = 0
+        self._contended = 0
+        self._deadlocks = 0
+        self._total_wait = 0.0
+
+    async def acquire(self, owner: str, resource: str, mode: LockMode = LockMode.WRITE):
+        """
+        Acquire a resource, waiting in line if it is taken.
+
+        Re-acquiring a held resource is a no-op, or an upgrade from read
+        to write.
+
+        Raises:
+            DeadlockError: If waiting would deadlock
+        """
+        mode = LockMode(mode)
+        if self._holds(owner, resource, mode):
+            return
+
+        lock = self._locks.setdefault(resource, _Lock())
+        if not lock.waiters and lock.grantable(owner, mode):
+            self._grant(lock, owner, resource, mode)
+            return
+
+        waiter = _Waiter(owner, mode, asyncio.get_running_loop().create_future())
+        lock.waiters.append(waiter)
+        self._waiting[owner] = (resource, waiter)
+        cycle = self._find_cycle(owner)
+        if cycle:
+            self._cancel_wait(owner)
+            self._deadlocks += 1
+            raise DeadlockError(owner, resource, cycle)
+
+        self._contended += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we were cancelled: give it back
+                self.release(owner, resource)
+            else:
+                self._cancel_wait(owner)
+            raise
+        self._total_wait += time.monotonic() - waiter.since
+
+    async def try_acquire(self, owner: str, resource: str, mode: LockMode = LockMode.WRITE) -> bool:
+        """Acquire a resource if that needs no waiting. Returns whether it was acquired."""
+        if not self.available(owner, resource, mode):
+            return False
+        await self.acquire(owner, resource, mode)
+        return True
+
+    def available(self, owner: str, resource: str, mode: LockMode = LockMode.WRITE) -> bool:
+        """Whether acquiring the resource would succeed without waiting."""
+        mode = LockMode(mode)
+        if self._holds(owner, resource, mode):
+            return True
+        lock = self._locks.get(resource)
+        return lock is None or (not lock.waiters and lock.grantable(owner, mode))
+
+    def release(self, owner: str, resource: str):
+        """Release a resource and hand it to whoever is next in line."""
+        held = self._held.get(owner)
+        if not held or resource not in held:
+            return
+        del held[resource]
+        if not held:
+            del self._held[owner]
+
+        lock = self._locks[resource]
+        if lock.writer == owner:
+            lock.writer = None
+        lock.readers.discard(owner)
+        self._wake(lock, resource)
+
+    def release_all(self, owner: str):
+        """Release everything an owner holds, and stop waiting for anything."""
+        self._cancel_wait(owner)
+        for resource in list(self._held.get(owner, {})):
+            self.release(owner, resource)
+
+    def held_by(self, owner: str) -> Dict[str, LockMode]:
+        return dict(self._held.get(owner, {}))
+
+    def contention(self) -> List[Dict[str, Any]]:
+        """Resources someone is waiting for, with their holders and waiters."""
+        return [
+            {
+                "resource": resource,
+                "holders": sorted(lock.holders()),
+                "mode": LockMode.WRITE.value if lock.writer else LockMode.READ.value,
+                "waiting": [
+                    {"owner": waiter.owner, "mode": waiter.mode.value} for waiter in lock.waiters
+                ],
+            }
+            for resource, lock in self._locks.items() if lock.waiters
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Lock table size, contention and deadlock counts."""
+        return {
+            "locked_resources": sum(1 for lock in self._locks.values() if lock.holders()),
+            "owners": len(self._held),
+            "waiting": len(self._waiting),
+            "acquired": self._acquired,
+            "contended": self._contended,
+            "deadlocks": self._deadlocks,
+            "average_wait_seconds": self._total_wait / self._contended if self._contended else 0.0,
+        }
+
+    def _holds(self, owner: str, resource: str, mode: LockMode) -> bool:
+        held = self._held.get(owner, {}).get(resource)
+        return held == LockMode.WRITE or held == mode
+
+    def _grant(self, lock: _Lock, owner: str, resource: str, mode: LockMode):
+        lock.grant(owner, mode)
+        self._held.setdefault(owner, {})[resource] = mode
+        self._acquired += 1
+
+    def _wake(self, lock: _Lock, resource: str):
+        """Grant the waiters at the head of the line that can go now."""
+        while lock.waiters:
+            waiter = lock.waiters[0]
+            if not lock.grantable(waiter.owner, waiter.mode):
+                break
+            lock.waiters.popleft()
+            self._waiting.pop(waiter.owner, None)
+            self._grant(lock, waiter.owner, resource, waiter.mode)
+            waiter.future.set_result(None)
+        if not lock.waiters and not lock.holders():
+            del self._locks[resource]
+
+    def _cancel_wait(self, owner: str):
+        entry = self._waiting.pop(owner, None)
+        if entry is None:
+            return
+        resource, waiter = entry
+        lock = self._locks[resource]
+        lock.waiters.remove(waiter)
+        # The line may move now that this waiter is gone
+        self._wake(lock, resource)
+
+    def _blockers(self, owner: str) -> Set[str]:
+        """Owners the given owner waits for: holders and those ahead in line."""
+        resource, waiter = self._waiting[owner]
+        lock = self._locks[resource]
+        blockers = lock.holders()
+        for ahead in lock.waiters:
+            if ahead is waiter:
+                break
+            blockers.add(ahead.owner)
+        blockers.discard(owner)
+        return blockers
+
+    def _find_cycle(self, owner: str) -> Optional[List[str]]:
+        """A chain of waiting owners leading from `owner` back to itself."""
+        stack = [(owner, [owner])]
+        visited = set()
+        while stack:
+            current, path = stack.pop()
+            for blocker in self._blockers(current):
+                if blocker == owner:
+                    return path + [owner]
+                if blocker not in visited and blocker in self._waiting:
+                    visited.add(blocker)
+                    stack.append((blocker, path + [blocker]))
+        return None
+
+
+_manager: Optional[ResourceLockManager] = None
+
+
+def get_lock_manager() -> ResourceLockManager:
+    """Get the shared resource lock manager."""
+    global _manager
+    if _manager is None:
+        _manager = ResourceLockManager()
+    return _manager
+
+
+def set_lock_manager(manager: ResourceLockManager):
+    """Replace the shared lock manager (used by worker processes)."""
+    global _manager
+    _manager = manager
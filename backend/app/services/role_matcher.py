@@ -0,0 +1,209 @@
+"""
+Role matcher - ranks agents for a subtask by how well their free-form
+profile (role, goal, backstory) matches it.
+"""
+
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from functools import lru_cache
+import re
+import zlib
+
+import numpy as np
+
+from ..config import get_settings
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Words too common to say anything about a role
+_STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into",
+    "is", "it", "of", "on", "or", "the", "their", "to", "who", "with", "you", "your",
+})
+
+# How much each part of a profile counts
+PROFILE_WEIGHTS = {"role": 3.0, "name": 1.5, "goal": 1.0, "backstory": 0.5}
+
+# Weight of a word's character trigrams relative to the word itself
+TRIGRAM_WEIGHT = 0.3
+
+# Weight of a query's context (e.g. the subtask description) relative to its roles
+CONTEXT_WEIGHT = 0.25
+
+# Suffixes stripped so "deploy", "deployer" and "deployment" are one word
+_SUFFIXES = ("ments", "ment", "ings", "ing", "ers", "er", "ors", "or", "ed", "es", "s")
+
+
+def embed(text: str, context: str = "", dim: int = 256) -> np.ndarray:
+    """
+    Deterministic embedding of text: hashed word and character trigram counts.
+
+    Word stems (so "deployer" and "deployment" are one word) and their
+    character trigrams (so "review" and "reviewer" overlap) are hashed into
+    `dim` buckets with a hashed sign, and the vector is scaled to unit
+    length. `context` counts for less than the text. The same text always
+    gives the same vector.
+    """
+    return _embed_cached(text, context, dim).copy()
+
+
+@lru_cache(maxsize=1024)
+def _embed_cached(text: str, context: str, dim: int) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    _accumulate(vector, text, 1.0)
+    _accumulate(vector, context, CONTEXT_WEIGHT)
+    return _normalized(vector)
+
+
+def embed_profile(agent: Dict[str, Any], dim: int = 256) -> np.ndarray:
+    """Embedding of an agent's profile, its role counting the most."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for field, weight in PROFILE_WEIGHTS.items():
+        _accumulate(vector, agent.get(field) or "", weight)
+    return _normalized(vector)
+
+
+def _accumulate(vector: np.ndarray, text: str, weight: float):
+    dim = len(vector)
+    for word in _WORD.findall(text.lower()):
+        if word in _STOP_WORDS:
+            continue
+        word = _stem(word)
+        padded = f"#{word}#"
+        features = [(word, weight)]
+        features.extend(
+            (padded[i:i + 3], weight * TRIGRAM_WEIGHT) for i in range(len(padded) - 2)
+        )
+        for feature, feature_weight in features:
+            digest = zlib.crc32(feature.encode())
+            vector[digest % dim] += feature_weight if digest & 0x80000000 else -feature_weight
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _normalized(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RoleMatcher:
+    """
+    Ranks agents by the similarity of their profile to a query.
+
+    Profile embeddings are rows of one contiguous matrix, grown by
+    doubling as agents are added; a removed agent's row is filled with
+    the last row, so adding, updating and removing an agent only touch
+    one row. Ranking is a single matrix-vector product over every row,
+    masked to the agents of a scope. Query features are weighted by how
+    rare they are among the profiles.
+    """
+
+    def __init__(self, dim: int = 256, min_similarity: float = 0.15, capacity: int = 64):
+        self.dim = dim
+        self.min_similarity = min_similarity
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._scope_codes = np.zeros(capacity, dtype=np.int32)
+        self._agents: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._scope_ids: Dict[str, int] = {}
+        # Number of profiles using each bucket, for weighting query features
+        self._document_counts = np.zeros(dim, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def add(self, agent: Dict[str, Any], scope: str):
+        """Add an agent, or re-embed it after an update."""
+        row = self._rows.get(agent["id"])
+        if row is None:
+            row = len(self._agents)
+            if row == len(self._matrix):
+                self._grow()
+            self._agents.append(agent)
+            self._rows[agent["id"]] = row
+        else:
+            self._agents[row] = agent
+            self._document_counts -= self._matrix[row] != 0
+        self._matrix[row] = embed_profile(agent, self.dim)
+        self._document_counts += self._matrix[row] != 0
+        self._scope_codes[row] = self._scope_ids.setdefault(scope, len(self._scope_ids) + 1)
+
+    def remove(self, agent_id: str):
+        """Remove an agent, moving the last row into its place."""
+        row = self._rows.pop(agent_id, None)
+        if row is None:
+            return
+        self._document_counts -= self._matrix[row] != 0
+        last = len(self._agents) - 1
+        if row != last:
+            moved = self._agents[last]
+            self._agents[row] = moved
+            self._matrix[row] = self._matrix[last]
+            self._scope_codes[row] = self._scope_codes[last]
+            self._rows[moved["id"]] = row
+        self._agents.pop()
+        self._scope_codes[last] = 0
+
+    def has_scope(self, scope: str) -> bool:
+        code = self._scope_ids.get(scope)
+        return code is not None and bool(np.any(self._scope_codes[:len(self._agents)] == code))
+
+    def rank(
+        self,
+        query: str,
+        scope: Optional[str] = None,
+        top_k: Optional[int] = None,
+        exclude: Iterable[str] = (),
+        context: str = ""
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Agents at least `min_similarity` alike to the query, best first,
+        with their cosine similarity.
+        """
+        count = len(self._agents)
+        if not count:
+            return []
+        # Features most profiles share (e.g. "engineer") say little about fit
+        weights = np.log((count + 1) / (self._document_counts + 1)) + 1
+        query_vector = _normalized(_embed_cached(query, context, self.dim) * weights)
+        scores = self._matrix[:count] @ query_vector
+
+        eligible = scores >= self.min_similarity
+        if scope is not None:
+            eligible &= self._scope_codes[:count] == self._scope_ids.get(scope, -1)
+        for agent_id in exclude:
+            row = self._rows.get(agent_id)
+            if row is not None:
+                eligible[row] = False
+
+        candidates = np.flatnonzero(eligible)
+        if top_k is not None and top_k < len(candidates):
+            best = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[best]
+        # Highest score first, earlier rows first among equals
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(self._agents[row], float(scores[row])) for row in order]
+
+    def _grow(self):
+        capacity = len(self._matrix) * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._matrix)] = self._matrix
+        codes = np.zeros(capacity, dtype=np.int32)
+        codes[:len(self._scope_codes)] = self._scope_codes
+        self._matrix, self._scope_codes = matrix, codes
+
+
+_matcher: Optional[RoleMatcher] = None
+
+
+def get_role_matcher() -> RoleMatcher:
+    """Get the shared role matcher."""
+    global _matcher
+    if _matcher is None:
+        _matcher = RoleMatcher(min_similarity=get_settings().role_match_min_similarity)
+    return _matcher
@@ -0,0 +1,117 @@
+"""
+Single flight - identical calls made at the same time share one
+execution instead of each paying its latency and rate limits.
+"""
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Hashable, TypeVar
+import asyncio
+import copy
+
+from ..config import get_settings
+
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """A call in progress and the number of callers waiting for it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _FlightStats:
+    """Coalescing counters for one kind of call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.shared_errors = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls.
+
+    The first call for a key starts the work; calls with the same key
+    made before it finishes wait for that same execution. Every waiter
+    gets the result (joiners get a copy, so nobody can change another's
+    result), or the exception if the call raised. A waiter that is
+    cancelled, e.g. by its own timeout, leaves without cancelling the
+    call for the others; the call is only cancelled once nobody is
+    waiting for it. Only use this for calls whose result does not depend
+    on who makes them and that are safe to make once for many callers.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats: Dict[str, _FlightStats] = {}
+
+    async def call(self, kind: str, key: Hashable, make_call: Callable[[], Awaitable[T]]) -> T:
+        """Run `make_call`, or wait for the identical call already in flight."""
+        stats = self._stats.setdefault(kind, _FlightStats())
+        stats.calls += 1
+
+        flight = self._flights.get((kind, key))
+        joined = flight is not None
+        if joined:
+            stats.coalesced += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(make_call()))
+            self._flights[(kind, key)] = flight
+            flight.task.add_done_callback(lambda _: self._land(kind, key, flight))
+            stats.executed += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if joined:
+                stats.shared_errors += 1
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Callers arriving before the cancellation lands start a
+                # new call instead of joining this one
+                self._land(kind, key, flight)
+                flight.task.cancel()
+        return copy.deepcopy(result) if joined else result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-kind calls, executions, coalesced calls and coalescing ratio."""
+        in_flight: Dict[str, int] = {}
+        for kind, _ in self._flights:
+            in_flight[kind] = in_flight.get(kind, 0) + 1
+        return {
+            kind: {
+                "calls": stats.calls,
+                "executed": stats.executed,
+                "coalesced": stats.coalesced,
+                "coalescing_ratio": stats.coalesced / stats.calls if stats.calls else 0.0,
+                "shared_errors": stats.shared_errors,
+                "in_flight": in_flight.get(kind, 0),
+            }
+            for kind, stats in self._stats.items()
+        }
+
+    def _land(self, kind: str, key: Hashable, flight: _Flight):
+        if self._flights.get((kind, key)) is flight:
+            del self._flights[(kind, key)]
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Get the shared single-flight layer, or None if coalescing is disabled."""
+    global _single_flight
+    if _single_flight is None and get_settings().coalesce_calls:
+        _single_flight = SingleFlight()
+    return _single_flight
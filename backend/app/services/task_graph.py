@@ -0,0 +1,202 @@
+"""
+Task graph service - builds the subtask dependency graph for a task.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+import uuid
+
+from ..models.workflow import Workflow
+
+
+# Handoff used when no workflow edge describes the transfer
+DEFAULT_HANDOFF_CONFIG = {
+    "include_output": True,
+    "include_summary": True,
+    "include_flags": True,
+    "include_context": True
+}
+
+
+def build_dependency_graph(
+    subtask_definitions: List[Dict[str, Any]],
+    workflow: Optional[Workflow] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Build the upstream dependencies of every subtask.
+
+    Dependencies come from (in priority order):
+    1. An explicit "depends_on" list on the subtask definition
+    2. The workflow edges between the nodes of the subtasks' agents
+    3. The decomposition "order" - a subtask waits for every subtask
+       of the closest lower order
+
+    Args:
+        subtask_definitions: Subtasks from ManagerAgent.decompose_task
+        workflow: The workflow graph the task runs against, if any
+
+    Returns:
+        {subtask_id: [{"subtask_id": upstream_id, "handoff_config": {...}}]}
+    """
+    graph: Dict[str, List[Dict[str, Any]]] = {
+        sd["id"]: [] for sd in subtask_definitions
+    }
+
+    # Map workflow nodes to the subtasks of their agent
+    node_by_agent: Dict[str, str] = {}
+    edges_by_target: Dict[str, List[Any]] = {}
+    if workflow and workflow.nodes:
+        for node in workflow.nodes:
+            node_by_agent.setdefault(node.agent_id, node.id)
+        for edge in workflow.edges:
+            edges_by_target.setdefault(edge.target_node_id, []).append(edge)
+
+    subtasks_by_node: Dict[str, List[str]] = {}
+    for sd in subtask_definitions:
+        node_id = node_by_agent.get(sd.get("agent_id"))
+        if node_id:
+            subtasks_by_node.setdefault(node_id, []).append(sd["id"])
+
+    for index, sd in enumerate(subtask_definitions):
+        upstream = graph[sd["id"]]
+
+        if "depends_on" in sd:
+            for dep_id in sd["depends_on"]:
+                _add_dependency(upstream, dep_id, DEFAULT_HANDOFF_CONFIG)
+            continue
+
+        node_id = node_by_agent.get(sd.get("agent_id"))
+        if node_id:
+            # Earlier subtasks of the same node run first
+            node_subtasks = subtasks_by_node[node_id]
+            position = node_subtasks.index(sd["id"])
+            if position > 0:
+                _add_dependency(upstream, node_subtasks[position - 1], DEFAULT_HANDOFF_CONFIG)
+            elif node_id in edges_by_target:
+                for edge in edges_by_target[node_id]:
+                    source_subtasks = subtasks_by_node.get(edge.source_node_id, [])
+                    if source_subtasks:
+                        _add_dependency(
+                            upstream,
+                            source_subtasks[-1],
+                            edge.handoff_config.model_dump()
+                        )
+            continue
+
+        # No workflow information: wait for the previous order level
+        order = sd.get("order", index + 1)
+        previous_orders = [
+            other.get("order", i + 1)
+            for i, other in enumerate(subtask_definitions)
+            if other.get("order", i + 1) < order
+        ]
+        if previous_orders:
+            previous_order = max(previous_orders)
+            for i, other in enumerate(subtask_definitions):
+                if other.get("order", i + 1) == previous_order:
+                    _add_dependency(upstream, other["id"], DEFAULT_HANDOFF_CONFIG)
+
+    topological_order(graph)
+    return graph
+
+
+def topological_order(graph: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+    """
+    Return subtask ids in dependency order.
+
+    Raises:
+        ValueError: If the graph references unknown subtasks or has a cycle
+    """
+    remaining = {}
+    dependents: Dict[str, List[str]] = {subtask_id: [] for subtask_id in graph}
+    for subtask_id, upstream in graph.items():
+        remaining[subtask_id] = len(upstream)
+        for dep in upstream:
+            if dep["subtask_id"] not in graph:
+                raise ValueError(f"Unknown dependency: {dep['subtask_id']}")
+            dependents[dep["subtask_id"]].append(subtask_id)
+
+    ready = [subtask_id for subtask_id, count in remaining.items() if count == 0]
+    ordered = []
+    while ready:
+        subtask_id = ready.pop(0)
+        ordered.append(subtask_id)
+        for dependent in dependents[subtask_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    if len(ordered) != len(graph):
+        raise ValueError("Workflow graph contains a cycle")
+    return ordered
+
+
+def get_dependents(graph: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[str]]:
+    """Invert the graph: map each subtask to the subtasks waiting on it."""
+    dependents: Dict[str, List[str]] = {subtask_id: [] for subtask_id in graph}
+    for subtask_id, upstream in graph.items():
+        for dep in upstream:
+            dependents[dep["subtask_id"]].append(subtask_id)
+    return dependents
+
+
+def copy_plan(
+    subtask_definitions: List[Dict[str, Any]],
+    graph: Dict[str, List[Dict[str, Any]]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """Copy a plan for another task, giving every subtask a fresh id."""
+    new_ids = {sd["id"]: f"subtask_{uuid.uuid4().hex[:8]}" for sd in subtask_definitions}
+    definitions = []
+    for sd in subtask_definitions:
+        definition = {**sd, "id": new_ids[sd["id"]]}
+        if "depends_on" in sd:
+            definition["depends_on"] = [new_ids[dep_id] for dep_id in sd["depends_on"]]
+        definitions.append(definition)
+    copied_graph = {
+        new_ids[subtask_id]: [
+            {"subtask_id": new_ids[dep["subtask_id"]], "handoff_config": dict(dep["handoff_config"])}
+            for dep in upstream
+        ]
+        for subtask_id, upstream in graph.items()
+    }
+    return definitions, copied_graph
+
+
+def shard_subtask(
+    subtask_definition: Dict[str, Any],
+    items: List[Any],
+    shard_size: int
+) -> List[Dict[str, Any]]:
+    """
+    Split a fan-out subtask into one subtask per shard of its collection.
+
+    Shards are contiguous runs of at most `shard_size` items. Each shard
+    subtask keeps the parent's role and gets an id derived from the
+    parent's, so the shards of a subtask are the same on every run.
+    """
+    shard_size = max(1, shard_size)
+    shards = [items[start:start + shard_size] for start in range(0, len(items), shard_size)]
+    return [
+        {
+            "id": f"{subtask_definition['id']}_shard{index + 1}",
+            "parent_id": subtask_definition["id"],
+            "description": (
+                f"{subtask_definition['description']} "
+                f"(items {index * shard_size + 1}-{index * shard_size + len(shard)} of {len(items)})"
+            ),
+            "agent_id": subtask_definition.get("agent_id"),
+            "role_keywords": subtask_definition.get("role_keywords"),
+            "items": shard
+        }
+        for index, shard in enumerate(shards)
+    ]
+
+
+def _add_dependency(
+    upstream: List[Dict[str, Any]],
+    subtask_id: str,
+    handoff_config: Dict[str, bool]
+):
+    """Add an upstream dependency unless it is already present."""
+    if any(dep["subtask_id"] == subtask_id for dep in upstream):
+        return
+    upstream.append({"subtask_id": subtask_id, "handoff_config": dict(handoff_config)})
@@ -0,0 +1,429 @@
+"""
+Task execution engine - a bounded queue feeding a fixed pool of task slots.
+"""
+
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import itertools
+import logging
+import math
+import time
+
+from ..config import get_settings
+from ..models.task import TaskPriority, TaskStatus
+from .orchestrator import execute_task, interrupt_task, reassign_subtask
+from .process_pool import ShardedProcessExecutor
+from .fair_share import FairShareQueue
+from .execution_slots import ExecutionSlot, current_slot
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the task queue cannot accept more work."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Task queue is full")
+        self.retry_after = retry_after
+
+
+# Scheduling order of the priority classes, most urgent first
+PRIORITY_ORDER = [TaskPriority.HIGH, TaskPriority.NORMAL, TaskPriority.LOW]
+_PRIORITY_RANK = {priority: rank for rank, priority in enumerate(PRIORITY_ORDER)}
+
+
+class _QueuedTask:
+    """A task waiting for (or holding) a slot, ordered by priority then deadline."""
+
+    __slots__ = (
+        "task_id", "user_id", "args", "priority", "deadline", "queued_at", "key", "slot", "yielding"
+    )
+
+    def __init__(
+        self,
+        task_id: str,
+        user_id: str,
+        args: tuple,
+        priority: TaskPriority,
+        deadline: Optional[datetime],
+        sequence: int,
+        queued_at: float
+    ):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.args = args
+        self.priority = priority
+        self.deadline = deadline
+        self.queued_at = queued_at
+        # Earliest deadline first within a class, submission order among equals
+        self.key = (
+            _PRIORITY_RANK[priority],
+            deadline.timestamp() if deadline else math.inf,
+            sequence
+        )
+        self.slot: Optional[ExecutionSlot] = None
+        self.yielding = False
+
+    def __lt__(self, other: "_QueuedTask") -> bool:
+        return self.key < other.key
+
+
+class TaskExecutionEngine:
+    """
+    Runs tasks with admission control.
+
+    Submitted tasks wait in a bounded queue per user, ordered by priority
+    class, then earliest deadline first. Whenever one of the `workers`
+    slots is free, a dispatcher starts the most urgent class queued and
+    shares the slots among users by deficit round-robin, in proportion to
+    their weights and never beyond a user's concurrency cap (see
+    FairShareQueue). Submissions beyond the queue capacity are rejected
+    with a retry hint instead of piling up.
+    A task whose subtasks are all parked (e.g. waiting for approval)
+    hands its slot back until one of them continues.
+
+    When the next task has waited `preemption_after` seconds for a slot,
+    the least urgent running task of a lower class is preempted: it
+    starts no new subtasks, gives its slot up once its in-flight ones
+    finish, and is queued again to continue from its checkpoints.
+
+    With a process executor, tasks run in worker processes instead of
+    this event loop; the slots still bound how many run at once.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 100,
+        process_executor: Optional[ShardedProcessExecutor] = None,
+        preemption_after: float = 2.0,
+        user_weights: Optional[Dict[str, float]] = None,
+        user_caps: Optional[Dict[str, int]] = None,
+        default_user_cap: int = 0
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.process_executor = process_executor
+        self.preemption_after = preemption_after
+        self._queue = FairShareQueue(user_weights, user_caps, default_cap=default_user_cap)
+        self._queue_changed: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._active: Dict[str, _QueuedTask] = {}
+        self._sequence = itertools.count()
+        self._last_preemption = 0.0
+
+        # Metrics
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._preempted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._total_run = 0.0
+        self._class_waits = {
+            priority: {"dispatched": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITY_ORDER
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    async def start(self):
+        """Start dispatching queued tasks."""
+        if self.is_running:
+            return
+        self._queue.clear()
+        self._queue_changed = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        if self.process_executor:
+            await self.process_executor.start()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Stop dispatching and wind down running tasks.
+
+        Running tasks get `timeout` seconds to finish before they are
+        cancelled. Tasks still in the queue are dropped.
+        """
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        running = list(self._running.values())
+        if running:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for run in pending:
+                run.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if self.process_executor:
+            await self.process_executor.stop()
+
+    def submit(
+        self,
+        task_id: str,
+        *args: Any,
+        priority: TaskPriority = TaskPriority.NORMAL,
+        deadline: Optional[datetime] = None
+    ):
+        """
+        Queue a task for execution.
+
+        Args are passed on to execute_task after the task id; the first
+        is the task store.
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+            RuntimeError: If the engine has not been started
+        """
+        self.submit_many([(task_id, args)], priority=priority, deadline=deadline)
+
+    def submit_many(
+        self,
+        items: List[Tuple[str, tuple]],
+        priority: TaskPriority = TaskPriority.NORMAL,
+        deadline: Optional[datetime] = None
+    ):
+        """
+        Queue several tasks at once, all or none.
+
+        Items are (task_id, args) pairs; tasks of the same user, priority
+        and deadline start in the order given.
+
+        Raises:
+            QueueFullError: If the queue cannot take every task
+            RuntimeError: If the engine has not been started
+        """
+        if not self.is_running:
+            raise RuntimeError("Task execution engine is not running")
+        if self.queue_size - len(self._queue) < len(items):
+            self._rejected += len(items)
+            raise QueueFullError(self.retry_after())
+        queued_at = time.monotonic()
+        for task_id, args in items:
+            self._push(_QueuedTask(
+                task_id, args[0][task_id].user_id, args,
+                priority, deadline, next(self._sequence), queued_at
+            ))
+        self._submitted += len(items)
+
+    def resolve_approval(self, task_id: str, approval_id: str, approved: bool):
+        """Deliver an approval decision to a task running in a worker process."""
+        if self.process_executor:
+            self.process_executor.resolve_approval(task_id, approval_id, approved)
+
+    def reassign_subtask(
+        self,
+        task_id: str,
+        subtask_id: str,
+        new_agent_id: str,
+        transfer_context: bool = True
+    ):
+        """Move a subtask to another agent, in the worker process running it if any."""
+        if not (
+            self.process_executor
+            and self.process_executor.reassign_subtask(
+                task_id, subtask_id, new_agent_id, transfer_context
+            )
+        ):
+            reassign_subtask(task_id, subtask_id, new_agent_id, transfer_context)
+
+    def update_task(self, task_id: str, updates: Dict[str, Any]):
+        """
+        Propagate an API-side change (e.g. pause) to a running task.
+
+        Inline tasks read the shared store directly and only need to be
+        interrupted; tasks in a worker process need the change forwarded.
+        """
+        if self.process_executor:
+            self.process_executor.update_task(task_id, updates)
+        else:
+            interrupt_task(task_id)
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until a queue position frees up."""
+        average_run = self._total_run / self._completed if self._completed else 5.0
+        return max(1, int(average_run * (self.queue_depth() + 1) / self.workers))
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and throughput counters."""
+        dispatched = sum(waits["dispatched"] for waits in self._class_waits.values())
+        return {
+            "workers": self.workers,
+            "active": len(self._running),
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self.queue_size,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "failed": self._failed,
+            "average_wait_seconds": self._total_wait / dispatched if dispatched else 0.0,
+            "max_wait_seconds": self._max_wait,
+            "average_run_seconds": (
+                self._total_run / (self._completed + self._failed)
+                if self._completed + self._failed else 0.0
+            ),
+            "preempted": self._preempted,
+            "by_priority": {
+                priority.value: {
+                    "queue_depth": sum(1 for entry in self._queue if entry.priority == priority),
+                    "active": sum(1 for entry in self._active.values() if entry.priority == priority),
+                    "dispatched": waits["dispatched"],
+                    "average_wait_seconds": (
+                        waits["total_wait"] / waits["dispatched"] if waits["dispatched"] else 0.0
+                    ),
+                    "max_wait_seconds": waits["max_wait"],
+                }
+                for priority, waits in self._class_waits.items()
+            },
+            "by_user": self._queue.stats(),
+            "execution_mode": "process" if self.process_executor else "inline",
+        }
+
+    async def _dispatch(self):
+        """Start the next queued task whenever a slot is free."""
+        while True:
+            # Only wait for a slot with work that may start, so an idle
+            # dispatcher never holds a slot a parked task wants back
+            while not self._queue.has_eligible():
+                self._queue_changed.clear()
+                await self._queue_changed.wait()
+            await self._acquire_slot()
+            entry = self._queue.pop()
+
+            wait = time.monotonic() - entry.queued_at
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            waits = self._class_waits[entry.priority]
+            waits["dispatched"] += 1
+            waits["total_wait"] += wait
+            waits["max_wait"] = max(waits["max_wait"], wait)
+
+            entry.slot = ExecutionSlot(self._slots)
+            self._active[entry.task_id] = entry
+            self._running[entry.task_id] = asyncio.create_task(self._run(entry))
+
+    async def _acquire_slot(self):
+        """Wait for a free slot, preempting lower classes if the next task starves."""
+        while True:
+            if not self._slots.locked() or self.preemption_after <= 0:
+                await self._slots.acquire()
+                return
+            since = max(self._queue.peek().queued_at, self._last_preemption)
+            timeout = max(0.0, since + self.preemption_after - time.monotonic())
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+                return
+            except asyncio.TimeoutError:
+                self._preempt_for(self._queue.peek())
+
+    def _preempt_for(self, waiting: _QueuedTask):
+        """Ask the least urgent running task of a lower class to yield its slot."""
+        now = time.monotonic()
+        self._last_preemption = now
+        if now - waiting.queued_at < self.preemption_after:
+            return
+        candidates = [
+            entry for entry in self._active.values()
+            if entry.key[0] > waiting.key[0] and entry.slot.held and not entry.yielding
+        ]
+        if not candidates:
+            return
+        victim = max(candidates, key=lambda entry: entry.key)
+        tasks_db = victim.args[0]
+        task = tasks_db.get(victim.task_id)
+        if task is None or task.status != TaskStatus.RUNNING:
+            return
+
+        victim.yielding = True
+        if self.process_executor:
+            self.process_executor.update_task(victim.task_id, {"status": TaskStatus.PENDING})
+        else:
+            tasks_db[victim.task_id] = task.model_copy(update={"status": TaskStatus.PENDING})
+            interrupt_task(victim.task_id)
+
+    async def _run(self, entry: _QueuedTask):
+        """Run one task in a slot and release the slot afterwards."""
+        task_id, args = entry.task_id, entry.args
+        started = time.monotonic()
+        slot = entry.slot
+        requeue = None
+        current_slot.set(slot)
+        try:
+            if self.process_executor:
+                await self.process_executor.run(task_id, *args, slot=slot)
+            else:
+                await execute_task(task_id, *args)
+            task = args[0].get(task_id)
+            if entry.yielding and task is not None and task.status == TaskStatus.PENDING:
+                # Preempted before it finished: continue once more urgent work ran
+                self._preempted += 1
+                requeue = _QueuedTask(
+                    task_id, entry.user_id, args, entry.priority, entry.deadline,
+                    next(self._sequence), time.monotonic()
+                )
+            else:
+                self._completed += 1
+        except Exception as e:
+            self._failed += 1
+            logger.exception("Task %s failed", task_id)
+            task = args[0].get(task_id)
+            if task is not None:
+                args[0][task_id] = task.model_copy(update={
+                    "status": TaskStatus.FAILED,
+                    "error": str(e) or type(e).__name__,
+                    "completed_at": task.completed_at or datetime.utcnow()
+                })
+        finally:
+            run_seconds = time.monotonic() - started
+            self._total_run += run_seconds
+            self._running.pop(task_id, None)
+            self._active.pop(task_id, None)
+            slot.close()
+            self._queue.finished(entry.user_id, run_seconds)
+            if requeue:
+                self._push(requeue)
+            else:
+                # The user may have been at their cap
+                self._queue_changed.set()
+
+    def _push(self, entry: _QueuedTask):
+        self._queue.push(entry)
+        self._queue_changed.set()
+
+
+_engine: Optional[TaskExecutionEngine] = None
+
+
+def get_execution_engine() -> TaskExecutionEngine:
+    """Get the shared task execution engine."""
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        process_executor = None
+        if settings.execution_mode == "process":
+            process_executor = ShardedProcessExecutor(settings.worker_processes)
+        _engine = TaskExecutionEngine(
+            workers=settings.task_workers,
+            queue_size=settings.task_queue_size,
+            process_executor=process_executor,
+            preemption_after=settings.preemption_after_seconds,
+            user_weights=settings.user_weights,
+            user_caps=settings.user_task_caps,
+            default_user_cap=settings.user_task_cap
+        )
+    return _engine
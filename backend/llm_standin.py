@@ -0,0 +1,261 @@
+"""
+Local stand-in for the OpenAI and Anthropic APIs.
+
+Answers chat completions with canned text after a simulated model latency,
+so the LLM client's latency and throughput can be tested without network
+access or API keys. Point OPENAI_BASE_URL / ANTHROPIC_BASE_URL at it:
+
+    uvicorn llm_standin:app --port 8100
+    OPENAI_BASE_URL=http://localhost:8100/v1 ANTHROPIC_BASE_URL=http://localhost:8100/v1
+
+Latency is STANDIN_LATENCY_SECONDS plus the output tokens at
+STANDIN_TOKENS_PER_SECOND. Requests with "stream": true get server-sent
+events in each API's format, one word at a time.
+
+STANDIN_REQUESTS_PER_MINUTE and STANDIN_TOKENS_PER_MINUTE (0 for no limit)
+enforce rate limits per API, model and key the way the providers do: every
+response carries rate limit headers, and requests over the limit get a 429
+with Retry-After.
+"""
+
+from typing import Dict, Any, List, AsyncIterator, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_SECONDS = float(os.environ.get("STANDIN_LATENCY_SECONDS", "0.2"))
+TOKENS_PER_SECOND = float(os.environ.get("STANDIN_TOKENS_PER_SECOND", "500"))
+REQUESTS_PER_MINUTE = float(os.environ.get("STANDIN_REQUESTS_PER_MINUTE", "0"))
+TOKENS_PER_MINUTE = float(os.environ.get("STANDIN_TOKENS_PER_MINUTE", "0"))
+
+# (api, model, key) -> {"requests" | "tokens": [level, updated at]}
+_budgets: Dict[Tuple[str, str, str], Dict[str, List[float]]] = {}
+
+app = FastAPI(title="SwarmVille LLM stand-in")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI-compatible chat completion."""
+    body = await request.json()
+    answer = _answer(body["messages"], body.get("max_tokens"))
+    headers, throttled = _rate_limit("openai", request, body["model"], answer)
+    if throttled:
+        return throttled
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    if body.get("stream"):
+        return _event_stream(_stream_chat_completion(completion_id, body), headers, done=True)
+
+    text, input_tokens, output_tokens = await _complete(body["messages"], body.get("max_tokens"))
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+    }, headers=headers)
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    """Anthropic-compatible message."""
+    body = await request.json()
+    answer = _answer(_prompt(body), body.get("max_tokens"))
+    headers, throttled = _rate_limit("anthropic", request, body["model"], answer)
+    if throttled:
+        return throttled
+    message_id = f"msg_{uuid.uuid4().hex[:12]}"
+    if body.get("stream"):
+        return _event_stream(_stream_message(message_id, body), headers)
+
+    text, input_tokens, output_tokens = await _complete(_prompt(body), body.get("max_tokens"))
+    return JSONResponse({
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+    }, headers=headers)
+
+
+async def _stream_chat_completion(completion_id: str, body: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """OpenAI chunks of a streamed completion, with usage last if asked for."""
+    text, input_tokens, output_tokens = _answer(body["messages"], body.get("max_tokens"))
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body["model"]
+    }
+    async for word in _words(text, output_tokens):
+        yield {**chunk, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+    yield {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    if body.get("stream_options", {}).get("include_usage"):
+        yield {**chunk, "choices": [], "usage": {
+            "prompt_tokens": input_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }}
+
+
+async def _stream_message(message_id: str, body: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Anthropic events of a streamed message."""
+    text, input_tokens, output_tokens = _answer(_prompt(body), body.get("max_tokens"))
+    yield {"type": "message_start", "message": {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": body["model"],
+        "content": [],
+        "usage": {"input_tokens": input_tokens, "output_tokens": 0}
+    }}
+    yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    async for word in _words(text, output_tokens):
+        yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}}
+    yield {"type": "content_block_stop", "index": 0}
+    yield {
+        "type": "message_delta",
+        "delta": {"stop_reason": "end_turn"},
+        "usage": {"output_tokens": output_tokens}
+    }
+    yield {"type": "message_stop"}
+
+
+def _event_stream(
+    events: AsyncIterator[Dict[str, Any]],
+    headers: Dict[str, str],
+    done: bool = False
+) -> StreamingResponse:
+    """Server-sent events of the payloads; `done` ends them with OpenAI's [DONE]."""
+    async def lines():
+        async for event in events:
+            if "type" in event:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+        if done:
+            yield "data: [DONE]\n\n"
+    return StreamingResponse(lines(), media_type="text/event-stream", headers=headers)
+
+
+def _rate_limit(
+    api: str,
+    request: Request,
+    model: str,
+    answer: tuple
+) -> Tuple[Dict[str, str], Optional[JSONResponse]]:
+    """
+    Charge a request against its key's budgets.
+
+    Returns the rate limit headers, and a 429 response instead if the
+    request does not fit.
+    """
+    limits = {"requests": REQUESTS_PER_MINUTE, "tokens": TOKENS_PER_MINUTE}
+    cost = {"requests": 1.0, "tokens": float(answer[1] + answer[2])}
+    key = request.headers.get("authorization") or request.headers.get("x-api-key") or ""
+    budget = _budgets.setdefault((api, model, key), {
+        kind: [limit, time.monotonic()] for kind, limit in limits.items()
+    })
+
+    now = time.monotonic()
+    waits = {}
+    for kind, limit in limits.items():
+        if limit:
+            level = min(limit, budget[kind][0] + (now - budget[kind][1]) * limit / 60)
+            budget[kind] = [level, now]
+            waits[kind] = max(0.0, (min(cost[kind], limit) - level) / limit * 60)
+    retry_after = max(waits.values(), default=0.0)
+    if not retry_after:
+        for kind in waits:
+            budget[kind][0] -= cost[kind]
+
+    headers = {}
+    for kind, limit in limits.items():
+        if not limit:
+            continue
+        remaining = max(0, int(budget[kind][0]))
+        reset = (limit - budget[kind][0]) / limit * 60
+        if api == "openai":
+            headers[f"x-ratelimit-limit-{kind}"] = str(int(limit))
+            headers[f"x-ratelimit-remaining-{kind}"] = str(remaining)
+            headers[f"x-ratelimit-reset-{kind}"] = f"{reset:.3f}s"
+        else:
+            headers[f"anthropic-ratelimit-{kind}-limit"] = str(int(limit))
+            headers[f"anthropic-ratelimit-{kind}-remaining"] = str(remaining)
+            headers[f"anthropic-ratelimit-{kind}-reset"] = (
+                datetime.now(timezone.utc) + timedelta(seconds=reset)
+            ).isoformat().replace("+00:00", "Z")
+
+    if not retry_after:
+        return headers, None
+    return headers, JSONResponse(
+        {"error": {"type": "rate_limit_error", "message": f"Rate limit reached for {model}"}},
+        status_code=429,
+        headers={**headers, "retry-after": f"{retry_after:.3f}"}
+    )
+
+
+async def _words(text: str, output_tokens: int) -> AsyncIterator[str]:
+    """The text word by word, paced at the simulated latency and token rate."""
+    words = text.split(" ")
+    await asyncio.sleep(LATENCY_SECONDS)
+    for index, word in enumerate(words):
+        await asyncio.sleep(output_tokens / TOKENS_PER_SECOND / len(words))
+        yield word if index == 0 else f" {word}"
+
+
+async def _complete(messages: List[Dict[str, Any]], max_tokens: Any) -> tuple:
+    """Canned answer to the last message, after the simulated latency."""
+    text, input_tokens, output_tokens = _answer(messages, max_tokens)
+    await asyncio.sleep(LATENCY_SECONDS + output_tokens / TOKENS_PER_SECOND)
+    return text, input_tokens, output_tokens
+
+
+def _answer(messages: List[Dict[str, Any]], max_tokens: Any) -> tuple:
+    """Canned answer to the last message, with the prompt and answer token counts."""
+    prompt = " ".join(_text(message.get("content")) for message in messages)
+    last = _text(messages[-1].get("content")) if messages else ""
+    first_line = last.splitlines()[0] if last else "the request"
+    text = (
+        f"Plan for {first_line[:120]}: gather the relevant context with the "
+        "available tools, check the results for problems, and report back "
+        "with a short summary and anything that needs a human decision."
+    )
+    if max_tokens:
+        text = " ".join(text.split()[:int(max_tokens)])
+    return text, _tokens(prompt), _tokens(text)
+
+
+def _prompt(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Messages of an Anthropic request, with its system prompt first."""
+    prompt = [{"role": "system", "content": body["system"]}] if body.get("system") else []
+    return prompt + body["messages"]
+
+
+def _text(content: Any) -> str:
+    """Text of a message's content, given as a string or a list of blocks."""
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def _tokens(text: str) -> int:
+    """Rough token count: about four characters per token."""
+    return max(1, len(text) // 4)
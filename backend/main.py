@@ -9,8 +9,10 @@ import socketio
 from contextlib import asynccontextmanager
 
 from app.config import get_settings
-from app.routes import agents_router, workflows_router, tasks_router, approvals_router
-from app.services.orchestrator import get_agent_states
+from app.routes import agents_router, workflows_router, tasks_router, approvals_router, metrics_router
+from app.services.orchestrator import get_agent_states, set_event_emitter
+from app.services.task_queue import get_execution_engine
+from app.services.llm_client import get_llm_client
 
 settings = get_settings()
 
@@ -26,9 +28,14 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
     print(f"Starting {settings.app_name}")
+    set_event_emitter(sio.emit)
+    engine = get_execution_engine()
+    await engine.start()
     yield
     # Shutdown
     print("Shutting down...")
+    await engine.stop()
+    await get_llm_client().aclose()
 
 
 # Create FastAPI app
@@ -53,6 +60,7 @@ app.include_router(agents_router)
 app.include_router(workflows_router)
 app.include_router(tasks_router)
 app.include_router(approvals_router)
+app.include_router(metrics_router)
 
 
 # Socket.IO event handlers
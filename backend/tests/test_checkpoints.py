@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime
+
+from app.models.task import Task, TaskStatus, SubtaskStatus
+from app.services import orchestrator
+from app.services.checkpoints import CheckpointStore, set_checkpoint_store
+
+
+def _plan():
+    definitions = [
+        {"id": "sub_code", "agent_id": "agent_coder", "description": "Write it", "order": 1},
+        {"id": "sub_review", "agent_id": "agent_reviewer", "description": "Review it", "order": 2},
+    ]
+    graph = {
+        "sub_code": [],
+        "sub_review": [{"subtask_id": "sub_code", "handoff_config": {}}],
+    }
+    return definitions, graph
+
+
+def _result(summary):
+    return {"success": True, "summary": summary, "output": summary, "cost": 0.0}
+
+
+def test_reassign_keeps_completed_subtasks(monkeypatch, tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    set_checkpoint_store(store)
+    definitions, graph = _plan()
+    store.save_plan("task_1", definitions, graph)
+    store.save_subtask("task_1", "sub_code", {
+        "result": _result("Code written"),
+        "handoff_context": {},
+        "cost_incurred": 0.5,
+    })
+
+    orchestrator.reassign_subtask("task_1", "sub_review", "agent_coder")
+
+    assert set(store.load_subtasks("task_1")) == {"sub_code"}
+    plan = store.load_plan("task_1")
+    assert [sd["agent_id"] for sd in plan["subtasks"]] == ["agent_coder", "agent_coder"]
+    # Survives a restart too
+    assert set(CheckpointStore(str(tmp_path)).load_subtasks("task_1")) == {"sub_code"}
+
+    # Resuming runs only the subtask that had not completed, on its new agent
+    ran = []
+
+    async def run_subtask(task_id, tasks_db, manager, available_agents, subtask_def, upstream):
+        ran.append((subtask_def["id"], subtask_def["agent_id"]))
+        return _result("Reviewed")
+
+    monkeypatch.setattr(orchestrator, "_run_subtask", run_subtask)
+    tasks_db = {"task_1": Task(
+        id="task_1",
+        user_id="user_1",
+        workflow_id="workflow_1",
+        description="Build a feature",
+        status=TaskStatus.PAUSED,
+        created_at=datetime.utcnow(),
+    )}
+    asyncio.run(orchestrator.execute_task("task_1", tasks_db))
+
+    assert ran == [("sub_review", "agent_coder")]
+    task = tasks_db["task_1"]
+    assert task.status == TaskStatus.COMPLETED
+    assert next(s for s in task.subtasks if s.id == "sub_code").status == SubtaskStatus.COMPLETED
+
+
+def test_reads_do_not_create_checkpoints(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+
+    assert store.load_plan("task_unknown") is None
+    assert store.load_subtasks("task_unknown") == {}
+    assert store.export("task_unknown") == {}
+    store.assign_agent("task_unknown", "sub_code", "agent_coder")
+
+    assert store._checkpoints == {}
+    assert list(tmp_path.iterdir()) == []
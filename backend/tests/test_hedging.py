@@ -0,0 +1,25 @@
+import asyncio
+
+from app.services.hedging import Hedger
+
+
+def test_cancelled_attempts_stay_out_of_the_latency_window():
+    hedger = Hedger(min_samples=1)
+    delays = [0.01, 0.5, 0.01]
+
+    async def make_call():
+        await asyncio.sleep(delays.pop(0))
+        return "done"
+
+    async def run():
+        await hedger.call("github.list_prs", make_call)
+        # Slow enough to be hedged; the hedge wins and the first attempt is cancelled
+        result = await hedger.call("github.list_prs", make_call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "done"
+    stats = hedger._stats["github.list_prs"]
+    assert stats.hedged == 1 and stats.hedge_wins == 1
+    assert len(stats.latencies) == 2
+    assert max(stats.latencies) < 0.25
@@ -0,0 +1,13 @@
+from app.services.intent_matcher import TASK_TYPES, TOOL_INTENTS
+
+
+def test_inflected_words_match():
+    assert TASK_TYPES.first_match("Fixed the login bug") == "bug_fix"
+    assert TASK_TYPES.first_match("Fixing the login bugs") == "bug_fix"
+    assert TASK_TYPES.first_match("Reviewed the PR") == "pr_review"
+    assert TASK_TYPES.first_match("Merging pull requests") is None
+    assert TOOL_INTENTS.match("Merging pull requests") == ["github"]
+
+
+def test_keywords_match_whole_words_only():
+    assert TASK_TYPES.first_match("Improve the prefix handling", "general") == "general"
@@ -0,0 +1,45 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+import llm_standin
+from app.services.llm_client import LLMClient
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    """The LLM stand-in served on a free local port, answering right away."""
+    monkeypatch.setattr(llm_standin, "LATENCY_SECONDS", 0.0)
+    monkeypatch.setattr(llm_standin, "TOKENS_PER_SECOND", 100000.0)
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(llm_standin.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+    server.should_exit = True
+    thread.join(5)
+
+
+def test_streamed_calls_reuse_the_connection(standin):
+    async def run():
+        client = LLMClient({"openai": standin, "anthropic": standin}, api_keys={"openai": "key"})
+        try:
+            for model in ("gpt-4", "gpt-4", "claude-3-haiku", "claude-3-haiku"):
+                chunks = [
+                    chunk async for chunk in client.stream(
+                        model, [{"role": "user", "content": "Hello"}], temperature=0.5
+                    )
+                ]
+                assert chunks[-1]["response"]["text"]
+            return {pool["provider"]: pool["connections_opened"] for pool in client.stats()["pools"]}
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {"openai": 1, "anthropic": 1}
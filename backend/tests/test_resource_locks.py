@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+from app.models.task import Task, TaskStatus, Subtask
+from app.services import orchestrator
+from app.services.resource_locks import LockMode, ResourceLockManager, set_lock_manager
+
+
+class _EscalatingManager:
+    async def handle_error(self, error, subtask, available_agents):
+        return {"action": "escalate", "message": error["message"]}
+
+
+def test_locks_are_released_while_escalated(monkeypatch):
+    locks = ResourceLockManager()
+    set_lock_manager(locks)
+    agent = {"id": "agent_coder", "name": "Coder"}
+    subtask_def = {
+        "id": "sub_deploy",
+        "agent_id": "agent_coder",
+        "description": "Deploy it",
+        "resources": {"prod": LockMode.WRITE},
+    }
+    tasks_db = {"task_1": Task(
+        id="task_1",
+        user_id="user_1",
+        workflow_id="workflow_1",
+        description="Ship a feature",
+        status=TaskStatus.RUNNING,
+        created_at=datetime.utcnow(),
+        subtasks=[Subtask(id="sub_deploy", task_id="task_1", agent_id="agent_coder", description="Deploy it")],
+    )}
+
+    held = []
+
+    async def attempt_subtask(task_id, tasks_db, manager, subtask_def, agent_data, upstream, transferred):
+        held.append(("attempt", locks.held_by("sub_deploy")))
+        return orchestrator._skipped_result("Deploy failed", "tool_failure"), None
+
+    async def wait_for_approval(task_id, tasks_db, subtask_def, agent_data, action=None, reason=None):
+        held.append(("escalation", locks.held_by("sub_deploy")))
+        return True
+
+    monkeypatch.setattr(orchestrator, "_attempt_subtask", attempt_subtask)
+    monkeypatch.setattr(orchestrator, "_wait_for_approval", wait_for_approval)
+    result, _, _ = asyncio.run(orchestrator._execute_with_recovery(
+        "task_1", tasks_db, _EscalatingManager(), [agent], subtask_def, agent, []
+    ))
+
+    assert not result["success"]
+    assert held == [
+        ("attempt", {"workflow_1:prod": LockMode.WRITE}),
+        ("escalation", {}),
+        ("attempt", {"workflow_1:prod": LockMode.WRITE}),
+    ]
+    assert locks.held_by("sub_deploy") == {}
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app.models.workflow import Workflow, WorkflowNode, WorkflowEdge
+from app.routes.tasks import tasks_db
+from app.routes.workflows import workflows_db
+from app.services import orchestrator
+from app.services.checkpoints import CheckpointStore, set_checkpoint_store
+
+
+def test_batch_is_rolled_back_when_planning_fails(monkeypatch, tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    set_checkpoint_store(store)
+    now = datetime.utcnow()
+    # Coder and reviewer hand off to each other: no order to run them in
+    monkeypatch.setitem(workflows_db, "workflow_loop", Workflow(
+        id="workflow_loop",
+        user_id="demo_user",
+        name="Loop",
+        nodes=[
+            WorkflowNode(id="node_code", agent_id="agent_coder"),
+            WorkflowNode(id="node_review", agent_id="agent_reviewer"),
+        ],
+        edges=[
+            WorkflowEdge(id="edge_1", source_node_id="node_code", target_node_id="node_review"),
+            WorkflowEdge(id="edge_2", source_node_id="node_review", target_node_id="node_code"),
+        ],
+        created_at=now,
+        updated_at=now,
+    ))
+    tasks_before = dict(tasks_db)
+
+    response = TestClient(app).post("/tasks/batch", json={
+        "workflow_id": "workflow_loop",
+        "descriptions": ["Fix the login bug", "Fix the signup bug"],
+    })
+
+    assert response.status_code == 400
+    assert "cycle" in response.json()["detail"]
+    assert tasks_db == tasks_before
+    assert store._checkpoints == {}
+    assert orchestrator.agent_load._queued == {}
@@ -1,6 +1,6 @@
 import { io, Socket } from 'socket.io-client';
 import { useSwarmVilleStore } from './store';
-import type { AgentState, ApprovalRequest } from '@/types';
+import type { AgentOutput, AgentState, ApprovalRequest } from '@/types';
 
 const SOCKET_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
@@ -8,6 +8,8 @@ class SocketClient {
   private socket: Socket | null = null;
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
+  // Recent streamed text per subtask, shown in the agent's speech bubble
+  private streamedText: Record<string, string> = {};
 
   connect() {
     if (this.socket?.connected) {
@@ -63,6 +65,26 @@ class SocketClient {
       });
     });
 
+    // Streamed agent output
+    this.socket.on('agent_output', (data: AgentOutput) => {
+      const text = (this.streamedText[data.subtask_id] ?? '') + (data.reasoning || data.output);
+      if (data.done) {
+        delete this.streamedText[data.subtask_id];
+      } else {
+        this.streamedText[data.subtask_id] = text.slice(-200);
+      }
+
+      const store = useSwarmVilleStore.getState();
+      const currentState = store.agentStates[data.agent_id];
+      const lastLine = text.trim().split('\n').pop();
+      if (currentState && lastLine) {
+        store.setAgentState(data.agent_id, {
+          ...currentState,
+          speech_bubble: { text: lastLine.length > 60 ? `...${lastLine.slice(-60)}` : lastLine },
+        });
+      }
+    });
+
     // Approval requests
     this.socket.on('approval_request', (approval: ApprovalRequest) => {
       const store = useSwarmVilleStore.getState();
@@ -26,6 +26,7 @@ export interface Agent {
   cost_per_token: number;
   is_manager: boolean;
   avatar_style: AvatarStyle;
+  weight?: number | null;
   created_at: string;
 }
 
@@ -74,15 +75,24 @@ export interface Task {
   workflow_id: string;
   description: string;
   status: TaskStatus;
+  priority?: TaskPriority;
   current_agent_id?: string;
   progress: number;
   total_cost: number;
+  llm_calls?: number;
+  llm_cache_hits?: number;
+  saved_cost?: number;
+  retries?: number;
   created_at: string;
   completed_at?: string;
+  deadline?: string;
+  error?: string;
   subtasks: Subtask[];
 }
 
-export type TaskStatus = 'pending' | 'running' | 'paused' | 'completed' | 'failed';
+export type TaskStatus = 'pending' | 'running' | 'paused' | 'completed' | 'failed' | 'cancelled';
+
+export type TaskPriority = 'high' | 'normal' | 'low';
 
 export interface Subtask {
   id: string;
@@ -92,6 +102,9 @@ export interface Subtask {
   status: SubtaskStatus;
   output?: string;
   cost_incurred: number;
+  attempts?: number;
+  depends_on?: string[];
+  parent_id?: string;
   started_at?: string;
   completed_at?: string;
 }
@@ -146,11 +159,28 @@ export interface AgentState {
     text: string;
     target_agent_id?: string;
   };
+  load?: AgentLoad;
   last_updated: string;
 }
 
+export interface AgentLoad {
+  in_flight: number;
+  queue_depth: number;
+  latency_seconds: number | null;
+}
+
 export type AgentVisualStatus = 'idle' | 'working' | 'waiting_approval' | 'communicating' | 'error';
 
+// Output an agent streams while working on a subtask, new text since the last event
+export interface AgentOutput {
+  task_id: string;
+  subtask_id: string;
+  agent_id: string;
+  output: string;
+  reasoning: string;
+  done: boolean;
+}
+
 // Handoff protocol
 export interface Handoff {
   from_agent_id: string;
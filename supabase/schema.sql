@@ -36,6 +36,7 @@ CREATE TABLE IF NOT EXISTS public.agents (
     cost_per_token DECIMAL(10, 6) DEFAULT 0.03,
     is_manager BOOLEAN DEFAULT FALSE,
     avatar_style JSONB DEFAULT '{"hair_color": "#2C1810", "clothing_color": "#4169E1", "skin_tone": "#FFDAB9"}',
+    weight DECIMAL(10, 4) CHECK (weight > 0),
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );